@@ -6,7 +6,7 @@ from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 
-from products.models import Product, Deal
+from products.models import Product, Deal, deal_applied, stock_changed
 from orders.models import Order
 from .models import Notification, User
 
@@ -57,10 +57,20 @@ def create_new_product_notification(sender, instance, created, **kwargs):
             print(f"✅ Created {len(notifications)} notifications for new product: {instance.name}")
 
 
+@receiver(pre_save, sender=Deal)
+def track_deal_status_change(sender, instance, **kwargs):
+    """Track the old deal status before saving"""
+    if instance.pk:
+        instance._old_status = Deal.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    else:
+        instance._old_status = None
+
+
 @receiver(post_save, sender=Deal)
 def create_new_deal_notification(sender, instance, created, **kwargs):
-    """Create notification when a new deal is created or activated"""
-    if (created or instance.status == 'active') and instance.is_active():
+    """Create notification once, when a deal goes live"""
+    went_live = instance.status == 'active' and getattr(instance, '_old_status', None) != 'active'
+    if went_live and instance.is_active():
         # Create notification for all active users
         users = User.objects.filter(is_active=True, is_staff=False)
         
@@ -164,10 +174,26 @@ def notify_admin_new_user(sender, instance, created, **kwargs):
             print(f"✅ Notified {len(notifications)} admins about new user: {instance.email}")
 
 
+# Stock level at or below which admins are alerted
+LOW_STOCK_LEVEL = 10
+
+
 @receiver(post_save, sender=Product)
 def notify_admin_low_stock(sender, instance, **kwargs):
     """Notify admin when product stock is low (10 or less)"""
-    if instance.stock <= 10 and instance.stock > 0 and instance.is_active:
+    _notify_low_stock(instance)
+
+
+@receiver(stock_changed)
+def notify_admin_low_stock_sold(sender, product_ids, **kwargs):
+    """Same alert for stock taken or returned by orders with bulk UPDATEs"""
+    low = Product.objects.filter(pk__in=product_ids, stock__lte=LOW_STOCK_LEVEL)
+    for product in low:
+        _notify_low_stock(product)
+
+
+def _notify_low_stock(instance):
+    if instance.stock <= LOW_STOCK_LEVEL and instance.stock > 0 and instance.is_active:
         # Check if we already sent a low stock notification recently (within 24 hours)
         recent_notification = Notification.objects.filter(
             notification_type='system',
@@ -197,6 +223,29 @@ def notify_admin_low_stock(sender, instance, **kwargs):
                 print(f"⚠️ Notified {len(notifications)} admins about low stock: {instance.name} ({instance.stock} left)")
 
 
+@receiver(deal_applied)
+def notify_admin_deal_applied(sender, deal, product_ids, **kwargs):
+    """Notify admins once when a deal's discount is written into product prices"""
+    admin_users = User.objects.filter(is_staff=True, is_active=True)
+    
+    notifications = []
+    for admin in admin_users:
+        notifications.append(
+            Notification(
+                user=admin,
+                notification_type='system',
+                title=f'Deal Applied: {deal.title}',
+                message=f'{deal.get_discount_display()} applied to {len(product_ids)} product(s)',
+                link='/dashboard/deals/',
+                deal_id=deal.id
+            )
+        )
+    
+    if notifications:
+        Notification.objects.bulk_create(notifications)
+        print(f"✅ Notified {len(notifications)} admins: Deal {deal.title} applied to {len(product_ids)} products")
+
+
 @receiver(post_save, sender=Order)
 def notify_admin_new_order(sender, instance, created, **kwargs):
     """Notify admins when a new order is placed"""
@@ -1,4 +1,54 @@
 # Tests for accounts app
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from orders.models import Cart, CartItem
+from products.models import Category, Product
+
+from .models import Notification, User
+
+
+class SessionSummaryTests(TestCase):
+    """Personal header data for the shared catalog pages"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Headsets')
+        cls.headset = Product.objects.create(category=category, name='Gaming Headset', description='7.1', price=1800)
+        cls.user = User.objects.create_user('ana@example.com', 'secret', first_name='Ana', last_name='Santos')
+
+    def setUp(self):
+        cache.clear()
+
+    def summary(self):
+        response = self.client.get(reverse('session_summary'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        return response.json()
+
+    def test_anonymous_visitor(self):
+        data = self.summary()
+        self.assertFalse(data['authenticated'])
+        self.assertTrue(data['csrf_token'])
+        self.assertNotIn('cart_count', data)
+
+    def test_logged_in_user(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.headset, quantity=2)
+        Notification.objects.create(user=self.user, notification_type='system', title='Welcome', message='Hi Ana')
+        Notification.objects.create(
+            user=self.user, notification_type='system', title='Read', message='Seen', is_read=True
+        )
+        self.client.force_login(self.user)
+
+        data = self.summary()
+        self.assertTrue(data['authenticated'])
+        self.assertEqual(data['display_name'], 'Ana Santos')
+        self.assertFalse(data['is_staff'])
+        self.assertEqual((data['cart_count'], data['unread_notifications']), (1, 1))
+
+    def test_catalog_pages_leave_out_personal_data(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('products:list'))
+        self.assertNotContains(response, 'Ana Santos')
+        self.assertNotContains(response, 'ana@example.com')
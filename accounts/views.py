@@ -3,6 +3,8 @@ from django.contrib.auth import login, authenticate, logout, update_session_auth
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 from .forms import SignUpForm, LoginForm, UserProfileForm
 from .models import UserAddress
@@ -517,23 +519,31 @@ def submit_product_ratings(request):
             })
         
         # Get ratings from POST data
-        ratings_submitted = 0
-        for item in order.items.all():
-            rating_key = f'rating_{item.product.id}'
-            comment_key = f'comment_{item.product.id}'
+        reviews = {}
+        for product_id in order.items.values_list('product_id', flat=True):
+            rating_key = f'rating_{product_id}'
+            comment_key = f'comment_{product_id}'
             
             rating = request.POST.get(rating_key)
             comment = request.POST.get(comment_key, '')
             
-            if rating:
-                ProductReview.objects.create(
-                    product=item.product,
+            if rating and product_id not in reviews:
+                if int(rating) not in range(1, 6):
+                    return JsonResponse({
+                        'success': False,
+                        'message': 'Ratings must be between 1 and 5 stars.'
+                    })
+                reviews[product_id] = ProductReview(
+                    product_id=product_id,
                     user=request.user,
                     order=order,
                     rating=int(rating),
                     comment=comment
                 )
-                ratings_submitted += 1
+        
+        # One insert plus one aggregate update per product
+        ProductReview.objects.bulk_submit(list(reviews.values()))
+        ratings_submitted = len(reviews)
         
         if ratings_submitted > 0:
             return JsonResponse({
@@ -682,3 +692,28 @@ def mark_all_notifications_read(request):
         'success': True,
         'unread_count': 0
     })
+
+
+@never_cache
+def session_summary(request):
+    """Per-visitor header data for otherwise shared, cacheable pages
+    
+    Catalog pages are rendered the same for everyone; the header fills in
+    the cart badge, notification bell and account menu from this endpoint.
+    It also hands out the CSRF token the page scripts use for POSTs.
+    """
+    from .models import Notification
+    from orders.cart_summary import cart_summary
+    
+    data = {
+        'authenticated': request.user.is_authenticated,
+        'csrf_token': get_token(request),
+    }
+    if request.user.is_authenticated:
+        data.update({
+            'display_name': request.user.get_full_name() or request.user.username,
+            'is_staff': request.user.is_staff,
+            'cart_count': cart_summary(request.user.pk)['count'],
+            'unread_notifications': Notification.objects.filter(user=request.user, is_read=False).count(),
+        })
+    return JsonResponse(data)
@@ -25,18 +25,13 @@ def get_categories_from_db():
 def search_products_from_db(query):
     """Search for products in database based on query"""
     try:
-        from products.models import Product, Category
-        from django.db.models import Q
+        from products.models import Product
+        from products.search import search_products
         
-        query_lower = query.lower().strip()
-        
-        # Search in product name, description, category
-        products = Product.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query),
-            is_active=True
-        ).select_related('category')[:10]  # Limit to 10 results
+        # Search in product name, description, category (best matches first)
+        products = search_products(
+            Product.objects.filter(is_active=True), query
+        ).select_related('category').order_by('search_rank')[:10]  # Limit to 10 results
         
         if not products:
             return f"Sorry, we couldn't find any products matching '{query}'. 😔\n\n**Try:**\n• Check spelling\n• Use general terms (e.g., 'GPU' instead of specific model)\n• Ask about categories: \"What products do you sell?\"\n\n📞 **Need help?** Contact us:\n• Email: support@pcbulacan.com\n• Phone: (044) 123-4567"
@@ -48,8 +43,8 @@ def search_products_from_db(query):
             price_text = f"₱{product.price:,.2f}"
             
             # Check if on sale
-            if product.sale_price and product.sale_price < product.price:
-                price_text = f"~~₱{product.price:,.2f}~~ **₱{product.sale_price:,.2f}** 🔥"
+            if product.has_active_deal:
+                price_text = f"~~₱{product.price:,.2f}~~ **₱{product.final_price:,.2f}** 🔥"
             
             result += f"**{product.name}**\n"
             result += f"💰 Price: {price_text}\n"
@@ -142,24 +137,24 @@ def get_shipping_fees_from_db(city_query=None):
         city_query: Optional city name to search for specific location
     """
     try:
-        from orders.models import DeliveryFee
-        fees = DeliveryFee.objects.filter(is_available=True).order_by('state', 'city')
+        from orders.delivery import delivery_fee_index
+        fees = delivery_fee_index.all()
         
-        # If specific city requested, try to find it
+        # If specific city requested, try to find it (aliases like "QC" work too)
         if city_query:
             city_query = city_query.lower().strip()
-            for fee in fees:
-                if city_query in fee.city.lower():
-                    free_text = f"FREE pag ₱{fee.min_order_free_delivery:,.0f}+" if fee.min_order_free_delivery > 0 else ""
-                    days_text = fee.estimated_days
-                    
-                    result = f"📍 **Shipping to {fee.city}, {fee.state}:**\n\n"
-                    result += f"💰 **Delivery Fee:** ₱{fee.fee_amount:,.0f}\n"
-                    if free_text:
-                        result += f"🎁 **Free Shipping:** {free_text}\n"
-                    result += f"⏱️ **Delivery Time:** {days_text}\n\n"
-                    result += "✨ Fee calculated automatically at checkout!"
-                    return result
+            fee = delivery_fee_index.find(city_query)
+            if fee:
+                free_text = f"FREE pag ₱{fee.min_order_free_delivery:,.0f}+" if fee.min_order_free_delivery > 0 else ""
+                days_text = fee.estimated_days
+                
+                result = f"📍 **Shipping to {fee.city}, {fee.state}:**\n\n"
+                result += f"💰 **Delivery Fee:** ₱{fee.fee_amount:,.0f}\n"
+                if free_text:
+                    result += f"🎁 **Free Shipping:** {free_text}\n"
+                result += f"⏱️ **Delivery Time:** {days_text}\n\n"
+                result += "✨ Fee calculated automatically at checkout!"
+                return result
             
             # City not found
             return f"Sorry, we couldn't find shipping info for '{city_query}'. 😔\n\nPlease check available locations or contact us:\n📧 support@pcbulacan.com\n📞 (044) 123-4567\n\nOr ask: 'What areas do you deliver to?'"
@@ -1089,20 +1084,11 @@ def get_ai_response(user_message):
     
     # Shipping fee questions - HIGHEST PRIORITY (check before greetings)
     if any(phrase in user_message_lower for phrase in ['shipping fee', 'delivery fee', 'magkano shipping', 'bayad sa delivery', 'delivery cost', 'how much shipping', 'shipping to', 'deliver to', 'delivery sa', 'shipping sa']):
-        # Try to extract city name from question
-        city_query = None
-        
-        # Common city names to look for
-        cities = ['pandi', 'pulilan', 'malolos', 'meycauayan', 'baliuag', 'bocaue', 
-                  'san jose del monte', 'sjdm', 'caloocan', 'manila', 'quezon city', 
-                  'qc', 'valenzuela', 'bustos', 'plaridel', 'marilao', 'guiguinto']
-        
-        for city in cities:
-            if city in user_message_lower:
-                city_query = city
-                break
+        # Try to extract the city (or an alias like "SJDM") from the question
+        from orders.delivery import delivery_fee_index
+        location = delivery_fee_index.find(user_message_lower)
         
-        return get_shipping_fees_from_db(city_query)
+        return get_shipping_fees_from_db(f'{location.city}, {location.state}' if location else None)
     
     # Thank you responses
     if any(word in user_message_lower for word in ['thank you', 'thanks', 'salamat', 'thank u', 'ty', 'tysm']):
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+import products.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('products', '0007_responsive_image_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='slideshowimage',
+            name='image',
+            field=products.fields.ResponsiveImageField(upload_to='slideshow/'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 
+from products.fields import ResponsiveImageField
+
 # Create your models here.
 
 class SlideshowImage(models.Model):
@@ -11,7 +13,7 @@ class SlideshowImage(models.Model):
     ]
     
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='slideshow/')
+    image = ResponsiveImageField(upload_to='slideshow/')
     slide_type = models.CharField(max_length=10, choices=SLIDE_TYPE_CHOICES, default='main')
     order = models.PositiveIntegerField(default=0, help_text="Display order (lower numbers first)")
     link = models.CharField(max_length=500, blank=True, help_text="Optional link URL")
@@ -505,6 +505,18 @@ def print_inventory_report(request):
     return render(request, 'dashboard/inventory_report.html', context)
 
 
+@staff_member_required
+def export_catalog_csv(request):
+    """Stream the full product catalog as CSV (same columns as catalog_import)"""
+    from django.http import StreamingHttpResponse
+    from products.catalog_io import export_catalog
+    
+    response = StreamingHttpResponse(export_catalog('csv'), content_type='text/csv; charset=utf-8')
+    filename = f"catalog_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @staff_member_required
 def export_inventory_pdf(request):
     """Export inventory report as PDF using ReportLab"""
@@ -865,17 +877,16 @@ def update_order_status(request, order_number):
                 deals_str = ', '.join(deal_names)
                 messages.info(request, f'Deal usage updated for: {deals_str}')
         
-        # If status is being changed to shipped, decrease product stock, mark shipped, then send email with PDF receipt
+        # If status is being changed to shipped, commit the reserved stock, mark shipped, then send email with PDF receipt
         if old_status != 'shipped' and new_status == 'shipped':
-            # Decrease stock
-            for item in order.items.all():
-                product = item.product
-                if product.stock >= item.quantity:
-                    product.stock -= item.quantity
-                    product.save()
-                else:
-                    messages.warning(request, f'Not enough stock for {product.name}. Only {product.stock} left.')
-                    return redirect('dashboard:manage_orders')
+            from orders.stock import InsufficientStock, commit_reservations
+
+            # Stock was reserved at checkout; older orders take it now
+            try:
+                commit_reservations(order)
+            except InsufficientStock as e:
+                messages.warning(request, str(e))
+                return redirect('dashboard:manage_orders')
 
             # Mark order as shipped first so PDF reflects new status
             order.status = new_status
@@ -1274,9 +1285,10 @@ def add_delivery_fee(request):
             min_order = request.POST.get('min_order', 0)
             estimated_days = request.POST.get('estimated_days')
             is_available = request.POST.get('status') == 'Active'
+            aliases = request.POST.get('aliases', '')
             
-            # Check if already exists
-            if DeliveryFee.objects.filter(city=city, state=state).exists():
+            # Check if already exists (ignoring case, accents and punctuation)
+            if DeliveryFee.objects.filter(lookup_key=DeliveryFee.make_lookup_key(city, state)).exists():
                 return JsonResponse({
                     'success': False,
                     'message': 'A delivery fee for this city and state already exists.'
@@ -1288,7 +1300,8 @@ def add_delivery_fee(request):
                 fee_amount=fee_amount,
                 min_order_free_delivery=min_order,
                 estimated_days=estimated_days,
-                is_available=is_available
+                is_available=is_available,
+                aliases=aliases
             )
             
             return JsonResponse({
@@ -1317,6 +1330,7 @@ def edit_delivery_fee(request, fee_id):
             delivery_fee.min_order_free_delivery = request.POST.get('min_order', 0)
             delivery_fee.estimated_days = request.POST.get('estimated_days')
             delivery_fee.is_available = request.POST.get('status') == 'Active'
+            delivery_fee.aliases = request.POST.get('aliases', '')
             delivery_fee.save()
             
             return JsonResponse({
@@ -1337,6 +1351,7 @@ def edit_delivery_fee(request, fee_id):
         'fee_amount': str(delivery_fee.fee_amount),
         'min_order': str(delivery_fee.min_order_free_delivery),
         'estimated_days': delivery_fee.estimated_days,
+        'aliases': delivery_fee.aliases,
         'status': 'Active' if delivery_fee.is_available else 'Inactive'
     })
 
@@ -1995,27 +2010,10 @@ def manage_slideshow(request):
 def manage_deals(request):
     """Manage deals and promotions"""
     from products.models import Deal, Product
-    from django.utils import timezone
     
+    # Statuses are kept current by the run_deal_scheduler command
     deals = Deal.objects.all().order_by('-created_at')
     
-    # Update deal statuses based on dates
-    now = timezone.now()
-    for deal in deals:
-        # Only auto-update if deal is scheduled and should start
-        if deal.status == 'scheduled' and deal.start_date <= now:
-            # Check if it's not expired yet
-            if deal.end_date >= now:
-                deal.status = 'active'
-                deal.save()
-            else:
-                deal.status = 'expired'
-                deal.save()
-        # Mark active deals as expired only if end date has fully passed
-        elif deal.status == 'active' and deal.end_date < now:
-            deal.status = 'expired'
-            deal.save()
-    
     # Filter by status
     status_filter = request.GET.get('status')
     if status_filter:
@@ -2216,10 +2214,11 @@ def toggle_deal_status(request, deal_id):
     if request.method == 'POST':
         deal = get_object_or_404(Deal, id=deal_id)
         
-        if deal.status == 'active':
+        if deal.status in Deal.LIVE_STATUSES:
             deal.status = 'draft'
             status_text = 'deactivated'
         elif deal.status == 'draft':
+            # Deal.save() turns this into 'scheduled' when the deal starts later
             deal.status = 'active'
             status_text = 'activated'
         else:
@@ -2235,15 +2234,32 @@ def toggle_deal_status(request, deal_id):
 
 @staff_member_required
 def apply_deal(request, deal_id):
-    """Apply deal discounts to products"""
+    """Apply deal discounts to products (GET returns a dry-run preview)"""
     from products.models import Deal
     
+    if request.method == 'GET':
+        deal = get_object_or_404(Deal, id=deal_id)
+        preview = deal.apply_to_products(dry_run=True)
+        return JsonResponse({
+            'success': True,
+            'deal': deal.title,
+            'products': [
+                {
+                    'id': product.id,
+                    'name': product.name,
+                    'price': str(product.price),
+                    'new_price': f'{product.new_price:.2f}',
+                }
+                for product in preview
+            ],
+        })
+    
     if request.method == 'POST':
         deal = get_object_or_404(Deal, id=deal_id)
         
         try:
-            deal.apply_to_products()
-            messages.success(request, f'Deal "{deal.title}" applied to {deal.products.count()} products successfully!')
+            updated = deal.apply_to_products()
+            messages.success(request, f'Deal "{deal.title}" applied to {updated} products successfully!')
         except Exception as e:
             messages.error(request, f'Error applying deal: {str(e)}')
     
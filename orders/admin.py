@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, Cart, CartItem
+from .models import Order, OrderItem, StockReservation, Cart, CartItem
 
 
 class OrderItemInline(admin.TabularInline):
@@ -8,13 +8,20 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ('product', 'quantity', 'price')
 
 
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'quantity', 'status', 'created_at', 'updated_at')
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'user', 'full_name', 'status', 'total', 'created_at')
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('order_number', 'user__email', 'full_name', 'email')
     readonly_fields = ('order_number', 'created_at', 'updated_at')
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, StockReservationInline]
     list_editable = ('status',)
 
 
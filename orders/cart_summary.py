@@ -0,0 +1,56 @@
+"""
+Cached per-user cart summary.
+
+The cart badge and any template that needs the item count or subtotal read
+this summary instead of loading the cart. It is cached under the user's cart
+version, bumped by orders.signals whenever one of their cart items is saved
+or deleted, and under the catalog version, so a price or deal change
+refreshes the subtotal.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+
+from products.cache import bump_version, get_catalog_version, get_version
+from products.pricing import deal_prices
+
+from .pricing import CENT
+
+
+CART_SUMMARY_TIMEOUT = 60 * 60 * 24
+
+EMPTY_SUMMARY = {'count': 0, 'quantity': 0, 'subtotal': Decimal('0.00'), 'version': 0}
+
+
+def _version_key(user_id):
+    return f'orders:cart_version:{user_id}'
+
+
+def bump_cart_version(user_id):
+    """Expire a user's cached cart summary"""
+    bump_version(_version_key(user_id))
+
+
+def cart_summary(user_id):
+    """{'count', 'quantity', 'subtotal', 'version'} for a user's cart.
+
+    count is the number of distinct products (the header badge), quantity
+    the number of units. Costs one query on a cache miss and none otherwise.
+    """
+    from .models import CartItem
+
+    version = get_version(_version_key(user_id))
+    key = f'orders:cart_summary:{user_id}:{version}:{get_catalog_version()}'
+    summary = cache.get(key)
+    if summary is None:
+        items = CartItem.objects.filter(cart__user_id=user_id).values_list('product_id', 'product__price', 'quantity')
+        count, quantity, subtotal = 0, 0, Decimal('0.00')
+        for product_id, price, item_quantity in items:
+            entry = deal_prices.get(product_id)
+            count += 1
+            quantity += item_quantity
+            unit_price = entry.final_price.quantize(CENT, rounding=ROUND_HALF_UP) if entry else price
+            subtotal += unit_price * item_quantity
+        summary = {'count': count, 'quantity': quantity, 'subtotal': subtotal, 'version': version}
+        cache.set(key, summary, timeout=CART_SUMMARY_TIMEOUT)
+    return summary
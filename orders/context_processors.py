@@ -1,15 +1,25 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart_summary import EMPTY_SUMMARY, cart_summary
 from .models import Cart
 
 
 def cart_context(request):
-    """Add cart to all templates"""
+    """Add the cart summary to all templates.
+    
+    Reads the cached summary, so rendering a page costs no cart queries;
+    the Cart itself is only loaded if a template actually uses it.
+    """
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        user = request.user
+        summary = cart_summary(user.pk)
         return {
-            'cart': cart,
-            'cart_count': cart.unique_items_count  # Count unique products, not total quantity
+            'cart': SimpleLazyObject(lambda: Cart.objects.get_or_create(user=user)[0]),
+            'cart_count': summary['count'],  # Count unique products, not total quantity
+            'cart_summary': summary,
         }
     return {
         'cart': None,
-        'cart_count': 0
+        'cart_count': 0,
+        'cart_summary': EMPTY_SUMMARY,
     }
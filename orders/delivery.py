@@ -0,0 +1,200 @@
+"""
+Delivery fee lookup shared by checkout and the chat assistants.
+
+Each worker keeps the available DeliveryFee rows in memory, keyed by their
+normalized city|state lookup_key (plus one key per city alias, e.g. "QC"),
+so an address resolves with a dict lookup. Free text such as a chat message
+is scanned for every known city, alias and province in a single pass with an
+Aho-Corasick automaton. The index reloads when the delivery fee version
+stamp is bumped (see orders.signals); the stamp lives in the cache shared by
+all processes (products.cache), so an edit saved by another worker is
+noticed within VERSION_CHECK_INTERVAL.
+"""
+import threading
+import time
+from collections import deque
+
+from pcbulacan.text import normalize
+from products.cache import bump_version, get_version
+
+from .models import DeliveryFee
+
+
+DELIVERY_FEES_VERSION_KEY = 'orders:delivery_fees_version'
+
+# How often (in seconds) to look for changes made by other worker processes
+VERSION_CHECK_INTERVAL = 1.0
+
+# Other names for provinces and regions (normalized -> normalized state)
+STATE_ALIASES = {
+    'ncr': 'metro manila',
+    'national capital region': 'metro manila',
+    'mm': 'metro manila',
+}
+
+# Addresses often add or drop this word ("Malolos" vs "Malolos City")
+CITY_SUFFIX = ' city'
+
+
+def bump_delivery_fees_version():
+    """Mark every worker's delivery fee index as stale"""
+    bump_version(DELIVERY_FEES_VERSION_KEY)
+    delivery_fee_index.invalidate()
+
+
+class AhoCorasick:
+    """Finds every occurrence of a set of phrases in one pass over a text"""
+
+    def __init__(self, phrases):
+        # Trie transitions, failure links and (phrase length, value) outputs per state
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase, value in phrases:
+            self._add(phrase, value)
+        self._link()
+
+    def _add(self, phrase, value):
+        state = 0
+        for char in phrase:
+            if char not in self._goto[state]:
+                self._goto[state][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = self._goto[state][char]
+        self._out[state].append((len(phrase), value))
+
+    def _link(self):
+        # Breadth first, so every failure target is linked before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in self._goto[state].items():
+                queue.append(target)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[target] = self._goto[fail].get(char, 0)
+                self._out[target] = self._out[target] + self._out[self._fail[target]]
+
+    def find_all(self, text):
+        """Yield (start, end, value) for every phrase occurring in text"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._out[state]:
+                yield index + 1 - length, index + 1, value
+
+
+def _whole_words(text, matches):
+    """Leftmost-longest matches that start and end on word boundaries"""
+    matches = sorted(
+        (m for m in matches if (m[0] == 0 or text[m[0] - 1] == ' ') and (m[1] == len(text) or text[m[1]] == ' ')),
+        key=lambda m: (m[0], -(m[1] - m[0])),
+    )
+    kept = []
+    for match in matches:
+        # A name can be both a city and a province; keep both readings
+        if not kept or match[0] >= kept[-1][1] or match[:2] == kept[-1][:2]:
+            kept.append(match)
+    return kept
+
+
+class DeliveryFeeIndex:
+    """In-memory delivery fee lookups rebuilt on demand"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Drop the index so the next lookup reloads it"""
+        with self._lock:
+            self._data = None
+
+    def all(self):
+        """Available fees ordered by state and city"""
+        return self._index()['fees']
+
+    def for_location(self, city, state):
+        """The available DeliveryFee for an address's city and state, or None"""
+        by_key = self._index()['by_key']
+        city, state = normalize(city), normalize(state)
+        state = STATE_ALIASES.get(state, state)
+        if city.endswith(CITY_SUFFIX):
+            cities = (city, city[:-len(CITY_SUFFIX)])
+        else:
+            cities = (city, city + CITY_SUFFIX)
+        for candidate in cities:
+            fee = by_key.get(f'{candidate}|{state}')
+            if fee:
+                return fee
+        return None
+
+    def find(self, text):
+        """The fee for the location mentioned in free text, or None.
+
+        A city together with its province wins over a city alone, which wins
+        over a province alone (the province's first city is used then).
+        """
+        data = self._index()
+        text = normalize(text)
+        cities, states = [], set()
+        for _, _, (kind, value) in _whole_words(text, data['matcher'].find_all(text)):
+            if kind == 'city':
+                cities.append(value)
+            else:
+                states.add(value)
+        for fees in cities:
+            for fee in fees:
+                if normalize(fee.state) in states:
+                    return fee
+        if cities:
+            return cities[0][0]
+        for fee in data['fees']:
+            if normalize(fee.state) in states:
+                return fee
+        return None
+
+    def _index(self):
+        data = self._data
+        if data is not None:
+            if time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+                return data
+            self._checked_at = time.monotonic()
+            if get_version(DELIVERY_FEES_VERSION_KEY) == self._version:
+                return data
+        with self._lock:
+            self._build()
+            return self._data
+
+    def _build(self):
+        version = get_version(DELIVERY_FEES_VERSION_KEY)
+        fees = list(DeliveryFee.objects.filter(is_available=True).order_by('state', 'city'))
+
+        by_key = {}
+        names = {}
+        for fee in fees:
+            state = normalize(fee.state)
+            by_key.setdefault(fee.lookup_key, fee)
+            for name in [fee.city] + fee.alias_list:
+                name = normalize(name)
+                by_key.setdefault(f'{name}|{state}', fee)
+                names.setdefault(name, []).append(fee)
+
+        phrases = [(name, ('city', city_fees)) for name, city_fees in names.items()]
+        states = {normalize(fee.state) for fee in fees}
+        phrases += [(state, ('state', state)) for state in states]
+        phrases += [(alias, ('state', state)) for alias, state in STATE_ALIASES.items() if state in states]
+
+        self._data = {'fees': fees, 'by_key': by_key, 'matcher': AhoCorasick(phrases)}
+        self._version = version
+        self._checked_at = time.monotonic()
+
+
+delivery_fee_index = DeliveryFeeIndex()
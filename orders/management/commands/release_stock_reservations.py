@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.stock import SWEEP_INTERVAL, release_cancelled_reservations
+
+
+class Command(BaseCommand):
+    help = 'Return stock reserved by cancelled orders to their products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Sweep once and exit (for cron)')
+        parser.add_argument('--interval', type=int, default=SWEEP_INTERVAL, help='Seconds between sweeps')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self._report(release_cancelled_reservations())
+            return
+
+        self.stdout.write('Releasing cancelled orders\' stock reservations (Ctrl+C to stop)')
+        try:
+            while True:
+                self._report(release_cancelled_reservations())
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stock reservation sweep stopped')
+
+    def _report(self, released):
+        if released:
+            self.stdout.write(self.style.SUCCESS(f'Released {released} stock reservation(s)'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:00
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Common abbreviations for cities already in the fee table
+KNOWN_ALIASES = {
+    'quezon city': 'QC',
+    'san jose del monte': 'SJDM',
+}
+
+
+def normalize(text):
+    # Same as pcbulacan.text.normalize at the time of this migration
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def fill_lookup_keys(apps, schema_editor):
+    DeliveryFee = apps.get_model('orders', 'DeliveryFee')
+    fees = list(DeliveryFee.objects.all())
+    for fee in fees:
+        fee.lookup_key = f'{normalize(fee.city)}|{normalize(fee.state)}'
+        if not fee.aliases:
+            fee.aliases = KNOWN_ALIASES.get(normalize(fee.city), '')
+    DeliveryFee.objects.bulk_update(fees, ['lookup_key', 'aliases'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryfee',
+            name='aliases',
+            field=models.CharField(blank=True, help_text="Other names for the city, comma-separated (e.g., 'QC')", max_length=255),
+        ),
+        migrations.AddField(
+            model_name='deliveryfee',
+            name='lookup_key',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Normalized city|state, set on save', max_length=255),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.conf import settings
+from django.utils.functional import cached_property
+from pcbulacan.text import normalize
 from products.models import Product
+from .pricing import CartPricer
 
 
 class Order(models.Model):
@@ -113,6 +116,29 @@ class OrderItem(models.Model):
         return 0
 
 
+class StockReservation(models.Model):
+    """Stock taken off a product for an order until it ships or is released"""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held', db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+    
+    def __str__(self):
+        return f'{self.quantity}x {self.product_id} for order {self.order_id} ({self.status})'
+
+
 class Cart(models.Model):
     """Shopping cart"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
@@ -126,29 +152,34 @@ class Cart(models.Model):
     def __str__(self):
         return f'Cart for {self.user.email}'
     
+    @cached_property
+    def pricing(self):
+        """Priced items and totals from one CartPricer pass (two queries)"""
+        return CartPricer(self.items.all()).price()
+    
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.pricing.total_items
     
     @property
     def unique_items_count(self):
         """Count unique products in cart (not total quantity)"""
-        return self.items.count()
+        return self.pricing.count
     
     @property
     def subtotal(self):
         """Subtotal with discounts applied"""
-        return sum(item.total_price for item in self.items.all())
+        return self.pricing.subtotal
     
     @property
     def total_savings(self):
         """Total savings from all items"""
-        return sum(item.total_savings for item in self.items.all())
+        return self.pricing.total_savings
     
     @property
     def original_subtotal(self):
         """Original subtotal before discounts"""
-        return sum(item.quantity * item.original_unit_price for item in self.items.all())
+        return self.pricing.original_subtotal
 
 
 class CartItem(models.Model):
@@ -166,30 +197,39 @@ class CartItem(models.Model):
     def __str__(self):
         return f'{self.quantity}x {self.product.name}'
     
+    @cached_property
+    def line_price(self):
+        """LinePrice for this item; set in bulk by CartPricer, else priced alone"""
+        return CartPricer([self]).price().items[0].line_price
+    
     @property
     def unit_price(self):
         """Get the unit price (with deal discount if applicable)"""
-        return self.product.final_price
+        return self.line_price.unit_price
     
     @property
     def original_unit_price(self):
         """Get original unit price before discount"""
-        return self.product.original_price or self.product.price
+        return self.line_price.original_unit_price
     
     @property
     def total_price(self):
         """Total price for this cart item (with discount applied)"""
-        return self.quantity * self.unit_price
+        return self.line_price.total_price
     
     @property
     def total_savings(self):
         """Total savings for this item"""
-        return self.quantity * self.product.savings_amount
+        return self.line_price.total_savings
+    
+    @property
+    def savings_percentage(self):
+        return self.line_price.savings_percentage
     
     @property
     def has_discount(self):
         """Check if item has discount"""
-        return self.product.has_active_deal or (self.product.old_price and self.product.old_price > self.product.price)
+        return self.line_price.total_savings > 0 or self.line_price.deal is not None
 
 
 class DeliveryFee(models.Model):
@@ -200,6 +240,8 @@ class DeliveryFee(models.Model):
     min_order_free_delivery = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Minimum order amount for free delivery")
     estimated_days = models.CharField(max_length=50, help_text="Estimated delivery time (e.g., '3-5 days')")
     is_available = models.BooleanField(default=True)
+    aliases = models.CharField(max_length=255, blank=True, help_text="Other names for the city, comma-separated (e.g., 'QC')")
+    lookup_key = models.CharField(max_length=255, db_index=True, editable=False, default='', help_text="Normalized city|state, set on save")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -211,3 +253,16 @@ class DeliveryFee(models.Model):
     
     def __str__(self):
         return f"{self.city}, {self.state} - ₱{self.fee_amount}"
+    
+    def save(self, *args, **kwargs):
+        self.lookup_key = self.make_lookup_key(self.city, self.state)
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def make_lookup_key(city, state):
+        """Case, accent and punctuation insensitive key for a city and state"""
+        return f'{normalize(city)}|{normalize(state)}'
+    
+    @property
+    def alias_list(self):
+        return [alias.strip() for alias in self.aliases.split(',') if alias.strip()]
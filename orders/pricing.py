@@ -0,0 +1,106 @@
+"""
+One-pass cart pricing.
+
+CartPricer loads cart items with their products, and the active deals of
+those products, in two queries, then prices every line and the cart totals
+in a single pass with Decimal arithmetic. Unit prices are rounded to
+centavos once, so line totals, cart totals and order items all add up to
+the same amounts. The cart page, checkout and the AJAX cart endpoints share
+its result (see Cart.pricing).
+"""
+from collections import namedtuple
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+
+from products.models import Deal
+
+
+CENT = Decimal('0.01')
+
+ZERO = Decimal('0.00')
+
+LinePrice = namedtuple('LinePrice', [
+    'unit_price', 'original_unit_price', 'total_price', 'total_savings', 'savings_percentage', 'deal',
+])
+
+CartTotals = namedtuple('CartTotals', [
+    'items', 'count', 'total_items', 'subtotal', 'original_subtotal', 'total_savings',
+])
+
+
+def _deal_rank(deal):
+    # Same order as DealQuerySet.best_first()
+    return (-(deal.discount_percentage or 0), -(deal.discount_amount or 0), -deal.created_at.timestamp())
+
+
+class CartPricer:
+    """Prices a set of cart items (saved CartItems or unsaved buy-now items)"""
+
+    def __init__(self, items, at=None):
+        if hasattr(items, 'select_related'):
+            items = list(items.select_related('product', 'product__category'))
+        self.items = list(items)
+        self.at = at
+
+    def _best_deals(self):
+        """{product_id: best active Deal} in one query"""
+        product_ids = {item.product_id for item in self.items}
+        if not product_ids:
+            return {}
+        links = Deal.products.through.objects.filter(
+            product_id__in=product_ids, deal__in=Deal.objects.active(self.at)
+        ).select_related('deal')
+        best = {}
+        for link in links:
+            current = best.get(link.product_id)
+            if current is None or _deal_rank(link.deal) < _deal_rank(current):
+                best[link.product_id] = link.deal
+        return best
+
+    @staticmethod
+    def price_line(product, quantity, deal=None):
+        """LinePrice for quantity units of a product under its best deal"""
+        price = Decimal(product.price)
+        if deal:
+            original = price
+            unit = deal.discounted_price(price).quantize(CENT, rounding=ROUND_HALF_UP)
+        elif product.old_price and Decimal(product.old_price) > price:
+            original, unit = Decimal(product.old_price), price
+        else:
+            original, unit = price, price
+        percentage = 0
+        if original > 0 and original > unit:
+            percentage = int(((original - unit) * 100 / original).to_integral_value(rounding=ROUND_DOWN))
+        return LinePrice(
+            unit_price=unit,
+            original_unit_price=original,
+            total_price=unit * quantity,
+            total_savings=(original - unit) * quantity,
+            savings_percentage=percentage,
+            deal=deal,
+        )
+
+    def price(self):
+        """Price every item (setting item.line_price) and return the CartTotals"""
+        deals = self._best_deals()
+        total_items = 0
+        subtotal = original_subtotal = total_savings = ZERO
+        for item in self.items:
+            line = self.price_line(item.product, item.quantity, deals.get(item.product_id))
+            item.line_price = line
+            total_items += item.quantity
+            subtotal += line.total_price
+            original_subtotal += line.original_unit_price * item.quantity
+            total_savings += line.total_savings
+        return CartTotals(
+            items=self.items,
+            count=len(self.items),
+            total_items=total_items,
+            subtotal=subtotal,
+            original_subtotal=original_subtotal,
+            total_savings=total_savings,
+        )
+
+
+def price_items(items, at=None):
+    """Shortcut for CartPricer(items, at).price()"""
+    return CartPricer(items, at).price()
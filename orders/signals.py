@@ -0,0 +1,28 @@
+"""
+Signal handlers for keeping cart and delivery fee caches in sync
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cart_summary import bump_cart_version
+from .delivery import bump_delivery_fees_version
+from .models import Cart, CartItem, DeliveryFee
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_summary(sender, instance, **kwargs):
+    """A cart item was added, changed or removed - expire the owner's summary"""
+    if CartItem.cart.is_cached(instance):
+        user_id = instance.cart.user_id
+    else:
+        user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_cart_version(user_id)
+
+
+@receiver(post_save, sender=DeliveryFee)
+@receiver(post_delete, sender=DeliveryFee)
+def invalidate_delivery_fees(sender, **kwargs):
+    """A delivery fee was added, edited or removed - reload the fee index"""
+    bump_delivery_fees_version()
@@ -0,0 +1,152 @@
+"""
+Stock reservations for orders.
+
+Checkout takes stock off the products as soon as the order is placed, with
+one conditional UPDATE (stock = stock - n WHERE stock >= n) inside the
+order's transaction: two shoppers racing for the last units cannot both
+succeed, and no read-modify-write can lose a concurrent change. Each taken
+quantity is recorded as a held StockReservation. Shipping an order commits
+its reservations; reservations of cancelled orders are handed back to the
+products by release_cancelled_reservations(), which the
+release_stock_reservations command runs in the background.
+
+Conditional UPDATEs send no post_save signals, so cached catalog pages are
+invalidated here, and only when a product sells out or comes back in stock.
+stock_changed is sent for every product touched, after the commit, so the
+low-stock alerts in accounts.signals still fire.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+
+from products.cache import bump_catalog_version
+from products.facets import bump_facets_version
+from products.models import Product, stock_changed
+
+from .models import StockReservation
+
+
+# Seconds between background sweeps for cancelled orders' reservations
+SWEEP_INTERVAL = 30
+
+
+class InsufficientStock(Exception):
+    """Raised when a product has fewer units left than an order needs"""
+
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f'Not enough stock for {product.name}. Only {product.stock} left.')
+
+
+def _availability_changed():
+    # Cached pages and in-stock facet counts show the old availability
+    bump_catalog_version()
+    bump_facets_version()
+
+
+def _stock_changed(product_ids):
+    transaction.on_commit(lambda: stock_changed.send(sender=Product, product_ids=product_ids))
+
+
+def _quantities(lines):
+    """{product_id: quantity} for (product_id, quantity) pairs, merging repeats"""
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return quantities
+
+
+def take_stock(lines):
+    """Take stock for (product_id, quantity) pairs or raise InsufficientStock.
+
+    One conditional UPDATE covers every product; when it matches fewer rows
+    than requested nothing is taken and the first short product is reported.
+    """
+    quantities = _quantities(lines)
+    if not quantities:
+        return quantities
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, stock__gte=quantity)
+    taken_quantity = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+    with transaction.atomic():
+        # Lock the rows in id order so concurrent checkouts cannot deadlock
+        list(Product.objects.select_for_update().filter(pk__in=list(quantities)).order_by('pk').values_list('pk'))
+        taken = Product.objects.filter(enough).update(stock=F('stock') - taken_quantity)
+        if taken != len(quantities):
+            transaction.set_rollback(True)
+    if taken != len(quantities):
+        products = Product.objects.filter(pk__in=list(quantities)).order_by('pk')
+        raise InsufficientStock(next((p for p in products if p.stock < quantities[p.pk]), products[0]))
+    if Product.objects.filter(pk__in=list(quantities), stock=0).exists():
+        transaction.on_commit(_availability_changed)
+    _stock_changed(list(quantities))
+    return quantities
+
+
+def return_stock(lines):
+    """Give (product_id, quantity) pairs back to the products"""
+    quantities = _quantities(lines)
+    # Products that were sold out come back in stock
+    restocked = Product.objects.filter(pk__in=list(quantities), stock=0).exists()
+    for product_id in sorted(quantities):
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + quantities[product_id])
+    if restocked:
+        transaction.on_commit(_availability_changed)
+    _stock_changed(list(quantities))
+
+
+def reserve_stock(order, items):
+    """Take stock for an order's items and record the held reservations.
+
+    items are CartItems or OrderItems (anything with product_id and
+    quantity). Raises InsufficientStock, and takes nothing, when any product
+    is short.
+    """
+    with transaction.atomic():
+        quantities = take_stock((item.product_id, item.quantity) for item in items)
+        return StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def commit_reservations(order):
+    """Mark an order's stock as gone for good once it ships.
+
+    Held reservations are committed. An order holding none has no stock
+    taken: it was placed before reservations existed, or it was cancelled,
+    swept and then reinstated. Its items take stock now (raising
+    InsufficientStock when short) and are recorded as committed, so shipping
+    it again takes nothing.
+    """
+    with transaction.atomic():
+        if order.reservations.filter(status='held').update(status='committed'):
+            return
+        if order.reservations.filter(status='committed').exists():
+            return
+        quantities = take_stock(order.items.values_list('product_id', 'quantity'))
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=product_id, quantity=quantity, status='committed')
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def release_cancelled_reservations():
+    """Return the stock held by cancelled orders; returns reservations released"""
+    with transaction.atomic():
+        # Locked until commit, so concurrent sweeps cannot return the same stock twice
+        reservations = list(
+            StockReservation.objects.select_for_update(of=('self',))
+            .filter(status='held', order__status='cancelled')
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if not reservations:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in reservations]).update(status='released')
+        return_stock((product_id, quantity) for _, product_id, quantity in reservations)
+    return len(reservations)
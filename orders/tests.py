@@ -1,4 +1,345 @@
 # Tests for orders app
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Notification, User, UserAddress
+from products.models import Category, Deal, Product
+
+from .cart_summary import cart_summary
+from .context_processors import cart_context
+from .delivery import delivery_fee_index
+from .models import Cart, CartItem, DeliveryFee, Order, OrderItem
+from .pricing import CartPricer
+from .stock import (
+    InsufficientStock, commit_reservations, release_cancelled_reservations, reserve_stock, take_stock,
+)
+
+
+def make_deal(products, percentage, days_left=1, **fields):
+    now = timezone.now()
+    deal = Deal.objects.create(
+        title=f'{percentage}% off', discount_percentage=Decimal(percentage), status='active',
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=days_left), **fields
+    )
+    deal.products.add(*products)
+    return deal
+
+
+def checkout(client, user, address, items):
+    """Log in, select the cart items and place the order"""
+    client.force_login(user)
+    session = client.session
+    session['selected_cart_items'] = [item.pk for item in items]
+    session.save()
+    return client.post(reverse('orders:checkout'), {'shipping_address': address.pk, 'payment_method': 'cod'})
+
+
+def make_order(user, **fields):
+    values = dict(
+        user=user, full_name='Juan Dela Cruz', email=user.email, phone='09170000000',
+        address='1 Rizal St', city='Malolos', state='Bulacan', zip_code='3000',
+        subtotal=0, total=0,
+    )
+    values.update(fields)
+    return Order.objects.create(**values)
+
+
+class StockTests(TestCase):
+    """Stock taken at checkout, released for cancelled orders, committed on shipping"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer@example.com', 'secret', first_name='Juan', last_name='Dela Cruz')
+        category = Category.objects.create(name='Monitors')
+        cls.monitor = Product.objects.create(category=category, name='Monitor', description='24 inch', price=5000, stock=5)
+        cls.cable = Product.objects.create(category=category, name='HDMI Cable', description='2 m', price=300, stock=1)
+
+    def stock(self, product):
+        return Product.objects.get(pk=product.pk).stock
+
+    def test_take_stock_rolls_back_when_any_product_is_short(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            take_stock([(self.monitor.pk, 2), (self.cable.pk, 3)])
+        self.assertEqual(raised.exception.product.pk, self.cable.pk)
+        self.assertEqual(self.stock(self.monitor), 5)
+        self.assertEqual(self.stock(self.cable), 1)
+
+    def test_take_stock_merges_repeated_products(self):
+        take_stock([(self.monitor.pk, 2), (self.monitor.pk, 3)])
+        self.assertEqual(self.stock(self.monitor), 0)
+
+    def test_sweep_releases_stock_exactly_once(self):
+        order = make_order(self.user)
+        OrderItem.objects.create(order=order, product=self.monitor, quantity=3, price=5000)
+        reserve_stock(order, order.items.all())
+        self.assertEqual(self.stock(self.monitor), 2)
+
+        # Held reservations of live orders stay held
+        self.assertEqual(release_cancelled_reservations(), 0)
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(release_cancelled_reservations(), 1)
+        self.assertEqual(release_cancelled_reservations(), 0)
+        self.assertEqual(self.stock(self.monitor), 5)
+        self.assertEqual(list(order.reservations.values_list('status', flat=True)), ['released'])
+
+    def test_shipping_commits_held_reservations(self):
+        order = make_order(self.user)
+        OrderItem.objects.create(order=order, product=self.monitor, quantity=2, price=5000)
+        reserve_stock(order, order.items.all())
+        commit_reservations(order)
+        self.assertEqual(self.stock(self.monitor), 3)
+        self.assertEqual(list(order.reservations.values_list('status', flat=True)), ['committed'])
+
+    def test_shipping_reinstated_order_takes_stock_once(self):
+        order = make_order(self.user)
+        OrderItem.objects.create(order=order, product=self.monitor, quantity=2, price=5000)
+        reserve_stock(order, order.items.all())
+        order.status = 'cancelled'
+        order.save()
+        release_cancelled_reservations()
+
+        order.status = 'processing'
+        order.save()
+        commit_reservations(order)
+        commit_reservations(order)
+        self.assertEqual(self.stock(self.monitor), 3)
+
+
+class LowStockAlertTests(TestCase):
+    """Stock sold through orders still raises the admin low-stock alert"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin@example.com', 'secret', is_staff=True)
+        cls.user = User.objects.create_user('buyer@example.com', 'secret', first_name='Juan', last_name='Dela Cruz')
+        cls.address = UserAddress.objects.create(
+            user=cls.user, address_line1='1 Rizal St', city='Malolos', state='Bulacan', postal_code='3000'
+        )
+        category = Category.objects.create(name='Memory')
+        cls.ram = Product.objects.create(category=category, name='16GB DDR4', description='3200 MHz', price=2200, stock=12)
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create(user=self.user)
+        item = CartItem.objects.create(cart=cart, product=self.ram, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.client, self.user, self.address, [item])
+
+    def alerts(self):
+        return Notification.objects.filter(user=self.admin, product_id=self.ram.pk, title__contains='Low Stock Alert')
+
+    def test_checkout_to_low_stock_alerts_admins(self):
+        self.checkout(3)
+        self.assertEqual(Product.objects.get(pk=self.ram.pk).stock, 9)
+        self.assertEqual(self.alerts().count(), 1)
+        self.assertIn('Only 9 units left', self.alerts().get().message)
+
+    def test_checkout_above_low_stock_sends_no_alert(self):
+        self.checkout(1)
+        self.assertFalse(self.alerts().exists())
+
+
+class CartPricerTests(TestCase):
+    """Line and cart totals from one pricing pass"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer@example.com', 'secret', first_name='Juan', last_name='Dela Cruz')
+        category = Category.objects.create(name='Storage')
+        cls.ssd = Product.objects.create(category=category, name='1TB SSD', description='NVMe', price=Decimal('3999.99'), stock=10)
+        cls.hdd = Product.objects.create(
+            category=category, name='2TB HDD', description='7200 rpm',
+            price=Decimal('2849.50'), old_price=Decimal('3000.00'), stock=10,
+        )
+        cls.usb = Product.objects.create(category=category, name='64GB USB', description='USB 3.0', price=Decimal('450.00'), stock=10)
+        make_deal([cls.ssd], '10.00')
+        make_deal([cls.ssd], '12.50')
+
+    def test_best_deal_price_is_rounded_to_centavos(self):
+        line = CartPricer([CartItem(product=self.ssd, quantity=3)]).price().items[0].line_price
+        self.assertEqual(line.deal.discount_percentage, Decimal('12.50'))
+        self.assertEqual(line.unit_price, Decimal('3499.99'))
+        self.assertEqual(line.total_price, Decimal('10499.97'))
+        self.assertEqual(line.total_savings, Decimal('1500.00'))
+        self.assertEqual(line.savings_percentage, 12)
+
+    def test_old_price_markdown_without_deal(self):
+        line = CartPricer([CartItem(product=self.hdd, quantity=2)]).price().items[0].line_price
+        self.assertIsNone(line.deal)
+        self.assertEqual(line.unit_price, Decimal('2849.50'))
+        self.assertEqual(line.original_unit_price, Decimal('3000.00'))
+        self.assertEqual(line.total_savings, Decimal('301.00'))
+        self.assertEqual(line.savings_percentage, 5)
+
+    def test_deal_past_its_end_date_is_ignored(self):
+        deal = make_deal([self.usb], '50.00')
+        # Status still says active, as before the scheduler catches up
+        Deal.objects.filter(pk=deal.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        line = CartPricer([CartItem(product=self.usb, quantity=1)]).price().items[0].line_price
+        self.assertIsNone(line.deal)
+        self.assertEqual(line.unit_price, Decimal('450.00'))
+
+    def test_cart_totals_add_up_the_lines(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.ssd, quantity=3)
+        CartItem.objects.create(cart=cart, product=self.hdd, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.usb, quantity=1)
+        with self.assertNumQueries(2):
+            totals = cart.pricing
+        self.assertEqual(totals.count, 3)
+        self.assertEqual(totals.total_items, 6)
+        self.assertEqual(totals.subtotal, Decimal('10499.97') + Decimal('5699.00') + Decimal('450.00'))
+        self.assertEqual(totals.total_savings, Decimal('1500.00') + Decimal('301.00'))
+        self.assertEqual(totals.original_subtotal, totals.subtotal + totals.total_savings)
+        self.assertEqual(cart.subtotal, totals.subtotal)
+
+
+class CheckoutTests(TestCase):
+    """Checkout writes the order, its items and the reservations in one transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer@example.com', 'secret', first_name='Juan', last_name='Dela Cruz')
+        cls.address = UserAddress.objects.create(
+            user=cls.user, address_line1='1 Rizal St', city='Malolos', state='Bulacan', postal_code='3000'
+        )
+        category = Category.objects.create(name='Storage')
+        cls.ssd = Product.objects.create(category=category, name='1TB SSD', description='NVMe', price=Decimal('3999.99'), stock=10)
+        cls.hdd = Product.objects.create(category=category, name='2TB HDD', description='7200 rpm', price=Decimal('2849.50'), stock=1)
+        make_deal([cls.ssd], '12.50')
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+
+    def test_order_items_match_cart_pricing(self):
+        items = [
+            CartItem.objects.create(cart=self.cart, product=self.ssd, quantity=3),
+            CartItem.objects.create(cart=self.cart, product=self.hdd, quantity=1),
+        ]
+        pricing = CartPricer(self.cart.items.all()).price()
+        expected = {item.product_id: item.unit_price for item in pricing.items}
+
+        response = checkout(self.client, self.user, self.address, items)
+
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('orders:order_confirmation', args=[order.order_number]))
+        self.assertEqual(dict(order.items.values_list('product_id', 'price')), expected)
+        self.assertEqual(order.subtotal, pricing.subtotal)
+        self.assertEqual(sum(item.total for item in order.items.all()), pricing.subtotal)
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(Product.objects.get(pk=self.ssd.pk).stock, 7)
+
+    def test_short_stock_writes_nothing(self):
+        items = [
+            CartItem.objects.create(cart=self.cart, product=self.ssd, quantity=3),
+            CartItem.objects.create(cart=self.cart, product=self.hdd, quantity=2),
+        ]
+
+        response = checkout(self.client, self.user, self.address, items)
+
+        self.assertRedirects(response, reverse('orders:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.ssd.pk).stock, 10)
+
+
+class CartSummaryTests(TestCase):
+    """The header cart badge comes from a cached per-user summary"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer@example.com', 'secret', first_name='Juan', last_name='Dela Cruz')
+        category = Category.objects.create(name='Accessories')
+        cls.mouse = Product.objects.create(category=category, name='Mouse', description='Wireless', price=Decimal('800.00'))
+        cls.pad = Product.objects.create(category=category, name='Mouse Pad', description='XL', price=Decimal('350.00'))
+        make_deal([cls.mouse], '12.50')
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+        self.item = CartItem.objects.create(cart=self.cart, product=self.mouse, quantity=2)
+
+    def test_summary_is_cached_until_the_cart_changes(self):
+        summary = cart_summary(self.user.pk)
+        # Deal price: 800.00 less 12.50%
+        self.assertEqual((summary['count'], summary['quantity'], summary['subtotal']), (1, 2, Decimal('1400.00')))
+        with self.assertNumQueries(0):
+            cart_summary(self.user.pk)
+
+        CartItem.objects.create(cart=self.cart, product=self.pad, quantity=3)
+        summary = cart_summary(self.user.pk)
+        self.assertEqual((summary['count'], summary['quantity'], summary['subtotal']), (2, 5, Decimal('2450.00')))
+
+        self.item.delete()
+        self.assertEqual(cart_summary(self.user.pk)['count'], 1)
+
+    def test_price_change_refreshes_the_subtotal(self):
+        cart_summary(self.user.pk)
+        self.pad.price = Decimal('300.00')
+        self.pad.save()
+        CartItem.objects.filter(pk=self.item.pk).update(product=self.pad)
+        # A queryset update sends no signal; the product save expired the summary
+        self.assertEqual(cart_summary(self.user.pk)['subtotal'], Decimal('600.00'))
+
+    def test_context_processor_leaves_the_cart_unloaded(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        cart_summary(self.user.pk)
+        with self.assertNumQueries(0):
+            context = cart_context(request)
+            self.assertEqual(context['cart_count'], 1)
+        self.assertEqual(context['cart'].pk, self.cart.pk)
+
+
+class DeliveryFeeIndexTests(TestCase):
+    """Delivery fees matched by normalized city and province, or from free text"""
+
+    @classmethod
+    def setUpTestData(cls):
+        def fee(city, state, amount, **fields):
+            return DeliveryFee.objects.create(city=city, state=state, fee_amount=amount, estimated_days='2-3 days', **fields)
+
+        cls.malolos = fee('Malolos City', 'Bulacan', 80)
+        cls.meycauayan = fee('Meycauayan', 'Bulacan', 100)
+        cls.qc = fee('Quezon City', 'Metro Manila', 150, aliases='QC, Kyusi')
+        cls.san_jose_batangas = fee('San Jose', 'Batangas', 250)
+        cls.san_jose_ecija = fee('San Jose', 'Nueva Ecija', 220)
+        fee('Angeles', 'Pampanga', 180, is_available=False)
+
+    def setUp(self):
+        delivery_fee_index.invalidate()
+
+    def test_for_location_ignores_case_accents_and_city_suffix(self):
+        self.assertEqual(delivery_fee_index.for_location('MALOLOS', 'bulacan'), self.malolos)
+        self.assertEqual(delivery_fee_index.for_location('Malolós City', 'Bulacan.'), self.malolos)
+        self.assertEqual(delivery_fee_index.for_location('Meycauayan City', 'Bulacan'), self.meycauayan)
+        self.assertEqual(delivery_fee_index.for_location('QC', 'NCR'), self.qc)
+        self.assertEqual(delivery_fee_index.for_location('San Jose', 'Nueva Ecija'), self.san_jose_ecija)
+        self.assertIsNone(delivery_fee_index.for_location('Angeles', 'Pampanga'))
+
+    def test_find_in_free_text(self):
+        find = delivery_fee_index.find
+        self.assertEqual(find('How much is shipping to Kyusi?'), self.qc)
+        # A city with its province beats the same city name elsewhere
+        self.assertEqual(find('deliver to san jose, nueva ecija please'), self.san_jose_ecija)
+        self.assertEqual(find('san jose'), self.san_jose_batangas)
+        # A province alone uses its first city
+        self.assertEqual(find('anywhere in Bulacan?'), self.malolos)
+        self.assertIsNone(find('do you ship to Angeles, Pampanga'))
+        self.assertIsNone(find('hello'))
+
+    def test_fee_changes_reload_the_index(self):
+        self.assertEqual(delivery_fee_index.for_location('Malolos', 'Bulacan').fee_amount, 80)
+        self.malolos.fee_amount = 90
+        self.malolos.save()
+        self.assertEqual(delivery_fee_index.for_location('Malolos', 'Bulacan').fee_amount, 90)
+
+        self.meycauayan.delete()
+        self.assertIsNone(delivery_fee_index.for_location('Meycauayan', 'Bulacan'))
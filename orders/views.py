@@ -1,9 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.http import JsonResponse
 from .models import Cart, CartItem, Order, OrderItem
+from .delivery import delivery_fee_index
+from .pricing import CartPricer
+from .stock import InsufficientStock, reserve_stock
 from products.models import Product
+from products.recommendations import recommended_for_many
 
 
 @login_required
@@ -22,7 +27,16 @@ def cart_view(request):
         request.session['selected_cart_items'] = [int(item_id) for item_id in selected_items]
         return redirect('orders:checkout')
     
-    context = {'cart': cart}
+    # Frequently bought together with what is already in the cart
+    cart_product_ids = [item.product_id for item in cart.pricing.items]
+    recommended_products = []
+    if cart_product_ids:
+        recommended_products = recommended_for_many(cart_product_ids).with_pricing()[:4]
+    
+    context = {
+        'cart': cart,
+        'recommended_products': recommended_products,
+    }
     return render(request, 'orders/cart.html', context)
 
 
@@ -80,13 +94,21 @@ def update_cart(request, item_id):
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         if quantity <= 0:
             cart_item.delete()
-            return JsonResponse({'success': True, 'item_total': 0, 'cart_subtotal': cart_item.cart.subtotal})
+            totals = CartPricer(CartItem.objects.filter(cart_id=cart_item.cart_id)).price()
+            return JsonResponse({'success': True, 'item_total': 0, 'cart_subtotal': float(totals.subtotal)})
         elif quantity > cart_item.product.stock:
             return JsonResponse({'success': False, 'error': 'Not enough stock available.'})
         else:
             cart_item.quantity = quantity
             cart_item.save()
-            return JsonResponse({'success': True, 'item_total': cart_item.total_price, 'cart_subtotal': cart_item.cart.subtotal})
+            # One pricing pass gives both the line and the cart total
+            totals = CartPricer(CartItem.objects.filter(cart_id=cart_item.cart_id)).price()
+            line = next(item.line_price for item in totals.items if item.pk == cart_item.pk)
+            return JsonResponse({
+                'success': True,
+                'item_total': float(line.total_price),
+                'cart_subtotal': float(totals.subtotal),
+            })
     else:
         if quantity <= 0:
             cart_item.delete()
@@ -171,7 +193,6 @@ def checkout_view(request):
     """Checkout page with selected items or buy now item"""
     from accounts.models import UserAddress
     from decimal import Decimal
-    from .models import DeliveryFee
     
     # Check if this is a buy now checkout (temporary item in session)
     buy_now_data = request.session.get('buy_now_item')
@@ -180,15 +201,8 @@ def checkout_view(request):
         # Buy now checkout - create temporary item data
         product = get_object_or_404(Product, id=buy_now_data['product_id'], is_active=True)
         
-        # Create a temporary "item-like" object for the template
-        class TempItem:
-            def __init__(self, product, quantity):
-                self.product = product
-                self.quantity = quantity
-                self.total_price = product.final_price * quantity
-                self.total_savings = product.savings_amount * quantity
-        
-        selected_items = [TempItem(product, buy_now_data['quantity'])]
+        # An unsaved cart item stands in for the buy now product
+        selected_items = [CartItem(product=product, quantity=buy_now_data['quantity'])]
         is_buy_now = True
     else:
         # Regular cart checkout
@@ -200,9 +214,10 @@ def checkout_view(request):
         
         # Get cart and selected items
         cart = get_object_or_404(Cart, user=request.user)
-        selected_items = cart.items.filter(id__in=selected_item_ids)
+        selected_queryset = cart.items.filter(id__in=selected_item_ids)
+        selected_items = list(selected_queryset.select_related('product', 'product__category'))
         
-        if not selected_items.exists():
+        if not selected_items:
             messages.error(request, 'Selected items not found in cart.')
             return redirect('orders:cart')
         
@@ -211,25 +226,22 @@ def checkout_view(request):
     # Get user's addresses and attach delivery fee data
     addresses = UserAddress.objects.filter(user=request.user)
     
-    # Attach delivery fee information to each address
+    # Attach delivery fee information to each address (from the in-memory fee index)
     for address in addresses:
-        try:
-            delivery_fee = DeliveryFee.objects.get(
-                city__iexact=address.city,
-                state__iexact=address.state,
-                is_available=True
-            )
+        delivery_fee = delivery_fee_index.for_location(address.city, address.state)
+        if delivery_fee:
             address.delivery_fee = float(delivery_fee.fee_amount)
             address.min_order_free_delivery = float(delivery_fee.min_order_free_delivery)
             address.estimated_days = delivery_fee.estimated_days
-        except DeliveryFee.DoesNotExist:
+        else:
             # Default values if no delivery fee found
             address.delivery_fee = 0
             address.min_order_free_delivery = 0
             address.estimated_days = 'To be determined'
     
-    # Calculate subtotal for selected items
-    subtotal = Decimal(str(sum(item.total_price for item in selected_items)))
+    # Price the selected items once; every total below comes from this pass
+    pricing = CartPricer(selected_items).price()
+    subtotal = pricing.subtotal
     
     if request.method == 'POST':
         # Get form data
@@ -244,18 +256,14 @@ def checkout_view(request):
         shipping_address = get_object_or_404(UserAddress, id=shipping_address_id, user=request.user)
         
         # Calculate shipping cost based on delivery fee settings
-        try:
-            delivery_fee = DeliveryFee.objects.get(
-                city__iexact=shipping_address.city,
-                state__iexact=shipping_address.state,
-                is_available=True
-            )
+        delivery_fee = delivery_fee_index.for_location(shipping_address.city, shipping_address.state)
+        if delivery_fee:
             # Check if order qualifies for free delivery
             if subtotal >= delivery_fee.min_order_free_delivery and delivery_fee.min_order_free_delivery > 0:
                 shipping_cost = Decimal('0.00')
             else:
                 shipping_cost = delivery_fee.fee_amount
-        except DeliveryFee.DoesNotExist:
+        else:
             # Default shipping cost if no delivery fee found
             shipping_cost = Decimal('0.00')
         
@@ -281,38 +289,44 @@ def checkout_view(request):
                 return render(request, 'orders/checkout.html', context)
         
         try:
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                shipping_address=shipping_address,
-                full_name=f"{request.user.first_name} {request.user.last_name}",
-                email=request.user.email,
-                phone=getattr(request.user, 'phone', '') or '',
-                address=shipping_address.address_line1,
-                city=shipping_address.city,
-                state=shipping_address.state,
-                zip_code=shipping_address.postal_code,
-                payment_method=payment_method,
-                payment_screenshot=payment_screenshot,
-                subtotal=subtotal,
-                shipping_cost=shipping_cost,
-                total=total,
-            )
-            
-            # Create order items from selected cart items
-            for item in selected_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=item.product.final_price  # Use discounted price
+            with transaction.atomic():
+                # Create order
+                order = Order.objects.create(
+                    user=request.user,
+                    shipping_address=shipping_address,
+                    full_name=f"{request.user.first_name} {request.user.last_name}",
+                    email=request.user.email,
+                    phone=getattr(request.user, 'phone', '') or '',
+                    address=shipping_address.address_line1,
+                    city=shipping_address.city,
+                    state=shipping_address.state,
+                    zip_code=shipping_address.postal_code,
+                    payment_method=payment_method,
+                    payment_screenshot=payment_screenshot,
+                    subtotal=subtotal,
+                    shipping_cost=shipping_cost,
+                    total=total,
                 )
                 
-                # Note: Stock will be deducted when order status is changed to 'shipped' by admin
+                # Create order items from selected cart items in one insert
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=item.product,
+                        quantity=item.quantity,
+                        price=item.unit_price  # Discounted price from the pricing pass
+                    )
+                    for item in selected_items
+                ])
+                
+                # Reserve the stock now; no order is placed if any product ran out
+                reserve_stock(order, selected_items)
+                
+                # Remove selected items from cart (only if not buy now)
+                if not is_buy_now:
+                    selected_queryset.delete()
             
-            # Remove selected items from cart (only if not buy now)
             if not is_buy_now:
-                selected_items.delete()
                 # Clear selected items from session
                 if 'selected_cart_items' in request.session:
                     del request.session['selected_cart_items']
@@ -324,17 +338,16 @@ def checkout_view(request):
             messages.success(request, f'Order {order.order_number} placed successfully!')
             return redirect('orders:order_confirmation', order_number=order.order_number)
             
+        except InsufficientStock as e:
+            messages.error(request, str(e))
+            return redirect('orders:checkout' if is_buy_now else 'orders:cart')
         except Exception as e:
             messages.error(request, f'Error processing order: {str(e)}')
             return redirect('orders:checkout')
     
-    # Calculate total for selected items
-    if is_buy_now:
-        total = Decimal(str(selected_items[0].total_price))  # For buy now, just one item
-        total_savings = Decimal(str(selected_items[0].total_savings)) if hasattr(selected_items[0], 'total_savings') else Decimal('0')
-    else:
-        total = Decimal(str(sum(item.total_price for item in selected_items)))
-        total_savings = Decimal(str(sum(item.total_savings for item in selected_items)))
+    # Total for selected items (before delivery fee)
+    total = pricing.subtotal
+    total_savings = pricing.total_savings
 
     context = {
         'selected_items': selected_items,
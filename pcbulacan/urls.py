@@ -6,9 +6,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
+from accounts.views import session_summary
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/session-summary/', session_summary, name='session_summary'),
     path('', include('products.urls')),
     path('accounts/', include('accounts.urls')),
     path('orders/', include('orders.urls')),
@@ -0,0 +1,139 @@
+"""
+In-memory prefix index for the header search autocomplete.
+
+Product names, SKUs and category names are normalized into sorted key arrays
+and looked up with bisect, so a suggestion costs O(log n + limit) no matter
+how big the catalog is. Each worker loads the index once and reloads it when
+the autocomplete version stamp is bumped, by products.signals on a product
+or category save or by catalog_import after a bulk import. The stamp lives
+in the cache shared by all processes (products.cache), so a bump made in
+another process is noticed within VERSION_CHECK_INTERVAL.
+"""
+import bisect
+import threading
+import time
+
+from django.urls import reverse
+
+from pcbulacan.text import normalize
+
+from .cache import bump_version, get_version
+from .pricing import deal_prices
+
+
+AUTOCOMPLETE_VERSION_KEY = 'products:autocomplete_version'
+
+# How often (in seconds) to look for changes made by other worker processes
+VERSION_CHECK_INTERVAL = 1.0
+
+# Keys longer than this are cut, which keeps word-suffix keys compact
+KEY_LENGTH = 48
+
+
+def bump_autocomplete_version():
+    """Mark every worker's autocomplete index as stale"""
+    bump_version(AUTOCOMPLETE_VERSION_KEY)
+    autocomplete_index.invalidate()
+
+
+class AutocompleteIndex:
+    """Sorted (key, product_id) arrays searched by prefix"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Drop the index so the next lookup reloads it"""
+        with self._lock:
+            self._data = None
+
+    def suggest(self, query, limit=10):
+        """Return product summaries whose name, SKU or category starts with query.
+
+        Products whose name starts with the query come first, then matches on
+        any later word of the name, the SKU or the category name.
+        """
+        prefix = normalize(query)[:KEY_LENGTH]
+        if not prefix:
+            return []
+        name_keys, name_ids, other_keys, other_ids, products = self._index()
+
+        found = []
+        seen = set()
+        for keys, ids in ((name_keys, name_ids), (other_keys, other_ids)):
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+                product_id = ids[position]
+                if product_id not in seen:
+                    seen.add(product_id)
+                    found.append(product_id)
+                position += 1
+        return [self._summary(products[product_id]) for product_id in found]
+
+    def _summary(self, product):
+        product_id, name, slug, image, price = product
+        entry = deal_prices.get(product_id)
+        return {
+            'id': product_id,
+            'name': name,
+            'slug': slug,
+            'url': reverse('products:detail', kwargs={'slug': slug}),
+            # Derivatives may be generated after the index is built
+            'image': image.thumbnail_url if image else None,
+            'price': float(price),
+            'final_price': float(entry.final_price) if entry else float(price),
+        }
+
+    def _index(self):
+        data = self._data
+        if data is not None:
+            if time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+                return data
+            self._checked_at = time.monotonic()
+            if get_version(AUTOCOMPLETE_VERSION_KEY) == self._version:
+                return data
+        with self._lock:
+            self._build()
+            return self._data
+
+    def _build(self):
+        from .models import Product
+
+        version = get_version(AUTOCOMPLETE_VERSION_KEY)
+        name_entries = []
+        other_entries = []
+        products = {}
+        rows = Product.objects.filter(is_active=True).order_by('-is_featured', '-created_at').values_list(
+            'id', 'name', 'slug', 'sku', 'image', 'price', 'category__name'
+        )
+        image_field = Product._meta.get_field('image')
+        for product_id, name, slug, sku, image, price, category_name in rows:
+            image = image_field.attr_class(None, image_field, image)
+            products[product_id] = (product_id, name, slug, image, price)
+
+            words = normalize(name).split()
+            if words:
+                name_entries.append((' '.join(words)[:KEY_LENGTH], product_id))
+            for start in range(1, len(words)):
+                other_entries.append((' '.join(words[start:])[:KEY_LENGTH], product_id))
+            if sku:
+                other_entries.append((normalize(sku)[:KEY_LENGTH], product_id))
+            if category_name:
+                other_entries.append((normalize(category_name)[:KEY_LENGTH], product_id))
+
+        # Stable sort keeps featured/newest products first among equal keys
+        name_entries.sort(key=lambda entry: entry[0])
+        other_entries.sort(key=lambda entry: entry[0])
+        self._data = (
+            [key for key, _ in name_entries], [product_id for _, product_id in name_entries],
+            [key for key, _ in other_entries], [product_id for _, product_id in other_entries],
+            products,
+        )
+        self._version = version
+        self._checked_at = time.monotonic()
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,44 @@
+"""
+Shared version stamps for process-local product caches.
+
+Each worker keeps its own in-memory indexes (deal prices, autocomplete, ...).
+A stamp stored in the Django cache tells every worker when to rebuild them,
+so the default cache must be shared by all processes, management commands
+included (see CACHES in settings; a per-process LocMemCache would hide the
+changes made by run_deal_scheduler or catalog_import from the web workers).
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _new_stamp():
+    # A fresh value rather than a counter: bumps never collide even where
+    # incr() is not atomic (file cache), and a stamp evicted from the cache
+    # comes back as a value no worker has seen, so it forces a rebuild
+    return time.time_ns()
+
+
+def get_version(key):
+    """Current value of a shared version stamp"""
+    return cache.get_or_set(key, _new_stamp, timeout=None)
+
+
+def bump_version(key):
+    """Advance a shared version stamp so every worker sees the change"""
+    stamp = _new_stamp()
+    cache.set(key, stamp, timeout=None)
+    return stamp
+
+
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+
+def get_catalog_version():
+    """Version of everything shown on catalog pages (products, deals, slides...)"""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Expire cached catalog pages after a catalog change"""
+    return bump_version(CATALOG_VERSION_KEY)
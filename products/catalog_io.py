@@ -0,0 +1,293 @@
+"""
+Bulk catalog import and export over CSV or JSON Lines.
+
+Rows are streamed in both directions: the importer reads one batch at a time
+and upserts it by SKU with a single bulk_create(update_conflicts=True), and
+the exporter walks the catalog with a server-side iterator. Bulk writes send
+no per-row signals, so the caches, search index and denormalized columns
+that products.signals maintains per save are refreshed once per batch or
+once per import instead. Images named in the input are copied from a local
+directory, and resized, in a thread pool.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .autocomplete import bump_autocomplete_version
+from .cache import bump_catalog_version
+from .facets import bump_facets_version
+from .images import generate_derivatives
+from .models import Category, Product
+from .pricing import bump_deal_prices_version
+from .recommendations import build_similar
+from .search import get_search_backend
+
+
+# Columns in import and export files, in export order
+FIELDS = [
+    'sku', 'name', 'category', 'description', 'price', 'old_price', 'stock',
+    'is_active', 'is_featured', 'is_new', 'on_sale', 'image',
+]
+
+# Product columns an import overwrites on existing SKUs (slug and creation
+# date are kept so URLs stay stable)
+UPDATE_FIELDS = [
+    'name', 'category', 'description', 'price', 'old_price', 'stock',
+    'is_active', 'is_featured', 'is_new', 'on_sale', 'image', 'updated_at',
+]
+
+BATCH_SIZE = 500
+
+IMAGE_WORKERS = 4
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class CatalogImportError(ValueError):
+    """Raised for a row that cannot be imported"""
+
+
+def detect_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt='csv'):
+    """Yield one dict per input row without reading the whole stream"""
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def _decimal(value, field, required=False):
+    if value in (None, ''):
+        if required:
+            raise CatalogImportError(f'{field} is required')
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise CatalogImportError(f'Invalid {field}: {value!r}')
+
+
+def _flag(value, default=False):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+class CatalogImporter:
+    """Upserts product rows by SKU in batches"""
+
+    def __init__(self, batch_size=BATCH_SIZE, image_dir=None, workers=IMAGE_WORKERS):
+        self.batch_size = batch_size
+        self.image_dir = image_dir
+        self.workers = workers
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.slugs = set(Product.objects.values_list('slug', flat=True))
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'categories': 0, 'images': 0}
+
+    def run(self, rows):
+        """Import every row; returns counts of what was written"""
+        rows = iter(rows)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catalog-images') as pool:
+                self._pool = pool
+                while True:
+                    batch = list(islice(rows, self.batch_size))
+                    if not batch:
+                        break
+                    self._import_batch(batch)
+        finally:
+            # Batches commit on their own, so the ones written before a bad
+            # row need the caches refreshed too
+            if self.stats['rows'] or self.stats['categories']:
+                self._finish()
+        return self.stats
+
+    def _category_ids(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.categories]
+        if missing:
+            Category.objects.bulk_create(
+                [Category(name=name, slug=slugify(name)) for name in missing], ignore_conflicts=True
+            )
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            for name in missing:
+                if name not in self.categories:
+                    raise CatalogImportError(f'Category {name!r} clashes with the slug of an existing category')
+            self.stats['categories'] += len(missing)
+        return self.categories
+
+    def _slug(self, name, sku):
+        slug = slugify(name)[:200]
+        if slug in self.slugs:
+            slug = slugify(f'{name}-{sku}')[:200]
+        self.slugs.add(slug)
+        return slug
+
+    def _copy_image(self, source):
+        # Runs in the pool: copy into storage and build the resized derivatives
+        with open(source, 'rb') as handle:
+            name = default_storage.save(f'products/{os.path.basename(source)}', File(handle))
+        generate_derivatives(default_storage, name)
+        return name
+
+    def _images_for(self, rows, existing):
+        """Copy the batch's images concurrently; returns {sku: storage name}
+
+        Products that already have an image keep it, so re-importing a file
+        does not copy its images again.
+        """
+        if not self.image_dir:
+            return {}
+        futures = {}
+        for row in rows:
+            if existing.get(row['sku'], (None, ''))[1]:
+                continue
+            image = (row.get('image') or '').strip()
+            source = os.path.join(self.image_dir, image) if image else None
+            if source and os.path.isfile(source):
+                futures[row['sku']] = self._pool.submit(self._copy_image, source)
+        names = {sku: future.result() for sku, future in futures.items()}
+        self.stats['images'] += len(names)
+        return names
+
+    def _import_batch(self, rows):
+        # Rows are matched by SKU, so rows without one (or a name) are skipped
+        keyed = {}
+        for row in rows:
+            row['sku'] = (row.get('sku') or '').strip()
+            if row['sku'] and (row.get('name') or '').strip():
+                # Last row wins when a SKU repeats within the batch
+                keyed[row['sku']] = row
+            else:
+                self.stats['skipped'] += 1
+        rows = list(keyed.values())
+        if not rows:
+            return
+        skus = [row['sku'] for row in rows]
+
+        categories = self._category_ids((row.get('category') or 'Uncategorized').strip() for row in rows)
+        existing = {
+            sku: (slug, image)
+            for sku, slug, image in Product.objects.filter(sku__in=skus).values_list('sku', 'slug', 'image')
+        }
+        images = self._images_for(rows, existing)
+
+        now = timezone.now()
+        products = []
+        for row in rows:
+            sku = row['sku']
+            slug, current_image = existing.get(sku, (None, ''))
+            try:
+                price = _decimal(row.get('price'), 'price', required=True)
+                old_price = _decimal(row.get('old_price'), 'old_price')
+                stock = int(row.get('stock') or 0)
+            except (CatalogImportError, ValueError) as e:
+                raise CatalogImportError(f'SKU {sku}: {e}')
+            image = images.get(sku) or current_image or (row.get('image') or '').strip()
+            products.append(Product(
+                sku=sku,
+                name=row['name'].strip(),
+                slug=slug or self._slug(row['name'], sku),
+                category_id=categories[(row.get('category') or 'Uncategorized').strip()],
+                description=row.get('description') or '',
+                price=price,
+                old_price=old_price,
+                stock=stock,
+                is_active=_flag(row.get('is_active'), default=True),
+                is_featured=_flag(row.get('is_featured')),
+                is_new=_flag(row.get('is_new')),
+                on_sale=_flag(row.get('on_sale')),
+                image=image,
+                primary_image_path=image,
+                effective_price=price,
+                updated_at=now,
+            ))
+
+        upsert = {'update_conflicts': True, 'update_fields': UPDATE_FIELDS}
+        if connection.features.supports_update_conflicts_with_target:
+            upsert['unique_fields'] = ['sku']
+        with transaction.atomic():
+            Product.objects.bulk_create(products, **upsert)
+            batch = Product.objects.filter(sku__in=skus)
+            # Denormalized columns that Product.save would have set
+            batch.exclude(images__is_primary=True).update(primary_image_path=F('image'))
+            batch.refresh_pricing()
+
+        created = len(skus) - len(existing)
+        self.stats['rows'] += len(rows)
+        self.stats['created'] += created
+        self.stats['updated'] += len(existing)
+
+    def _finish(self):
+        # What the per-save receivers in products.signals would have done
+        get_search_backend().rebuild()
+        build_similar()
+        bump_deal_prices_version()
+        bump_facets_version()
+        bump_autocomplete_version()
+        bump_catalog_version()
+
+
+def import_catalog(stream, fmt='csv', **options):
+    """Import a CSV or JSON Lines catalog from a text stream"""
+    return CatalogImporter(**options).run(read_rows(stream, fmt))
+
+
+def export_rows(queryset=None):
+    """Yield one dict per product, reading the catalog in chunks"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    columns = [field if field != 'category' else 'category__name' for field in FIELDS]
+    for values in queryset.order_by('id').values_list(*columns).iterator(chunk_size=2000):
+        yield dict(zip(FIELDS, values))
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def iter_csv(rows):
+    """Encode rows as CSV text, one line at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow([_text(row[field]) for field in FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # The header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(rows):
+    """Encode rows as JSON Lines"""
+    for row in rows:
+        yield json.dumps({field: row[field] for field in FIELDS}, default=str) + '\n'
+
+
+def export_catalog(fmt='csv', queryset=None):
+    """Stream the catalog as text chunks in the given format"""
+    encode = iter_jsonl if fmt == 'jsonl' else iter_csv
+    return encode(export_rows(queryset))
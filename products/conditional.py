@@ -0,0 +1,89 @@
+"""
+Validators for conditional GET (ETag / Last-Modified) on catalog responses.
+
+Used with django.views.decorators.http.condition, so a client that already
+has the current version of a page or of the product modal data gets a 304
+Not Modified instead of the full response.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import get_catalog_version
+from .pricing import deal_prices
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag for catalog pages: the catalog version plus the next deal boundary.
+
+    Catalog pages render the same for every visitor, so the version stamp
+    bumped by products.signals identifies their content. Pending flash
+    messages are per visitor, so those requests always get a full page.
+    """
+    if len(get_messages(request)):
+        return None
+    return _digest('catalog', get_catalog_version(), deal_prices.next_change())
+
+
+def _per_product(queryset, aggregate):
+    """Correlated subquery for one aggregate over a product's rows in queryset"""
+    return Subquery(
+        queryset.filter(product=OuterRef('pk')).order_by().values('product').annotate(value=aggregate).values('value')
+    )
+
+
+def _product_state(request, product_id):
+    """Timestamps and counts that product_detail_api output depends on
+
+    Each relation is aggregated in its own subquery, so reviews, images and
+    deals are never joined into one reviews x images x deals row set.
+    """
+    cache_attr = '_product_state_%s' % product_id
+    if not hasattr(request, cache_attr):
+        from .models import Deal, Product, ProductImage, ProductReview
+
+        now = timezone.now()
+        reviews = ProductReview.objects.all()
+        images = ProductImage.objects.all()
+        deals = Deal.products.through.objects.all()
+        state = Product.objects.filter(pk=product_id, is_active=True).annotate(
+            last_review=_per_product(reviews, Max('updated_at')),
+            review_total=Coalesce(_per_product(reviews, Count('id')), 0),
+            image_total=Coalesce(_per_product(images, Count('id')), 0),
+            last_image=_per_product(images, Max('created_at')),
+            last_deal_change=_per_product(deals, Max('deal__updated_at')),
+            last_deal_start=_per_product(deals, Max('deal__start_date', filter=Q(deal__start_date__lte=now))),
+            last_deal_end=_per_product(deals, Max('deal__end_date', filter=Q(deal__end_date__lte=now))),
+        ).values(
+            'updated_at', 'category__updated_at', 'last_review', 'review_total', 'image_total',
+            'last_image', 'last_deal_change', 'last_deal_start', 'last_deal_end',
+        ).first()
+        setattr(request, cache_attr, state)
+    return getattr(request, cache_attr)
+
+
+def product_last_modified(request, product_id):
+    """Latest change to the product, its category, reviews, images or deals"""
+    state = _product_state(request, product_id)
+    if state is None:
+        return None
+    return max(
+        value for key, value in state.items()
+        if value is not None and key not in ('review_total', 'image_total')
+    )
+
+
+def product_etag(request, product_id):
+    """ETag covering everything product_detail_api returns"""
+    state = _product_state(request, product_id)
+    if state is None:
+        return None
+    entry = deal_prices.get(product_id)
+    return _digest('product', product_id, *state.values(), entry)
@@ -0,0 +1,111 @@
+"""
+Deal lifecycle scheduler.
+
+A published deal is 'scheduled' before its start_date, 'active' through its
+end_date and 'expired' afterwards. Storefront queries check the dates as
+well (DealQuerySet.active()), so a late status flip never keeps an ended
+deal's price; keeping status current matters for the admin pages, the
+"new deal" notification and the status filters. DealScheduler keeps a
+min-heap of the upcoming start and end boundaries and flips a deal's status
+as soon as its boundary passes; the run_deal_scheduler management command
+drives it. Status changes go through Deal.save(), so the usual post_save
+receivers expire deal prices and cached catalog pages and send the "new
+deal" notification once.
+"""
+import heapq
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import get_version
+from .models import Deal
+from .pricing import DEAL_PRICES_VERSION_KEY
+
+
+# Re-read all deal boundaries at least this often (seconds)
+RELOAD_INTERVAL = 300
+
+# How often (seconds) to look for deals added or edited elsewhere
+POLL_INTERVAL = 5
+
+# A deal is live through end_date itself, so it expires just after
+END_MARGIN = timedelta(microseconds=1)
+
+
+def overdue_deals(now):
+    """Published deals whose status no longer matches their dates"""
+    return Deal.objects.filter(
+        Q(status='scheduled', start_date__lte=now)
+        | Q(status='active', start_date__gt=now)
+        | Q(status__in=Deal.LIVE_STATUSES, end_date__lt=now)
+    )
+
+
+def sync_deal_statuses(now=None):
+    """Give every overdue deal its current status; returns the deals changed"""
+    now = now or timezone.now()
+    changed = []
+    for deal in overdue_deals(now):
+        deal.status = deal.status_at(now)
+        deal.save(update_fields=['status', 'updated_at'])
+        changed.append(deal)
+    return changed
+
+
+class DealScheduler:
+    """Flips deal statuses exactly when deals start and end"""
+
+    def __init__(self):
+        self._heap = []
+        self._version = None
+        self._loaded_at = None
+
+    def load(self, now):
+        """Rebuild the heap of (boundary, deal_id) from published deals"""
+        heap = []
+        for deal_id, start, end in Deal.objects.filter(status__in=Deal.LIVE_STATUSES).values_list(
+            'id', 'start_date', 'end_date'
+        ):
+            if start > now:
+                heap.append((start, deal_id))
+            if end + END_MARGIN > now:
+                heap.append((end + END_MARGIN, deal_id))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._version = get_version(DEAL_PRICES_VERSION_KEY)
+        self._loaded_at = now
+
+    def _stale(self, now):
+        # Saving a deal bumps the deal prices version, in any process
+        return (
+            self._loaded_at is None
+            or now - self._loaded_at >= timedelta(seconds=RELOAD_INTERVAL)
+            or get_version(DEAL_PRICES_VERSION_KEY) != self._version
+        )
+
+    def next_boundary(self):
+        return self._heap[0][0] if self._heap else None
+
+    def tick(self, now=None):
+        """Apply every boundary that has passed; returns the deals changed"""
+        now = now or timezone.now()
+        if self._stale(now):
+            changed = sync_deal_statuses(now)
+            self.load(now)
+            return changed
+
+        due = False
+        while self._heap and self._heap[0][0] <= now:
+            heapq.heappop(self._heap)
+            due = True
+        return sync_deal_statuses(now) if due else []
+
+    def seconds_until_next(self, now=None):
+        """How long the worker may sleep before the next tick"""
+        now = now or timezone.now()
+        wait = POLL_INTERVAL
+        boundary = self.next_boundary()
+        if boundary is not None:
+            wait = min(wait, (boundary - now).total_seconds())
+        return max(0.0, wait)
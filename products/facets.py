@@ -0,0 +1,102 @@
+"""
+Facet counts for the product list sidebar.
+
+All facets come from one grouped query: rows are grouped by category and
+each row carries conditional counts for stock, sale status and price
+buckets. Counts for the unfiltered catalog are cached until a product,
+category or deal changes (see products.signals).
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import bump_version, get_version
+
+
+FACETS_VERSION_KEY = 'products:facets_version'
+
+FACETS_TIMEOUT = 60 * 60 * 24
+
+# (min, max) price buckets; max is exclusive and None means no upper bound
+PRICE_BUCKETS = [
+    (0, 1000),
+    (1000, 5000),
+    (5000, 10000),
+    (10000, 20000),
+    (20000, 50000),
+    (50000, None),
+]
+
+
+def bump_facets_version():
+    """Invalidate cached catalog facet counts"""
+    bump_version(FACETS_VERSION_KEY)
+
+
+def _bucket_filter(low, high):
+    # Buckets follow the price shoppers pay, after deals
+    condition = Q(current_price__gte=low)
+    if high is not None:
+        condition &= Q(current_price__lt=high)
+    return condition
+
+
+def _grouped_counts(queryset):
+    """Run the single grouped query: one row per category
+
+    queryset must carry ProductQuerySet.with_current_pricing().
+    """
+    bucket_counts = {
+        f'price_{index}': Count('id', filter=_bucket_filter(low, high))
+        for index, (low, high) in enumerate(PRICE_BUCKETS)
+    }
+    rows = queryset.order_by().values('category_id').annotate(
+        total=Count('id'),
+        in_stock=Count('id', filter=Q(stock__gt=0)),
+        on_sale=Count('id', filter=Q(on_sale=True)),
+        **bucket_counts
+    )
+    return list(rows)
+
+
+def _summarize(rows, selected_categories):
+    selected = set(selected_categories or [])
+    in_scope = [row for row in rows if not selected or row['category_id'] in selected]
+    return {
+        'categories': {row['category_id']: row['total'] for row in rows},
+        'total': sum(row['total'] for row in in_scope),
+        'in_stock': sum(row['in_stock'] for row in in_scope),
+        'on_sale': sum(row['on_sale'] for row in in_scope),
+        'price_buckets': [
+            {'min': low, 'max': high, 'count': sum(row[f'price_{index}'] for row in in_scope)}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def compute_facets(queryset, selected_categories=None):
+    """Facet counts for a product queryset.
+
+    queryset should carry every active filter except the category filter, so
+    each category shows how many products it would add. Stock, sale and
+    price counts are limited to the selected categories (all when empty).
+    """
+    return _summarize(_grouped_counts(queryset), selected_categories)
+
+
+def catalog_facets(selected_categories=None):
+    """Facet counts for all active products, cached per catalog version
+
+    While a deal has ended but still says active, stored prices lag behind
+    and the counts are computed live without caching.
+    """
+    from .models import Deal, Product
+
+    products = Product.objects.filter(is_active=True)
+    if Deal.objects.lapsed().exists():
+        return _summarize(_grouped_counts(products.with_current_pricing()), selected_categories)
+    key = f'products:facets:{get_version(FACETS_VERSION_KEY)}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = _grouped_counts(products.with_current_pricing())
+        cache.set(key, rows, timeout=FACETS_TIMEOUT)
+    return _summarize(rows, selected_categories)
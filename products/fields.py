@@ -0,0 +1,60 @@
+"""
+Image field with srcset-ready access to resized derivatives.
+"""
+from django.db import models
+from django.db.models.fields.files import ImageFieldFile
+
+from .images import DERIVATIVE_SIZES, derivative_name, has_derivatives
+
+
+class ResponsiveImageFieldFile(ImageFieldFile):
+    """ImageFieldFile that also knows the URLs of its derivatives
+
+    Until the derivatives exist every URL falls back to the original
+    upload and the srcset properties are empty.
+    """
+
+    @property
+    def has_derivatives(self):
+        return bool(self) and has_derivatives(self.storage, self.name)
+
+    def derivative_url(self, size, fmt='jpeg'):
+        """URL of one derivative size, or the original when not generated yet"""
+        if not self.has_derivatives:
+            return self.url
+        return self.storage.url(derivative_name(self.name, size, fmt))
+
+    def srcset_for(self, fmt):
+        if not self.has_derivatives:
+            return ''
+        return ', '.join(
+            f'{self.storage.url(derivative_name(self.name, size, fmt))} {width}w'
+            for size, width in DERIVATIVE_SIZES.items()
+        )
+
+    @property
+    def thumbnail_url(self):
+        return self.derivative_url('thumbnail')
+
+    @property
+    def card_url(self):
+        return self.derivative_url('card')
+
+    @property
+    def zoom_url(self):
+        return self.derivative_url('zoom')
+
+    @property
+    def srcset(self):
+        """WebP srcset (empty until derivatives exist)"""
+        return self.srcset_for('webp')
+
+    @property
+    def jpeg_srcset(self):
+        """JPEG srcset for browsers without WebP (empty until derivatives exist)"""
+        return self.srcset_for('jpeg')
+
+
+class ResponsiveImageField(models.ImageField):
+    """ImageField whose files expose thumbnail/card/zoom derivatives"""
+    attr_class = ResponsiveImageFieldFile
@@ -0,0 +1,124 @@
+"""
+Resized image derivatives for catalog images.
+
+Each uploaded image gets thumbnail, card and zoom sized copies in WebP and
+JPEG under media/derivatives/, mirroring the original path. They are built
+in a background thread after the upload is committed (see products.signals)
+or in bulk with the generate_image_derivatives management command, and are
+exposed to templates through ResponsiveImageField (see products.fields).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+
+
+# Derivative name -> width in pixels (height keeps the aspect ratio)
+DERIVATIVE_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'zoom': 1600,
+}
+
+# Format -> (file extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DERIVATIVE_ROOT = 'derivatives'
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+# Derivative sets known to be complete; files are never rewritten under the
+# same name, so a positive answer can be kept for the life of the process
+_complete = set()
+_complete_lock = threading.Lock()
+
+
+def derivative_name(name, size, fmt):
+    """Storage name of one derivative of the original file name.
+
+    The original extension stays in the name (foo.jpg.card.webp), so foo.jpg
+    and foo.png never share derivatives.
+    """
+    extension = DERIVATIVE_FORMATS[fmt][0]
+    return f'{DERIVATIVE_ROOT}/{name}.{size}.{extension}'
+
+
+def _last_derivative(name):
+    # generate_derivatives writes this one last, so it marks a complete set
+    return derivative_name(name, list(DERIVATIVE_SIZES)[-1], list(DERIVATIVE_FORMATS)[-1])
+
+
+def has_derivatives(storage, name):
+    """Whether every derivative of the file has been generated"""
+    if name in _complete:
+        return True
+    if storage.exists(_last_derivative(name)):
+        with _complete_lock:
+            _complete.add(name)
+        return True
+    return False
+
+
+def _resize(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def generate_derivatives(storage, name, force=False):
+    """Write every size and format of one image; returns the number written"""
+    if not force and has_derivatives(storage, name):
+        return 0
+    with storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha channel; flatten transparent images onto white
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, 'white')
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    written = 0
+    for size, width in DERIVATIVE_SIZES.items():
+        resized = _resize(image, width)
+        for fmt, (_, options) in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            target = derivative_name(name, size, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+    with _complete_lock:
+        _complete.add(name)
+    return written
+
+
+def _generate_in_background(storage, name):
+    try:
+        generate_derivatives(storage, name)
+    except Exception as e:
+        print(f"Image derivatives failed for {name}: {e}")
+        return
+    # Cached pages still point at the original upload
+    bump_catalog_version()
+
+
+def schedule_derivatives(field_file):
+    """Build an image's derivatives off the request path once the save commits"""
+    if not field_file or has_derivatives(field_file.storage, field_file.name):
+        return
+    storage, name = field_file.storage, field_file.name
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, storage, name))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from products.recommendations import TOP_K, build_bought_together, build_similar
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed recommendations: frequently bought together (order history) and similar products (TF-IDF)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours to keep per product')
+
+    def handle(self, *args, **options):
+        rows = build_bought_together(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} frequently-bought-together recommendation(s)'))
+        rows = build_similar(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} similar-product recommendation(s)'))
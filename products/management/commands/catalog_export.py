@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.catalog_io import detect_format, export_catalog
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or JSON Lines file (stdout by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Output format (default: from the file extension, else csv)')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or (detect_format(output) if output else 'csv')
+        if not output:
+            for chunk in export_catalog(fmt):
+                sys.stdout.write(chunk)
+            return
+        with open(output, 'w', newline='', encoding='utf-8') as stream:
+            for chunk in export_catalog(fmt):
+                stream.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Exported the catalog to {output}'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_io import BATCH_SIZE, IMAGE_WORKERS, CatalogImportError, detect_format, import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by SKU from a CSV or JSON Lines file ("-" reads stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV/JSONL file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per bulk upsert')
+        parser.add_argument('--images', help='Directory holding the image files named in the image column')
+        parser.add_argument('--workers', type=int, default=IMAGE_WORKERS, help='Threads copying and resizing images')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        options_ = {
+            'batch_size': options['batch_size'],
+            'image_dir': options['images'],
+            'workers': options['workers'],
+        }
+        try:
+            if path == '-':
+                stats = import_catalog(sys.stdin, fmt, **options_)
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    stats = import_catalog(stream, fmt, **options_)
+        except (OSError, CatalogImportError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} row(s): {stats['created']} created, {stats['updated']} updated, "
+            f"{stats['skipped']} skipped without sku/name, "
+            f"{stats['categories']} new categor{'y' if stats['categories'] == 1 else 'ies'}, "
+            f"{stats['images']} image(s)"
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.models import SlideshowImage
+from products.cache import bump_catalog_version
+from products.images import generate_derivatives
+from products.models import Deal, Product, ProductImage
+
+
+IMAGE_FIELDS = [
+    (Product, 'image'),
+    (ProductImage, 'image'),
+    (Deal, 'banner_image'),
+    (SlideshowImage, 'image'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail, card and zoom derivatives (WebP and JPEG) for catalog images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for model, field_name in IMAGE_FIELDS:
+            names = model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list(field_name, flat=True).distinct()
+            storage = model._meta.get_field(field_name).storage
+            for name in names:
+                try:
+                    if generate_derivatives(storage, name, force=options['force']):
+                        generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__}.{field_name} {name}: {e}')
+        if generated:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {generated} image(s), {failed} failed'))
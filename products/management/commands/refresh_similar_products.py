@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.recommendations import REFRESH_INTERVAL, TOP_K, refresh_stale_similar
+
+
+class Command(BaseCommand):
+    help = 'Update similar-product lists of products whose name, description or category changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Refresh once and exit (for cron)')
+        parser.add_argument('--interval', type=int, default=REFRESH_INTERVAL, help='Seconds between sweeps')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours to keep per product')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self._report(refresh_stale_similar(top_k=options['top_k']))
+            return
+
+        self.stdout.write('Refreshing similar products of edited products (Ctrl+C to stop)')
+        try:
+            while True:
+                self._report(refresh_stale_similar(top_k=options['top_k']))
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Similar products refresh stopped')
+
+    def _report(self, refreshed):
+        if refreshed:
+            self.stdout.write(self.style.SUCCESS(f'Refreshed similar products of {refreshed} product(s)'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.deal_scheduler import DealScheduler, sync_deal_statuses
+
+
+class Command(BaseCommand):
+    help = 'Start and end deals on time: flips deal statuses at their start and end dates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Sync overdue deal statuses once and exit (for cron)')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self._report(sync_deal_statuses())
+            return
+
+        scheduler = DealScheduler()
+        self.stdout.write('Deal scheduler running (Ctrl+C to stop)')
+        try:
+            while True:
+                self._report(scheduler.tick())
+                time.sleep(scheduler.seconds_until_next())
+        except KeyboardInterrupt:
+            self.stdout.write('Deal scheduler stopped')
+
+    def _report(self, deals):
+        for deal in deals:
+            self.stdout.write(self.style.SUCCESS(f'{deal.title}: now {deal.get_status_display().lower()}'))
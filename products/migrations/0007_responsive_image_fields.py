@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+import products.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deal',
+            name='banner_image',
+            field=products.fields.ResponsiveImageField(blank=True, null=True, upload_to='deals/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=products.fields.ResponsiveImageField(upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=products.fields.ResponsiveImageField(upload_to='products/gallery/'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+def fill_primary_image_path(apps, schema_editor):
+    """Resolve the primary image of existing products"""
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    gallery_primary = dict(
+        ProductImage.objects.filter(is_primary=True).order_by('order').values_list('product_id', 'image')
+    )
+    for product_id, image in Product.objects.values_list('id', 'image'):
+        path = gallery_primary.get(product_id) or image or ''
+        Product.objects.filter(pk=product_id).update(primary_image_path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_responsive_image_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(fill_primary_image_path, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+
+
+def backfill_rating_counters(apps, schema_editor):
+    """Recount rating aggregates of existing products from their reviews"""
+    Product = apps.get_model('products', 'Product')
+    stats = Product.objects.annotate(
+        avg_rating=Avg('reviews__rating'),
+        total_reviews=Count('reviews'),
+        total_rating=Sum('reviews__rating'),
+        **{f'stars_{star}': Count('reviews', filter=Q(reviews__rating=star)) for star in range(1, 6)}
+    ).values_list('id', 'avg_rating', 'total_reviews', 'total_rating', *[f'stars_{star}' for star in range(1, 6)])
+    for product_id, avg_rating, total_reviews, total_rating, *stars in stats:
+        Product.objects.filter(pk=product_id).update(
+            rating=avg_rating or 0,
+            reviews_count=total_reviews,
+            rating_sum=total_rating or 0,
+            **{f'rating_{star}': count for star, count in zip(range(1, 6), stars)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_alter_productrecommendation_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
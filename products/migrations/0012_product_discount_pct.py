@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:00
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def _percent(original, final):
+    return int(((original - final) * 100 / original).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def fill_discount_pct(apps, schema_editor):
+    """Store the current discount of existing products"""
+    Product = apps.get_model('products', 'Product')
+    Deal = apps.get_model('products', 'Deal')
+
+    # Best active deal per product, same ranking as DealQuerySet.best_first()
+    best_deal = {}
+    deals = Deal.objects.filter(status='active').order_by('-discount_percentage', '-discount_amount', '-created_at')
+    for deal in deals.prefetch_related('products'):
+        for product in deal.products.all():
+            best_deal.setdefault(product.pk, deal)
+
+    for product_id, price, old_price in Product.objects.values_list('id', 'price', 'old_price'):
+        deal = best_deal.get(product_id)
+        if deal and price > 0:
+            if deal.deal_type == 'fixed' and deal.discount_amount:
+                final = max(Decimal('0.00'), price - deal.discount_amount)
+            elif deal.deal_type == 'percentage' and deal.discount_percentage:
+                final = price - price * deal.discount_percentage / Decimal('100')
+            else:
+                final = price
+            pct = _percent(price, final)
+        elif old_price and old_price > price:
+            pct = _percent(old_price, price)
+        else:
+            pct = 0
+        if pct:
+            Product.objects.filter(pk=product_id).update(discount_pct=pct)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_pct',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(fill_discount_pct, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:00
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def fill_effective_price(apps, schema_editor):
+    """Store the price after the best active deal for existing products"""
+    Product = apps.get_model('products', 'Product')
+    Deal = apps.get_model('products', 'Deal')
+
+    # Best active deal per product, same ranking as DealQuerySet.best_first()
+    best_deal = {}
+    deals = Deal.objects.filter(status='active').order_by('-discount_percentage', '-discount_amount', '-created_at')
+    for deal in deals.prefetch_related('products'):
+        for product in deal.products.all():
+            best_deal.setdefault(product.pk, deal)
+
+    for product_id, price in Product.objects.values_list('id', 'price'):
+        deal = best_deal.get(product_id)
+        final = price
+        if deal and deal.deal_type == 'fixed' and deal.discount_amount:
+            final = max(Decimal('0.00'), price - deal.discount_amount)
+        elif deal and deal.deal_type == 'percentage' and deal.discount_percentage:
+            final = price - price * deal.discount_percentage / Decimal('100')
+        Product.objects.filter(pk=product_id).update(
+            effective_price=final.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_discount_pct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:00
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def _discounted(deal, price):
+    # Deal.discounted_price() as of this migration
+    if deal.deal_type == 'fixed' and deal.discount_amount:
+        return max(Decimal('0.00'), price - deal.discount_amount)
+    if deal.deal_type == 'percentage' and deal.discount_percentage:
+        return price - price * Decimal(deal.discount_percentage) / Decimal('100')
+    return price
+
+
+def sync_statuses(apps, schema_editor):
+    """Expire or start deals whose status lags behind their dates.
+
+    Uses plain UPDATEs on the historical models, so no receivers run (no
+    "new deal" notifications during migrate), then re-stores each product's
+    effective_price and discount_pct, which were filled from status alone.
+    """
+    Deal = apps.get_model('products', 'Deal')
+    Product = apps.get_model('products', 'Product')
+    now = timezone.now()
+
+    published = Deal.objects.filter(status__in=('scheduled', 'active'))
+    published.filter(end_date__lt=now).update(status='expired')
+    published.filter(start_date__gt=now).update(status='scheduled')
+    published.filter(start_date__lte=now, end_date__gte=now).update(status='active')
+
+    # Best live deal per product, as Deal.objects.active().best_first()
+    best = {}
+    live = Deal.objects.filter(status='active', start_date__lte=now, end_date__gte=now).order_by(
+        '-discount_percentage', '-discount_amount', '-created_at'
+    )
+    for deal in live.prefetch_related('products'):
+        for product in deal.products.all():
+            best.setdefault(product.pk, deal)
+
+    for product in Product.objects.only('id', 'price', 'old_price', 'effective_price', 'discount_pct'):
+        price = Decimal(product.price)
+        deal = best.get(product.pk)
+        final = _discounted(deal, price) if deal else price
+        effective_price = final.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        original = None
+        if deal and price > 0:
+            original = price
+        elif product.old_price and Decimal(product.old_price) > price:
+            original, final = Decimal(product.old_price), price
+        discount_pct = 0
+        if original:
+            discount_pct = int(((original - final) * 100 / original).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        if (effective_price, discount_pct) != (product.effective_price, product.discount_pct):
+            Product.objects.filter(pk=product.pk).update(effective_price=effective_price, discount_pct=discount_pct)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_statuses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_sync_deal_statuses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='similar_stale',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
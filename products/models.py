@@ -1,8 +1,20 @@
-from django.db import models
+from collections import Counter, defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, FloatField, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 from django.conf import settings
 
+from .cache import bump_catalog_version
+from .fields import ResponsiveImageField
+from .pricing import deal_prices
+from .reviews import bump_reviews_version
+
 
 class Category(models.Model):
     """Product categories"""
@@ -31,6 +43,107 @@ class Category(models.Model):
         return reverse('products:category', kwargs={'slug': self.slug})
 
 
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+PERCENT = models.PositiveSmallIntegerField()
+
+
+def _best_deal_price(best_deals):
+    """Subquery for a product's price under the first of best_deals (NULL when none)"""
+    return Subquery(
+        best_deals.annotate(deal_price=Deal.price_expression(OuterRef('price'))).values('deal_price')[:1],
+        output_field=MONEY,
+    )
+
+
+def _live_pricing(at=None):
+    """(effective_price, discount_pct) SQL expressions from the deals live at a time"""
+    best_deals = Deal.objects.active(at).best_first().filter(products=OuterRef('pk'))
+    deal_price = _best_deal_price(best_deals)
+    # Cast, or SQLite divides whole-number prices as integers
+    deal_pct = Round(Cast(F('price') - deal_price, FloatField()) * Value(100) / F('price'), output_field=PERCENT)
+    sale_pct = Case(
+        When(old_price__gt=F('price'),
+             then=Round(Cast(F('old_price') - F('price'), FloatField()) * Value(100) / F('old_price'),
+                        output_field=PERCENT)),
+        default=Value(0),
+        output_field=PERCENT,
+    )
+    effective_price = Round(Coalesce(deal_price, F('price')), 2, output_field=MONEY)
+    discount_pct = Case(
+        When(price__gt=0, then=Coalesce(deal_pct, sale_pct)),
+        default=sale_pct,
+        output_field=PERCENT,
+    )
+    return effective_price, discount_pct
+
+
+class ProductQuerySet(models.QuerySet):
+    """Product queryset with storefront helpers"""
+    
+    def with_pricing(self, at=None):
+        """Annotate deal-aware pricing so product cards need no extra queries.
+        
+        Resolves the best active deal and the final price in the same SQL
+        statement as the products themselves; original price, savings amount
+        and savings percentage are derived from those without touching the
+        database again.
+        """
+        best_deals = Deal.objects.active(at).best_first().filter(products=OuterRef('pk'))
+        return self.annotate(
+            pricing_deal_id=Subquery(best_deals.values('pk')[:1]),
+            pricing_final_price=Coalesce(_best_deal_price(best_deals), F('price'), output_field=MONEY),
+        )
+    
+    def with_current_pricing(self, at=None):
+        """Annotate current_price and current_discount_pct for filters and sorts.
+        
+        They are the stored effective_price and discount_pct, so the indexes
+        on those columns are used, except for products of deals that ended
+        while their status still says active (run_deal_scheduler has not
+        caught up): those are priced from the deal dates, as with_pricing()
+        does.
+        """
+        at = at or timezone.now()
+        lapsed = Deal.objects.lapsed(at)
+        if not lapsed.exists():
+            return self.annotate(current_price=F('effective_price'), current_discount_pct=F('discount_pct'))
+        stale = Q(pk__in=Deal.products.through.objects.filter(deal__in=lapsed).values('product_id'))
+        live_price, live_pct = _live_pricing(at)
+        return self.annotate(
+            current_price=Case(When(stale, then=live_price), default=F('effective_price'), output_field=MONEY),
+            current_discount_pct=Case(When(stale, then=live_pct), default=F('discount_pct'), output_field=PERCENT),
+        )
+    
+    def refresh_pricing(self):
+        """Recompute the stored effective_price and discount_pct in one UPDATE.
+        
+        Mirrors Product._resolve_pricing(); called when deals start, end or
+        change their products, and after bulk price changes.
+        """
+        effective_price, discount_pct = _live_pricing()
+        return self.update(effective_price=effective_price, discount_pct=discount_pct)
+    
+    def apply_ratings(self, added=(), removed=()):
+        """Add/remove star ratings in the running review aggregates with one UPDATE"""
+        stars = Counter(added)
+        stars.subtract(removed)
+        new_sum = F('rating_sum') + (sum(added) - sum(removed))
+        new_count = F('reviews_count') + (len(added) - len(removed))
+        return self.update(
+            rating_sum=new_sum,
+            reviews_count=new_count,
+            rating=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, Value(0)), Value(0.0)),
+            **{f'rating_{star}': F(f'rating_{star}') + delta for star, delta in stars.items() if delta}
+        )
+    
+    def with_gallery(self):
+        """Prefetch gallery images in display order (one query for all products)"""
+        return self.prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.order_by('order', '-is_primary'))
+        )
+
+
 class Product(models.Model):
     """Product model"""
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
@@ -39,18 +152,42 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     old_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
-    image = models.ImageField(upload_to='products/')
+    image = ResponsiveImageField(upload_to='products/')
+    # Storage name of the primary gallery image, or of the main image when the
+    # gallery has none; kept in sync by Product.save and ProductImage.save
+    primary_image_path = models.CharField(max_length=255, blank=True, default='')
     stock = models.PositiveIntegerField(default=0)
     sku = models.CharField(max_length=100, blank=True, null=True, unique=True)
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     is_new = models.BooleanField(default=False)
     on_sale = models.BooleanField(default=False)
+    # Denormalized pricing for SQL filters and sorts, kept in sync by
+    # Product.save and ProductQuerySet.refresh_pricing: the price after the
+    # best active deal, and the savings in percent (best active deal, else
+    # the old_price markdown), rounded. Read them through
+    # ProductQuerySet.with_current_pricing(), which covers deals that ended
+    # before run_deal_scheduler caught up.
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_index=True)
+    discount_pct = models.PositiveSmallIntegerField(default=0, db_index=True)
+    # Set when name, description or category change; the
+    # refresh_similar_products command updates the product's similar list
+    # and clears it
+    similar_stale = models.BooleanField(default=False, db_index=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     reviews_count = models.PositiveIntegerField(default=0)
+    # Running review aggregates, updated in SQL by ProductQuerySet.apply_ratings
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
@@ -59,10 +196,70 @@ class Product(models.Model):
     def __str__(self):
         return self.name
     
+    # Fields the "similar products" vectors are built from
+    SIMILARITY_FIELDS = ('name', 'description', 'category_id')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_similarity = instance._similarity_values()
+        return instance
+    
+    def _similarity_values(self):
+        # Deferred fields are left out rather than loaded
+        return {field: self.__dict__[field] for field in self.SIMILARITY_FIELDS if field in self.__dict__}
+    
+    @property
+    def similarity_changed(self):
+        """Whether name, description or category differ from the loaded row"""
+        loaded = getattr(self, '_loaded_similarity', None)
+        if loaded is None:
+            return True
+        return any(field not in loaded or loaded[field] != value
+                   for field, value in self._similarity_values().items())
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        self.primary_image_path = self._resolve_primary_image_path()
+        self.effective_price, self.discount_pct = self._resolve_pricing()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'primary_image_path', 'effective_price', 'discount_pct'
+            }
         super().save(*args, **kwargs)
+        # post_save receivers have compared against the old values by now
+        self._loaded_similarity = self._similarity_values()
+    
+    def _resolve_pricing(self):
+        """(effective_price, discount_pct) as stored by refresh_pricing()"""
+        price = Decimal(self.price)
+        deal = None
+        if self.pk:
+            deal = Deal.objects.active().best_first().filter(products=self).first()
+        final = deal.discounted_price(price) if deal else price
+        effective_price = final.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        
+        original = None
+        if deal and price > 0:
+            original = price
+        elif self.old_price and Decimal(self.old_price) > price:
+            original, final = Decimal(self.old_price), price
+        if not original:
+            return effective_price, 0
+        discount_pct = int(((original - final) * 100 / original).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        return effective_price, discount_pct
+    
+    def _resolve_primary_image_path(self):
+        primary = None
+        if self.pk:
+            primary = self.images.filter(is_primary=True).values_list('image', flat=True).first()
+        return primary or (self.image.name if self.image else '')
+    
+    def refresh_primary_image(self):
+        """Recompute primary_image_path after the gallery changed"""
+        self.primary_image_path = self._resolve_primary_image_path()
+        Product.objects.filter(pk=self.pk).update(primary_image_path=self.primary_image_path)
     
     def get_absolute_url(self):
         return reverse('products:detail', kwargs={'slug': self.slug})
@@ -77,38 +274,37 @@ class Product(models.Model):
             return int(((self.old_price - self.price) / self.old_price) * 100)
         return 0
     
+    def _has_pricing(self):
+        """True when this instance was loaded through with_pricing()"""
+        return 'pricing_final_price' in self.__dict__
+    
     @property
     def has_active_deal(self):
         """Check if product has an active deal"""
-        from django.utils import timezone
-        now = timezone.now()
-        return self.deals.filter(
-            status='active',
-            start_date__lte=now,
-            end_date__gte=now
-        ).exists()
+        if self._has_pricing():
+            return self.pricing_deal_id is not None
+        return deal_prices.get(self.pk) is not None
     
     @property
     def active_deal(self):
-        """Get the first active deal for this product"""
-        from django.utils import timezone
-        now = timezone.now()
-        return self.deals.filter(
-            status='active',
-            start_date__lte=now,
-            end_date__gte=now
-        ).first()
+        """Get the best active deal for this product"""
+        if self._has_pricing():
+            deal_id = self.pricing_deal_id
+        else:
+            entry = deal_prices.get(self.pk)
+            deal_id = entry.deal_id if entry else None
+        if not deal_id:
+            return None
+        return deal_prices.get_deal(deal_id) or Deal.objects.filter(pk=deal_id).first()
     
     @property
     def discounted_price(self):
         """Get price after applying active deal discount"""
-        deal = self.active_deal
-        if deal:
-            if deal.deal_type == 'percentage' and deal.discount_percentage:
-                discount = float(self.price) * (float(deal.discount_percentage) / 100)
-                return float(self.price) - discount
-            elif deal.deal_type == 'fixed' and deal.discount_amount:
-                return max(0, float(self.price) - float(deal.discount_amount))
+        if self._has_pricing():
+            return float(self.pricing_final_price)
+        entry = deal_prices.get(self.pk)
+        if entry:
+            return float(entry.final_price)
         return float(self.price)
     
     @property
@@ -142,12 +338,27 @@ class Product(models.Model):
         return 0
     
     def update_rating(self):
-        """Update product rating and review count"""
-        from django.db.models import Avg, Count
-        stats = self.reviews.aggregate(avg_rating=Avg('rating'), total_reviews=Count('id'))
-        self.rating = stats['avg_rating'] or 0.00
-        self.reviews_count = stats['total_reviews'] or 0
-        self.save(update_fields=['rating', 'reviews_count'])
+        """Recount product rating aggregates from scratch (repairs drifted counters)"""
+        from django.db.models import Avg, Count, Q, Sum
+        stats = self.reviews.aggregate(
+            avg_rating=Avg('rating'),
+            total_reviews=Count('id'),
+            rating_sum=Sum('rating'),
+            **{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)}
+        )
+        self.rating = stats.pop('avg_rating') or 0.00
+        self.reviews_count = stats.pop('total_reviews') or 0
+        self.rating_sum = stats.pop('rating_sum') or 0
+        for field, value in stats.items():
+            setattr(self, field, value)
+        Product.objects.filter(pk=self.pk).update(
+            rating=self.rating, reviews_count=self.reviews_count, rating_sum=self.rating_sum, **stats
+        )
+    
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, e.g. {'5': 12, '4': 3, ..., '1': 0}"""
+        return {str(star): getattr(self, f'rating_{star}') for star in range(5, 0, -1)}
     
     def get_all_images(self):
         """Get all images including the main image"""
@@ -158,7 +369,7 @@ class Product(models.Model):
                 'url': self.image.url,
                 'is_primary': True
             })
-        # Add additional images
+        # Add additional images (from the with_gallery() prefetch when present)
         for img in self.images.all():
             images.append({
                 'url': img.image.url,
@@ -168,9 +379,13 @@ class Product(models.Model):
     
     def get_primary_image(self):
         """Get the primary image (either main image or marked primary from gallery)"""
-        primary_gallery = self.images.filter(is_primary=True).first()
-        if primary_gallery:
-            return primary_gallery.image.url
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            for img in self.images.all():
+                if img.is_primary:
+                    return img.image.url
+            return self.image.url if self.image else None
+        if self.primary_image_path:
+            return self.image.storage.url(self.primary_image_path)
         return self.image.url if self.image else None
 
 
@@ -198,7 +413,7 @@ class Slide(models.Model):
 class ProductImage(models.Model):
     """Multiple images for a product"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/gallery/')
+    image = ResponsiveImageField(upload_to='products/gallery/')
     order = models.PositiveIntegerField(default=0)
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -216,6 +431,30 @@ class ProductImage(models.Model):
         if self.is_primary:
             ProductImage.objects.filter(product=self.product, is_primary=True).exclude(id=self.id).update(is_primary=False)
         super().save(*args, **kwargs)
+        self.product.refresh_primary_image()
+
+
+class ProductReviewQuerySet(models.QuerySet):
+    """Review queryset with bulk submission"""
+    
+    def bulk_submit(self, reviews):
+        """Create many reviews in one transaction, updating each product's aggregates once"""
+        ratings = defaultdict(list)
+        for review in reviews:
+            ratings[review.product_id].append(review.rating)
+        with transaction.atomic():
+            created = self.bulk_create(reviews)
+            for product_id, added in ratings.items():
+                Product.objects.filter(pk=product_id).apply_ratings(added=added)
+            # bulk_create sends no post_save, so expire review caches here
+            transaction.on_commit(lambda: _reviews_changed(list(ratings)))
+        return created
+
+
+def _reviews_changed(product_ids):
+    for product_id in product_ids:
+        bump_reviews_version(product_id)
+    bump_catalog_version()
 
 
 class ProductReview(models.Model):
@@ -237,10 +476,76 @@ class ProductReview(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.product.name} ({self.rating} stars)"
     
+    objects = ProductReviewQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+        previous = None
+        if not adding:
+            previous = ProductReview.objects.filter(pk=self.pk).values_list('rating', flat=True).first()
         super().save(*args, **kwargs)
-        # Update product's average rating and review count
-        self.product.update_rating()
+        # Update product's running rating aggregates in place
+        products = Product.objects.filter(pk=self.product_id)
+        if adding:
+            products.apply_ratings(added=[self.rating])
+        elif previous is not None and previous != self.rating:
+            products.apply_ratings(added=[self.rating], removed=[previous])
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed top-K neighbours of a product (see products.recommendations)"""
+    KIND_CHOICES = [
+        ('bought_together', 'Frequently bought together'),
+        ('similar', 'Similar products'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        verbose_name = 'Product Recommendation'
+        verbose_name_plural = 'Product Recommendations'
+        ordering = ['product', 'kind', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind', 'rank'], name='unique_recommendation_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.kind} #{self.rank})"
+
+
+# Sent once after Deal.apply_to_products() rewrote product prices. The bulk
+# UPDATE sends no post_save, so receivers get the deal and product_ids instead.
+deal_applied = Signal()
+
+# Sent by orders.stock once stock taken or returned with bulk UPDATEs is
+# committed; receivers get the product_ids instead of post_save per product.
+stock_changed = Signal()
+
+
+class DealQuerySet(models.QuerySet):
+    """Deal queryset helpers"""
+    
+    def active(self, at=None):
+        """Deals live at the given time (defaults to now).
+        
+        Both the status and the dates must agree: the deal scheduler keeps
+        status in step with start_date/end_date, but a deal whose end_date
+        has passed never applies, even when nothing flipped its status yet.
+        """
+        at = at or timezone.now()
+        return self.filter(status='active', start_date__lte=at, end_date__gte=at)
+    
+    def lapsed(self, at=None):
+        """Deals past their end_date whose status still says active"""
+        return self.filter(status='active', end_date__lt=at or timezone.now())
+    
+    def best_first(self):
+        """Order deals so the biggest discount comes first"""
+        return self.order_by('-discount_percentage', '-discount_amount', '-created_at')
 
 
 class Deal(models.Model):
@@ -256,6 +561,9 @@ class Deal(models.Model):
         ('expired', 'Expired'),
     ]
     
+    # Published statuses that follow start_date/end_date (see products.deal_scheduler)
+    LIVE_STATUSES = ('scheduled', 'active')
+    
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     deal_type = models.CharField(max_length=20, choices=DEAL_TYPE_CHOICES, default='percentage')
@@ -278,7 +586,7 @@ class Deal(models.Model):
     current_uses = models.PositiveIntegerField(default=0)
     
     # Deal display
-    banner_image = models.ImageField(upload_to='deals/', blank=True, null=True)
+    banner_image = ResponsiveImageField(upload_to='deals/', blank=True, null=True)
     badge_text = models.CharField(max_length=50, blank=True, help_text="Custom badge text (e.g., 'HOT DEAL')")
     
     # Metadata
@@ -286,6 +594,8 @@ class Deal(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='created_deals')
     
+    objects = DealQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Deal'
@@ -294,6 +604,21 @@ class Deal(models.Model):
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
     
+    def save(self, *args, **kwargs):
+        # Published deals take their status from their dates
+        if self.status in self.LIVE_STATUSES and self.start_date and self.end_date:
+            self.status = self.status_at()
+        super().save(*args, **kwargs)
+    
+    def status_at(self, at=None):
+        """Status a published deal should have at the given time (defaults to now)"""
+        at = at or timezone.now()
+        if at < self.start_date:
+            return 'scheduled'
+        if at <= self.end_date:
+            return 'active'
+        return 'expired'
+    
     def is_active(self):
         """Check if deal is currently active"""
         from django.utils import timezone
@@ -304,19 +629,67 @@ class Deal(models.Model):
             (self.max_uses is None or self.current_uses < self.max_uses)
         )
     
+    @staticmethod
+    def price_expression(price):
+        """SQL expression for a price after this deal's discount.
+        
+        Mirrors discounted_price() so querysets and Python agree.
+        """
+        money = DecimalField(max_digits=10, decimal_places=2)
+        return Case(
+            When(deal_type='fixed', discount_amount__gt=0,
+                 then=Greatest(price - F('discount_amount'), Value(Decimal('0.00')))),
+            When(deal_type='percentage', discount_percentage__gt=0,
+                 then=price - price * F('discount_percentage') * Value(Decimal('0.01'))),
+            default=price,
+            output_field=money,
+        )
+    
+    def discounted_price(self, price):
+        """Apply this deal's discount to a price"""
+        price = Decimal(price)
+        if self.deal_type == 'fixed' and self.discount_amount:
+            return max(Decimal('0.00'), price - self.discount_amount)
+        if self.deal_type == 'percentage' and self.discount_percentage:
+            return price - price * Decimal(self.discount_percentage) / Decimal('100')
+        return price
+    
     def get_discount_display(self):
         """Get formatted discount string"""
         if self.discount_percentage:
             return f"{self.discount_percentage}% OFF"
         return "Special Offer"
     
-    def apply_to_products(self):
-        """Apply this deal to all associated products"""
-        for product in self.products.all():
-            if self.discount_percentage:
-                discount = float(product.price) * (float(self.discount_percentage) / 100)
-                product.old_price = product.price
-                product.price = product.price - discount
-                product.on_sale = True
-                product.save()
+    def applied_price_expression(self):
+        """SQL expression for a product's price once this deal is applied"""
+        factor = (Decimal('100') - Decimal(self.discount_percentage)) / Decimal('100')
+        return Round(F('price') * Value(factor), 2, output_field=DecimalField(max_digits=10, decimal_places=2))
+    
+    def apply_to_products(self, dry_run=False):
+        """Write this deal's discount into the prices of its products.
+        
+        All products are updated with one UPDATE in a transaction. With
+        dry_run=True nothing is written and the products are returned
+        annotated with new_price; otherwise returns the number updated.
+        """
+        products = self.products.all()
+        if dry_run:
+            if not self.discount_percentage:
+                return products.none()
+            return products.annotate(new_price=self.applied_price_expression()).order_by('name')
+        if not self.discount_percentage:
+            return 0
+        
+        with transaction.atomic():
+            product_ids = list(products.select_for_update().values_list('id', flat=True))
+            updated = Product.objects.filter(pk__in=product_ids).update(
+                old_price=F('price'),
+                price=self.applied_price_expression(),
+                on_sale=True,
+                updated_at=timezone.now(),
+            )
+            transaction.on_commit(
+                lambda: deal_applied.send(sender=Deal, deal=self, product_ids=product_ids)
+            )
+        return updated
 
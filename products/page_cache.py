@@ -0,0 +1,126 @@
+"""
+Full-page cache for catalog pages.
+
+Catalog pages render the same HTML for every visitor (the personal header
+bits are filled in from /api/session-summary/), so the rendered page is
+cached under the path plus a normalized query string. Keys include the
+catalog version, which products.signals bumps whenever a product, category,
+deal, image or slide changes, and entries never outlive the next deal start
+or end. The same pages are marked public for browsers and the edge cache by
+SharedPageCacheMiddleware.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+from .cache import get_catalog_version
+from .pricing import deal_prices
+
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+# max-age sent to browsers and shared caches for catalog pages
+PUBLIC_MAX_AGE = 60
+
+# Query parameters that never change the page content
+IGNORED_PARAMS = {'fbclid', 'gclid'}
+
+
+def normalize_query(query_dict):
+    """Sorted query string without empty values or tracking parameters"""
+    pairs = []
+    for name in sorted(query_dict):
+        if name in IGNORED_PARAMS or name.startswith('utm_'):
+            continue
+        for value in sorted(query_dict.getlist(name)):
+            if value.strip():
+                pairs.append((name, value.strip()))
+    return urlencode(pairs)
+
+
+def page_cache_key(request):
+    location = f'{request.path}?{normalize_query(request.GET)}'
+    digest = hashlib.md5(location.encode()).hexdigest()
+    return f'products:page:{get_catalog_version()}:{digest}'
+
+
+def _timeout():
+    """Seconds until the entry should expire, capped at the next deal boundary"""
+    timeout = PAGE_CACHE_TIMEOUT
+    next_change = deal_prices.next_change()
+    if next_change:
+        timeout = min(timeout, (next_change - timezone.now()).total_seconds())
+    return max(int(timeout), 0)
+
+
+def _is_cacheable(request):
+    """Only plain GETs without pending flash messages share a page"""
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def _mark_shared(response, timeout):
+    """Let SharedPageCacheMiddleware mark the response public"""
+    response.shared_max_age = min(PUBLIC_MAX_AGE, timeout)
+    return response
+
+
+def cache_shared_page(view_func):
+    """Serve the view's HTML from the page cache for every visitor"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not _is_cacheable(request):
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Page-Cache'] = 'hit'
+            return _mark_shared(response, _timeout())
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            timeout = _timeout()
+            if timeout:
+                cache.set(key, (response.content, response['Content-Type']), timeout=timeout)
+                _mark_shared(response, timeout)
+            response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
+
+
+class SharedPageCacheMiddleware:
+    """Send Cache-Control for pages rendered by cache_shared_page.
+
+    Must sit above SessionMiddleware so it sees the cookies set on the way
+    out: a response carrying Set-Cookie (e.g. a refreshed session) is never
+    public, since a shared cache could hand the cookie to someone else.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        max_age = getattr(response, 'shared_max_age', None)
+        if max_age is None:
+            return response
+        if response.cookies:
+            patch_cache_control(response, private=True, max_age=0)
+            return response
+        patch_cache_control(response, public=True, max_age=max_age)
+        # The HTML is the same whatever cookies the visitor sends
+        vary = [value.strip() for value in response.get('Vary', '').split(',')]
+        vary = [value for value in vary if value and value.lower() != 'cookie']
+        if vary:
+            response['Vary'] = ', '.join(vary)
+        elif response.has_header('Vary'):
+            del response['Vary']
+        return response
@@ -0,0 +1,110 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+Instead of OFFSET, each page continues after the sort key of the last row of
+the previous page, so fetching page 50 costs the same as fetching page 1.
+The cursor is an opaque URL-safe token holding those key values.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+# Sort option -> ordering used for keyset pagination. Every ordering ends in
+# the primary key so rows with equal sort values still have a stable order.
+# Price and discount sorts need ProductQuerySet.with_current_pricing().
+KEYSET_ORDERINGS = {
+    'price_low': ('current_price', 'id'),
+    'price_high': ('-current_price', '-id'),
+    'discount': ('-current_discount_pct', '-id'),
+    'name_asc': ('name', 'id'),
+    'name_desc': ('-name', '-id'),
+    'newest': ('-created_at', '-id'),
+    'relevance': ('search_rank', 'id'),
+    'default': ('-is_featured', '-created_at', '-id'),
+}
+
+PAGE_SIZE = 24
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    """Pack the sort key values of a row into a cursor token"""
+    payload = json.dumps([_json_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpack a cursor token into sort key values"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(values, list):
+        raise InvalidCursor('Cursor must hold a list of values')
+    return values
+
+
+def _sort_field(queryset, name):
+    """Model field or annotation output field a sort key is compared on"""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def keyset_filter(queryset, ordering, values):
+    """Keep only rows that sort after the given key values.
+
+    Values are converted and validated by each sort field's clean(), so a
+    cursor holding the wrong types raises InvalidCursor instead of failing
+    when the queryset runs.
+    """
+    if len(values) != len(ordering):
+        raise InvalidCursor('Cursor does not match the sort order')
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        try:
+            value = _sort_field(queryset, name).clean(value, None)
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError) as e:
+            raise InvalidCursor(f'Invalid cursor value for {name}: {e}')
+        if value is None:
+            raise InvalidCursor(f'Invalid cursor value for {name}: null')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return queryset.filter(condition)
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """Return (rows, next_cursor) for one page of an ordered queryset.
+
+    next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = keyset_filter(queryset, ordering, decode_cursor(cursor))
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
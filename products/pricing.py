@@ -0,0 +1,146 @@
+"""
+Process-local table of active deal prices.
+
+Maps product_id -> DealPrice(deal_id, final_price, ends_at) so hot paths such
+as product cards and cart totals can resolve deal pricing without touching
+the database. The table is rebuilt lazily when its version stamp is bumped
+(see products.signals), which happens when a deal is saved, including the
+status flips of the deal scheduler. The stamp lives in the cache shared by
+all processes (products.cache), so each worker notices a bump made
+elsewhere within VERSION_CHECK_INTERVAL; bumps made in the same process
+apply at once.
+"""
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import bump_version, get_version
+
+
+DEAL_PRICES_VERSION_KEY = 'products:deal_prices_version'
+
+# How often (in seconds) to look at the shared version stamp for changes
+# made by other worker processes. Changes made in this process apply at once.
+VERSION_CHECK_INTERVAL = 1.0
+
+DEAL_PRODUCTS_TIMEOUT = 60 * 60
+
+DealPrice = namedtuple('DealPrice', ['deal_id', 'final_price', 'ends_at'])
+
+
+def bump_deal_prices_version():
+    """Mark every worker's deal price table as stale"""
+    bump_version(DEAL_PRICES_VERSION_KEY)
+    deal_prices.invalidate()
+
+
+class DealPriceTable:
+    """In-memory product_id -> DealPrice lookup rebuilt on demand"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._deals = {}
+        self._version = None
+        self._valid_until = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Drop the table so the next lookup rebuilds it"""
+        with self._lock:
+            self._entries = None
+
+    def get(self, product_id):
+        """Return the DealPrice for a product, or None when no deal applies"""
+        entry = self._table().get(product_id)
+        if entry and entry.ends_at < timezone.now():
+            return None
+        return entry
+
+    def get_deal(self, deal_id):
+        """Return the cached Deal instance for an entry's deal_id"""
+        self._table()
+        return self._deals.get(deal_id)
+
+    def next_change(self):
+        """When the current deal prices stop applying (a deal starts or ends), or None"""
+        self._table()
+        return self._valid_until
+
+    def _table(self):
+        now = timezone.now()
+        entries = self._entries
+        if entries is not None and (self._valid_until is None or now < self._valid_until):
+            if time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+                return entries
+            self._checked_at = time.monotonic()
+            if get_version(DEAL_PRICES_VERSION_KEY) == self._version:
+                return entries
+        with self._lock:
+            self._build(now)
+            return self._entries
+
+    def _build(self, now):
+        from .models import Deal
+
+        version = get_version(DEAL_PRICES_VERSION_KEY)
+        deals = {deal.pk: deal for deal in Deal.objects.active()}
+        ranked = sorted(deals.values(), key=lambda deal: (
+            -(deal.discount_percentage or 0), -(deal.discount_amount or 0), -deal.created_at.timestamp()
+        ))
+        rank = {deal.pk: position for position, deal in enumerate(ranked)}
+
+        links = Deal.products.through.objects.filter(
+            deal_id__in=deals
+        ).values_list('product_id', 'deal_id', 'product__price')
+
+        entries = {}
+        for product_id, deal_id, price in sorted(links, key=lambda link: rank[link[1]]):
+            if product_id not in entries:
+                deal = deals[deal_id]
+                entries[product_id] = DealPrice(deal_id, deal.discounted_price(price), deal.end_date)
+
+        # Rebuild by ourselves when the next deal starts or the first one ends.
+        # Boundaries already behind us would make every lookup rebuild.
+        boundaries = [deal.end_date for deal in deals.values() if deal.end_date > now]
+        next_start = Deal.objects.filter(
+            status='scheduled', start_date__gt=now
+        ).order_by('start_date').values_list('start_date', flat=True).first()
+        if next_start:
+            boundaries.append(next_start)
+
+        self._deals = deals
+        self._entries = entries
+        self._version = version
+        self._valid_until = min(boundaries) if boundaries else None
+        self._checked_at = time.monotonic()
+
+
+deal_prices = DealPriceTable()
+
+
+def deal_product_ids():
+    """{deal_id: [product_id, ...]} for active deals, biggest discount first.
+
+    Cached per deal window: the key changes whenever the deal price table's
+    version is bumped or the next deal boundary moves.
+    """
+    from .models import Deal
+
+    next_change = deal_prices.next_change()
+    window = int(next_change.timestamp()) if next_change else 'open'
+    key = f'products:deal_products:{get_version(DEAL_PRICES_VERSION_KEY)}:{window}'
+    mapping = cache.get(key)
+    if mapping is None:
+        links = Deal.products.through.objects.filter(
+            deal__in=Deal.objects.active(), product__is_active=True
+        ).order_by('deal_id', '-product__discount_pct', 'product__name').values_list('deal_id', 'product_id')
+        mapping = defaultdict(list)
+        for deal_id, product_id in links:
+            mapping[deal_id].append(product_id)
+        mapping = dict(mapping)
+        cache.set(key, mapping, timeout=DEAL_PRODUCTS_TIMEOUT)
+    return mapping
@@ -0,0 +1,264 @@
+"""
+Precomputed product recommendations.
+
+"Frequently bought together" neighbours are built offline by the
+build_recommendations management command: the database counts, in one
+grouped self-join over order items, how many orders contain each pair of
+products; the counts are normalized with cosine similarity and the top-K
+neighbours of every product are stored in ProductRecommendation. Pages then
+read a product's neighbours with one indexed query.
+
+"Similar products" cover items without order history: TF-IDF vectors over
+name, category and description are compared with cosine similarity through
+an inverted index. The command builds them for the whole catalog. Editing a
+product's name, description or category only marks it similar_stale (see
+products.signals); the refresh_similar_products command picks the marked
+products up, builds the vectors once per sweep and updates the lists each
+of them touches, outside any web process.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Value, When
+
+from .cache import bump_catalog_version
+from .models import Product, ProductRecommendation
+from .search import tokenize
+
+
+TOP_K = 8
+
+BOUGHT_TOGETHER = 'bought_together'
+
+SIMILAR = 'similar'
+
+# Related products on the detail page: best source first
+RELATED_KINDS = (BOUGHT_TOGETHER, SIMILAR)
+
+# Term weight multipliers per product field
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to with'.split()
+)
+
+# Orders in these statuses say nothing about what sells together
+EXCLUDED_ORDER_STATUSES = ('cancelled',)
+
+# Seconds between refresh_similar_products sweeps
+REFRESH_INTERVAL = 60
+
+
+def _top_k(scores, top_k):
+    """Keep the best top_k (product_id, score) pairs per product"""
+    return {
+        product_id: heapq.nlargest(top_k, neighbours.items(), key=lambda item: (item[1], -item[0]))
+        for product_id, neighbours in scores.items()
+    }
+
+
+def _store(kind, neighbours):
+    """Replace every stored recommendation of one kind"""
+    rows = [
+        ProductRecommendation(product_id=product_id, recommended_id=recommended_id, kind=kind, rank=rank, score=score)
+        for product_id, ranked in neighbours.items()
+        for rank, (recommended_id, score) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        ProductRecommendation.objects.filter(kind=kind).delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=1000)
+    # Cached detail pages show the old neighbours
+    bump_catalog_version()
+    return len(rows)
+
+
+def build_bought_together(top_k=TOP_K):
+    """Rebuild the "frequently bought together" table; returns rows written"""
+    from orders.models import OrderItem
+
+    items = OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+
+    # Orders containing each product
+    order_counts = dict(
+        items.order_by().values_list('product_id').annotate(orders=Count('order_id', distinct=True))
+    )
+
+    # Orders containing each pair of products, counted by the database
+    pairs = items.order_by().values_list('product_id', 'order__items__product_id').annotate(
+        together=Count('order_id', distinct=True)
+    )
+
+    scores = defaultdict(dict)
+    for product_id, other_id, together in pairs:
+        if product_id == other_id or other_id not in order_counts:
+            continue
+        scores[product_id][other_id] = together / math.sqrt(order_counts[product_id] * order_counts[other_id])
+    return _store(BOUGHT_TOGETHER, _top_k(scores, top_k))
+
+
+def _term_counts(name, category, description):
+    counts = defaultdict(float)
+    for field, text in (('name', name), ('category', category), ('description', description)):
+        for token in tokenize(text):
+            if token not in STOP_WORDS and len(token) > 1:
+                counts[token] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def _tfidf_vectors():
+    """L2-normalized TF-IDF vectors {product_id: {term: weight}} for active products"""
+    rows = Product.objects.filter(is_active=True).values_list('id', 'name', 'category__name', 'description')
+    counts = {product_id: _term_counts(name, category, description) for product_id, name, category, description in rows}
+
+    document_frequency = defaultdict(int)
+    for terms in counts.values():
+        for term in terms:
+            document_frequency[term] += 1
+    total = len(counts)
+    idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+    vectors = {}
+    for product_id, terms in counts.items():
+        vector = {term: (1 + math.log(count)) * idf[term] for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors[product_id] = {term: weight / norm for term, weight in vector.items()}
+    return vectors
+
+
+def _postings(vectors):
+    """Inverted index {term: [(product_id, weight), ...]}"""
+    postings = defaultdict(list)
+    for product_id, vector in vectors.items():
+        for term, weight in vector.items():
+            postings[term].append((product_id, weight))
+    return postings
+
+
+def _similarities(product_id, vectors, postings):
+    """Cosine similarity of one product to every product sharing a term"""
+    scores = defaultdict(float)
+    for term, weight in vectors.get(product_id, {}).items():
+        for other_id, other_weight in postings[term]:
+            scores[other_id] += weight * other_weight
+    scores.pop(product_id, None)
+    return scores
+
+
+def build_similar(top_k=TOP_K):
+    """Rebuild the "similar products" table for the whole catalog; returns rows written"""
+    # Every pending refresh is covered by the rebuild
+    Product.objects.filter(similar_stale=True).update(similar_stale=False)
+    vectors = _tfidf_vectors()
+    postings = _postings(vectors)
+    scores = {product_id: _similarities(product_id, vectors, postings) for product_id in vectors}
+    return _store(SIMILAR, _top_k(scores, top_k))
+
+
+def refresh_similar(product_id, vectors, postings, top_k=TOP_K):
+    """Update similar-product lists after one product was added or edited.
+
+    Recomputes that product's own neighbours and re-scores it inside every
+    other product's stored list; the rest of those lists is left as is.
+    """
+    scores = _similarities(product_id, vectors, postings)
+
+    # Only lists that may gain or lose the product: those scoring it now and
+    # those that held it before
+    listing = ProductRecommendation.objects.filter(kind=SIMILAR, recommended_id=product_id).values('product_id')
+    stored = defaultdict(dict)
+    for owner_id, recommended_id, score in ProductRecommendation.objects.filter(
+        Q(product_id__in=list(scores)) | Q(product_id__in=listing), kind=SIMILAR
+    ).values_list('product_id', 'recommended_id', 'score'):
+        stored[owner_id][recommended_id] = score
+
+    changed = {}
+    if product_id in vectors:
+        changed[product_id] = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+    for owner_id in set(stored) | set(scores):
+        if owner_id == product_id or owner_id not in vectors:
+            continue
+        current = stored.get(owner_id, {})
+        neighbours = {k: v for k, v in current.items() if k != product_id}
+        if scores.get(owner_id):
+            neighbours[product_id] = scores[owner_id]
+        ranked = heapq.nlargest(top_k, neighbours.items(), key=lambda item: (item[1], -item[0]))
+        if ranked != heapq.nlargest(top_k, current.items(), key=lambda item: (item[1], -item[0])):
+            changed[owner_id] = ranked
+
+    rows = [
+        ProductRecommendation(product_id=owner_id, recommended_id=recommended_id, kind=SIMILAR, rank=rank, score=score)
+        for owner_id, ranked in changed.items()
+        for rank, (recommended_id, score) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        ProductRecommendation.objects.filter(kind=SIMILAR, product_id__in=list(changed) + [product_id]).delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def refresh_stale_similar(top_k=TOP_K):
+    """Refresh the similar-product lists of every similar_stale product.
+
+    The flags are cleared before scoring, so a product edited again during
+    the sweep stays marked for the next one. Returns the products refreshed.
+    """
+    stale = list(Product.objects.filter(similar_stale=True).values_list('id', flat=True))
+    if not stale:
+        return 0
+    Product.objects.filter(pk__in=stale).update(similar_stale=False)
+
+    vectors = _tfidf_vectors()
+    postings = _postings(vectors)
+    for position, product_id in enumerate(stale):
+        try:
+            refresh_similar(product_id, vectors, postings, top_k=top_k)
+        except Exception:
+            # Leave the rest marked for the next sweep
+            Product.objects.filter(pk__in=stale[position:]).update(similar_stale=True)
+            raise
+    # Cached detail pages show the old neighbours
+    bump_catalog_version()
+    return len(stale)
+
+
+def related_products_for(product, limit=4):
+    """Related products in one query: bought together first, then similar ones"""
+    kind_order = Case(
+        *[When(recommended_in__kind=kind, then=Value(position)) for position, kind in enumerate(RELATED_KINDS)],
+        output_field=IntegerField(),
+    )
+    candidates = Product.objects.filter(
+        is_active=True,
+        recommended_in__product=product,
+        recommended_in__kind__in=RELATED_KINDS,
+    ).annotate(kind_order=kind_order).order_by('kind_order', 'recommended_in__rank')
+
+    related = []
+    seen = set()
+    for candidate in candidates.with_pricing()[:limit * len(RELATED_KINDS)]:
+        if candidate.pk not in seen:
+            seen.add(candidate.pk)
+            related.append(candidate)
+    return related[:limit]
+
+
+def recommended_for(product, kind=BOUGHT_TOGETHER):
+    """Stored neighbours of one product, best first"""
+    return Product.objects.filter(
+        is_active=True,
+        recommended_in__product=product,
+        recommended_in__kind=kind,
+    ).order_by('recommended_in__rank')
+
+
+def recommended_for_many(product_ids, kind=BOUGHT_TOGETHER):
+    """Best stored neighbours across several products (e.g. a cart), excluding them"""
+    return Product.objects.filter(
+        is_active=True,
+        recommended_in__product_id__in=product_ids,
+        recommended_in__kind=kind,
+    ).exclude(id__in=product_ids).annotate(
+        best_score=Max('recommended_in__score')
+    ).order_by('-best_score', 'id')
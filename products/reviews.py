@@ -0,0 +1,65 @@
+"""
+Cached, cursor-paginated product reviews.
+
+Review pages are cached under a per-product version stamp that
+products.signals bumps whenever one of the product's reviews is saved or
+deleted. The star histogram comes from the running counters on Product.
+"""
+from django.core.cache import cache
+
+from .cache import bump_version, get_version
+from .pagination import paginate_keyset
+
+
+REVIEWS_PAGE_SIZE = 10
+
+REVIEWS_TIMEOUT = 60 * 60 * 24
+
+REVIEW_ORDERING = ('-created_at', '-id')
+
+
+def _version_key(product_id):
+    return f'products:reviews_version:{product_id}'
+
+
+def bump_reviews_version(product_id):
+    """Expire cached review pages and histogram for one product"""
+    bump_version(_version_key(product_id))
+
+
+def _cache_key(product_id, name):
+    return f'products:reviews:{product_id}:{get_version(_version_key(product_id))}:{name}'
+
+
+def serialize_review(review):
+    return {
+        'id': review.id,
+        'user_name': review.user.get_full_name(),
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at.strftime('%B %d, %Y'),
+    }
+
+
+def review_page(product_id, cursor=None):
+    """One page of a product's reviews, newest first.
+
+    Returns {'reviews': [...], 'next_cursor': ...}; next_cursor is None on
+    the last page. Raises InvalidCursor for a malformed cursor.
+    """
+    from .models import ProductReview
+
+    key = _cache_key(product_id, f'page:{cursor or ""}')
+    page = cache.get(key)
+    if page is None:
+        reviews, next_cursor = paginate_keyset(
+            ProductReview.objects.filter(product_id=product_id).select_related('user'),
+            REVIEW_ORDERING, cursor=cursor, page_size=REVIEWS_PAGE_SIZE
+        )
+        page = {
+            'reviews': [serialize_review(review) for review in reviews],
+            'next_cursor': next_cursor,
+        }
+        cache.set(key, page, timeout=REVIEWS_TIMEOUT)
+    return page
+
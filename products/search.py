@@ -0,0 +1,161 @@
+"""
+Product search backends.
+
+The storefront search box, the autocomplete endpoint and the chat assistant
+all go through get_search_backend(), which returns ranked product ids. On
+SQLite the ids come from an FTS5 index ranked with BM25; other databases fall
+back to LIKE matching until a native backend (e.g. MySQL FULLTEXT) is added.
+Set PRODUCT_SEARCH_BACKEND in settings to a dotted class path to override.
+
+A search returns at most MAX_RESULTS ids. Filters, sorting and pagination
+then work within those best matches, and the product list tells shoppers
+when their query hit the cap.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Case, Q, Value, When
+from django.utils.module_loading import import_string
+
+
+# Upper bound on ranked ids returned for one query; it also bounds the
+# relevance CASE built by rank_by_hits()
+MAX_RESULTS = 500
+
+FTS_TABLE = 'products_product_fts'
+
+# BM25 column weights: name, category, sku, description
+FTS_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+
+def tokenize(query):
+    """Split a search query into lowercase word tokens"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+class BaseSearchBackend:
+    """Interface every product search backend implements"""
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return product ids matching query, best match first"""
+        raise NotImplementedError
+
+    def index_product(self, product):
+        """Add or refresh a single product in the index"""
+
+    def remove_product(self, product_id):
+        """Drop a product from the index"""
+
+    def reindex_category(self, category):
+        """Refresh every product in a category (e.g. after a rename)"""
+
+    def rebuild(self):
+        """Rebuild the whole index from the products table"""
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Fallback search using icontains, for databases without an FTS index"""
+
+    def search(self, query, limit=MAX_RESULTS):
+        from .models import Product
+
+        query = (query or '').strip()
+        if not query:
+            return []
+        return list(
+            Product.objects.filter(
+                Q(name__icontains=query) |
+                Q(description__icontains=query) |
+                Q(category__name__icontains=query)
+            ).annotate(
+                name_match=Case(When(name__icontains=query, then=Value(0)), default=Value(1))
+            ).order_by('name_match', '-is_featured', '-created_at').values_list('id', flat=True)[:limit]
+        )
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """SQLite FTS5 index over name, category, SKU and description"""
+
+    def search(self, query, limit=MAX_RESULTS):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, category, sku, description) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [product.pk, product.name, product.category.name, product.sku or '', product.description]
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def reindex_category(self, category):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {FTS_TABLE} SET category = %s WHERE rowid IN '
+                f'(SELECT id FROM products_product WHERE category_id = %s)',
+                [category.name, category.pk]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, category, sku, description) '
+                f'SELECT p.id, p.name, c.name, COALESCE(p.sku, \'\'), p.description '
+                f'FROM products_product p INNER JOIN products_category c ON c.id = p.category_id'
+            )
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend (created once per process)"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSSearchBackend()
+        else:
+            _backend = LikeSearchBackend()
+    return _backend
+
+
+def search_products(queryset, query, limit=MAX_RESULTS):
+    """Restrict a Product queryset to search hits, annotated with search_rank.
+
+    search_rank is the hit's position in the ranked results (0 = best), so
+    order_by('search_rank') gives relevance order. Only the best limit hits
+    are kept.
+    """
+    return rank_by_hits(queryset, get_search_backend().search(query, limit=limit))
+
+
+def rank_by_hits(queryset, ids):
+    """search_products() for ids already returned by a backend search"""
+    if not ids:
+        return queryset.annotate(search_rank=Value(0)).none()
+    return queryset.filter(id__in=ids).annotate(
+        search_rank=Case(
+            *[When(id=product_id, then=Value(position)) for position, product_id in enumerate(ids)],
+            output_field=models.IntegerField(),
+        )
+    )
@@ -0,0 +1,177 @@
+"""
+Signal handlers for keeping product caches in sync
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from dashboard.models import SlideshowImage
+
+from .autocomplete import bump_autocomplete_version
+from .cache import bump_catalog_version
+from .facets import bump_facets_version
+from .images import schedule_derivatives
+from .models import Category, Deal, Product, ProductImage, ProductReview, deal_applied
+from .pricing import bump_deal_prices_version
+from .reviews import bump_reviews_version
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_deal_prices(sender, **kwargs):
+    """Deal terms or product prices changed - rebuild the deal price table"""
+    bump_deal_prices_version()
+
+
+@receiver(m2m_changed, sender=Deal.products.through)
+def invalidate_deal_prices_on_products_change(sender, action, **kwargs):
+    """Products were added to or removed from a deal"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_deal_prices_version()
+
+
+def _refresh_pricing(deal_products):
+    # The deal's products plus every currently discounted one may change
+    discounted = Q(discount_pct__gt=0) | Q(effective_price__lt=F('price'))
+
+    def refresh():
+        Product.objects.filter(deal_products | discounted).refresh_pricing()
+        # Price buckets count effective prices
+        bump_facets_version()
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def refresh_deal_pricing(sender, instance, **kwargs):
+    """A deal started, ended or changed terms - update stored product pricing"""
+    _refresh_pricing(Q(pk__in=list(instance.products.values_list('pk', flat=True))))
+
+
+@receiver(m2m_changed, sender=Deal.products.through)
+def refresh_deal_pricing_on_products_change(sender, action, pk_set, **kwargs):
+    """Products joined or left a deal"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _refresh_pricing(Q(pk__in=list(pk_set or ())))
+
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, **kwargs):
+    """Keep the product search index in sync"""
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, **kwargs):
+    """Drop deleted products from the search index"""
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_for_search(sender, instance, created, **kwargs):
+    """Category names are searchable, so refresh its products on rename"""
+    if not created:
+        get_search_backend().reindex_category(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_autocomplete(sender, **kwargs):
+    """Names, SKUs or categories changed - reload the autocomplete index"""
+    bump_autocomplete_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_facets(sender, **kwargs):
+    """Catalog facet counts are stale once products or categories change"""
+    bump_facets_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+@receiver(post_save, sender=SlideshowImage)
+@receiver(post_delete, sender=SlideshowImage)
+def invalidate_catalog_pages(sender, **kwargs):
+    """Anything shown on catalog pages changed - expire cached pages"""
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Deal.products.through)
+def invalidate_catalog_pages_on_deal_products_change(sender, action, **kwargs):
+    """Products were added to or removed from a deal"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def invalidate_reviews(sender, instance, **kwargs):
+    """Expire the cached review pages and histogram of the reviewed product"""
+    bump_reviews_version(instance.product_id)
+
+
+@receiver(post_delete, sender=ProductReview)
+def remove_review_rating(sender, instance, **kwargs):
+    """Take a deleted review out of the product's running rating aggregates"""
+    Product.objects.filter(pk=instance.product_id).apply_ratings(removed=[instance.rating])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=SlideshowImage)
+def build_image_derivatives(sender, instance, **kwargs):
+    """Resize new uploads in the background"""
+    schedule_derivatives(instance.image)
+
+
+@receiver(post_save, sender=Deal)
+def build_deal_banner_derivatives(sender, instance, **kwargs):
+    """Resize new deal banners in the background"""
+    schedule_derivatives(instance.banner_image)
+
+
+@receiver(post_delete, sender=ProductImage)
+def refresh_primary_image(sender, instance, **kwargs):
+    """A deleted gallery image may have been the product's primary image"""
+    product = Product.objects.filter(pk=instance.product_id).first()
+    if product:
+        product.refresh_primary_image()
+
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance, created, update_fields=None, **kwargs):
+    """Name, description or category changed - queue a similar products refresh"""
+    if update_fields is not None and not update_fields & {'name', 'description', 'category', 'category_id'}:
+        return
+    if created or instance.similarity_changed:
+        # A queryset update, so post_save does not fire again
+        Product.objects.filter(pk=instance.pk).update(similar_stale=True)
+        instance.similar_stale = True
+
+
+@receiver(deal_applied)
+def invalidate_repriced_products(sender, deal, product_ids, **kwargs):
+    """A deal rewrote product prices in bulk - expire everything price dependent once"""
+    Product.objects.filter(pk__in=product_ids).refresh_pricing()
+    bump_deal_prices_version()
+    bump_facets_version()
+    bump_autocomplete_version()
+    bump_catalog_version()
@@ -1,4 +1,991 @@
 # Tests for products app
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import HttpRequest, QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import User
+from orders.models import Order, OrderItem
+
+from .autocomplete import AutocompleteIndex
+from .catalog_io import CatalogImportError, export_catalog, import_catalog, read_rows
+from .conditional import _product_state
+from .deal_scheduler import POLL_INTERVAL, DealScheduler, sync_deal_statuses
+from .facets import catalog_facets, compute_facets
+from .images import DERIVATIVE_SIZES, derivative_name, generate_derivatives
+from .models import Category, Deal, Product, ProductImage, ProductReview, deal_applied
+from .page_cache import normalize_query
+from .pagination import KEYSET_ORDERINGS, encode_cursor, paginate_keyset
+from .pricing import deal_prices, deal_product_ids
+from .recommendations import (
+    SIMILAR, build_bought_together, build_similar, recommended_for, recommended_for_many, refresh_stale_similar,
+    related_products_for,
+)
+from .reviews import REVIEWS_PAGE_SIZE, review_page
+from .search import LikeSearchBackend, SQLiteFTSSearchBackend, search_products
+
+
+def make_product(category, name, price=1000, **fields):
+    fields.setdefault('description', f'{name} description')
+    return Product.objects.create(category=category, name=name, price=price, **fields)
+
+
+def save_test_image(name, size=(800, 600)):
+    """Write a plain JPEG to the default storage; returns its storage name"""
+    buffer = BytesIO()
+    Image.new('RGB', size, 'steelblue').save(buffer, format='JPEG')
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+class TemporaryMediaMixin:
+    """Point MEDIA_ROOT at a temporary directory for the test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+def make_deal(products, percentage, days_left=1, **fields):
+    now = timezone.now()
+    deal = Deal.objects.create(
+        title=f'{percentage}% off', discount_percentage=Decimal(percentage), status='active',
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=days_left), **fields
+    )
+    deal.products.add(*products)
+    return deal
+
+
+class ReviewRatingTests(TestCase):
+    """Running rating aggregates follow reviews being added, edited and deleted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Keyboards')
+        cls.product = Product.objects.create(category=category, name='Mechanical Keyboard', description='Brown switches', price=2500)
+        cls.ana = User.objects.create_user('ana@example.com', 'secret', first_name='Ana', last_name='Santos')
+        cls.ben = User.objects.create_user('ben@example.com', 'secret', first_name='Ben', last_name='Reyes')
+
+    def assertAggregates(self, rating, count, stars):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.reviews_count, count)
+        self.assertEqual(product.rating_sum, sum(star * n for star, n in stars.items()))
+        self.assertEqual(product.rating, Decimal(rating))
+        for star in range(1, 6):
+            self.assertEqual(getattr(product, f'rating_{star}'), stars.get(star, 0), f'rating_{star}')
+
+    def test_add_review(self):
+        ProductReview.objects.create(product=self.product, user=self.ana, rating=5)
+        ProductReview.objects.create(product=self.product, user=self.ben, rating=2)
+        self.assertAggregates('3.50', 2, {5: 1, 2: 1})
+
+    def test_edit_review(self):
+        review = ProductReview.objects.create(product=self.product, user=self.ana, rating=5)
+        ProductReview.objects.create(product=self.product, user=self.ben, rating=4)
+        review.rating = 1
+        review.save()
+        self.assertAggregates('2.50', 2, {1: 1, 4: 1})
+
+        # Saving without a rating change leaves the aggregates alone
+        review.comment = 'Keys started sticking'
+        review.save()
+        self.assertAggregates('2.50', 2, {1: 1, 4: 1})
+
+    def test_delete_review(self):
+        review = ProductReview.objects.create(product=self.product, user=self.ana, rating=3)
+        ProductReview.objects.create(product=self.product, user=self.ben, rating=4)
+        review.delete()
+        self.assertAggregates('4.00', 1, {4: 1})
+
+    def test_delete_last_review(self):
+        review = ProductReview.objects.create(product=self.product, user=self.ana, rating=3)
+        review.delete()
+        self.assertAggregates('0.00', 0, {})
+
+    def test_bulk_submit(self):
+        ProductReview.objects.bulk_submit([
+            ProductReview(product=self.product, user=self.ana, rating=5),
+            ProductReview(product=self.product, user=self.ben, rating=4),
+        ])
+        self.assertAggregates('4.50', 2, {5: 1, 4: 1})
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row once and reject malformed cursors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Cases')
+        # Repeated prices so pages have to break ties on id
+        cls.products = [make_product(category, f'Case {n}', price=1000 + (n // 3) * 100) for n in range(10)]
+        cls.ana = User.objects.create_user('ana@example.com', 'secret', first_name='Ana', last_name='Santos')
+
+    def test_pages_follow_the_ordering_without_gaps_or_repeats(self):
+        ordering = KEYSET_ORDERINGS['price_low']
+        seen, cursor = [], None
+        while True:
+            rows, cursor = paginate_keyset(Product.objects.with_current_pricing(), ordering, cursor=cursor, page_size=4)
+            seen.extend(rows)
+            if cursor is None:
+                break
+        expected = list(Product.objects.order_by('effective_price', 'id'))
+        self.assertEqual(seen, expected)
+
+    def test_api_pages_chain_through_next_cursor(self):
+        category = self.products[0].category
+        for n in range(20):
+            make_product(category, f'Tower {n}', price=1500)
+        url = reverse('products:product_list_api')
+        ids, cursor = [], None
+        for _ in range(3):
+            params = {'sort': 'price_high', **({'cursor': cursor} if cursor else {})}
+            page = self.client.get(url, params).json()
+            ids.extend(p['id'] for p in page['products'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertIsNone(cursor)
+        self.assertEqual(ids, list(Product.objects.order_by('-effective_price', '-id').values_list('id', flat=True)))
+
+    def test_api_rejects_badly_typed_cursor(self):
+        url = reverse('products:product_list_api')
+        for cursor in (encode_cursor(['abc', 1]), encode_cursor([None, 1]), encode_cursor([1000]), 'not-base64!'):
+            response = self.client.get(url, {'sort': 'price_low', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_reviews_api_rejects_badly_typed_cursor(self):
+        product = self.products[0]
+        ProductReview.objects.create(product=product, user=self.ana, rating=4)
+        url = reverse('products:product_reviews_api', args=[product.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url, {'cursor': encode_cursor(['yesterday', 'x'])})
+        self.assertEqual(response.status_code, 400)
+
+
+class CurrentPricingTests(TestCase):
+    """Listing filters use the stored pricing columns, but never an ended deal's price"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Routers')
+        cls.router = make_product(category, 'WiFi 6 Router', price=Decimal('4000.00'))
+        cls.switch = make_product(category, 'Gigabit Switch', price=Decimal('3000.00'))
+        # The stored pricing is refreshed once the deal commits
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.deal = make_deal([cls.router], '50.00')
+
+    def setUp(self):
+        cache.clear()
+
+    def lapse_deal(self):
+        # The end date passes before run_deal_scheduler flips the status
+        Deal.objects.filter(pk=self.deal.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+
+    def listed_ids(self, **params):
+        response = self.client.get(reverse('products:product_list_api'), params)
+        return [product['id'] for product in response.json()['products']]
+
+    def test_stored_columns_follow_the_deal(self):
+        router = Product.objects.with_current_pricing().get(pk=self.router.pk)
+        self.assertEqual((router.effective_price, router.discount_pct), (Decimal('2000.00'), 50))
+        self.assertEqual((router.current_price, router.current_discount_pct), (Decimal('2000.00'), 50))
+        self.assertEqual(self.listed_ids(price_max=2500), [self.router.pk])
+        self.assertEqual(self.listed_ids(sort='price_low'), [self.router.pk, self.switch.pk])
+        self.assertEqual(self.listed_ids(sort='discount'), [self.router.pk, self.switch.pk])
+
+    def test_lapsed_deal_is_not_used_by_filters_and_sorts(self):
+        self.lapse_deal()
+        router = Product.objects.with_current_pricing().get(pk=self.router.pk)
+        self.assertEqual(router.discount_pct, 50)
+        self.assertEqual((router.current_price, router.current_discount_pct), (Decimal('4000.00'), 0))
+
+        self.assertEqual(self.listed_ids(price_max=2500), [])
+        self.assertEqual(self.listed_ids(sort='price_low'), [self.switch.pk, self.router.pk])
+        # No discounts left, so the newest product comes first
+        self.assertEqual(self.listed_ids(sort='discount'), [self.switch.pk, self.router.pk])
+
+    def test_lapsed_deal_leaves_deals_page_and_price_buckets(self):
+        self.lapse_deal()
+        response = self.client.get(reverse('products:deals'))
+        self.assertNotIn(self.router, list(response.context['deal_products']))
+
+        buckets = {(b['min'], b['max']): b['count'] for b in catalog_facets()['price_buckets']}
+        self.assertEqual(buckets[(1000, 5000)], 2)
+
+
+class ConditionalGetTests(TestCase):
+    """Unchanged catalog pages and product data answer 304 Not Modified"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mice')
+        cls.mouse = make_product(category, 'Wireless Mouse', price=900)
+        cls.ana = User.objects.create_user('ana@example.com', 'secret', first_name='Ana', last_name='Santos')
+        cls.ben = User.objects.create_user('ben@example.com', 'secret', first_name='Ben', last_name='Reyes')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_product_detail_api_answers_304_until_a_review_changes(self):
+        url = reverse('products:product_detail_api', args=[self.mouse.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ProductReview.objects.create(product=self.mouse, user=self.ana, rating=4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_page_answers_304(self):
+        url = reverse('products:list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_product_state_counts_each_relation_once(self):
+        for user, rating in ((self.ana, 5), (self.ben, 3)):
+            ProductReview.objects.create(product=self.mouse, user=user, rating=rating)
+        for order in range(3):
+            ProductImage.objects.create(product=self.mouse, image=f'products/gallery/mouse-{order}.jpg', order=order)
+        make_deal([self.mouse], '10.00')
+        make_deal([self.mouse], '15.00')
+
+        with self.assertNumQueries(1):
+            state = _product_state(HttpRequest(), self.mouse.pk)
+        self.assertEqual((state['review_total'], state['image_total']), (2, 3))
+        self.assertIsNotNone(state['last_deal_change'])
+
+
+class SimilarProductsTests(TestCase):
+    """Edits queue a similar products refresh that the command's sweep applies"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Graphics Cards')
+        cls.rtx = make_product(category, 'GeForce RTX 4060', description='NVIDIA graphics card 8GB GDDR6')
+        cls.rx = make_product(category, 'Radeon RX 7600', description='AMD graphics card 8GB GDDR6')
+        cls.fan = make_product(category, 'Case Fan', description='120mm quiet airflow')
+
+    def similar(self, product):
+        return list(recommended_for(product, kind=SIMILAR))
+
+    def stale_ids(self):
+        return set(Product.objects.filter(similar_stale=True).values_list('id', flat=True))
+
+    def test_new_products_are_queued_and_refreshed(self):
+        self.assertEqual(self.stale_ids(), {self.rtx.pk, self.rx.pk, self.fan.pk})
+        self.assertEqual(refresh_stale_similar(), 3)
+        self.assertEqual(self.stale_ids(), set())
+        self.assertEqual(self.similar(self.rtx)[0], self.rx)
+        self.assertEqual(refresh_stale_similar(), 0)
+
+    def test_edit_requeues_only_when_similarity_fields_change(self):
+        build_similar()
+        self.assertEqual(self.stale_ids(), set())
+
+        fan = Product.objects.get(pk=self.fan.pk)
+        fan.stock = 5
+        fan.save()
+        self.assertEqual(self.stale_ids(), set())
+
+        fan.name = 'GeForce RTX 4060 Ti'
+        fan.description = 'NVIDIA graphics card 16GB GDDR6'
+        fan.save()
+        self.assertEqual(self.stale_ids(), {self.fan.pk})
+
+        self.assertEqual(refresh_stale_similar(), 1)
+        self.assertEqual(self.similar(self.rtx)[0], self.fan)
+        self.assertIn(self.rtx, self.similar(self.fan))
+
+
+class AutocompleteTests(TemporaryMediaMixin, TestCase):
+    """Prefix suggestions over names, SKUs and categories"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Processors')
+        cls.ryzen5 = make_product(category, 'AMD Ryzen 5 7600', price=11000, sku='100-100001015BOX')
+        cls.ryzen7 = make_product(category, 'AMD Ryzen 7 7800X3D', price=22000, is_featured=True)
+        cls.cooler = make_product(Category.objects.create(name='Cooling'), 'Tower Cooler', price=1500)
+
+    def suggest(self, query):
+        return [suggestion['id'] for suggestion in AutocompleteIndex().suggest(query)]
+
+    def test_matches_name_word_sku_and_category_prefixes(self):
+        self.assertEqual(self.suggest('amd ryz'), [self.ryzen5.pk, self.ryzen7.pk])
+        self.assertEqual(self.suggest('Ryzen 7'), [self.ryzen7.pk])
+        self.assertEqual(self.suggest('7800'), [self.ryzen7.pk])
+        self.assertEqual(self.suggest('100-1000'), [self.ryzen5.pk])
+        self.assertEqual(self.suggest('cool'), [self.cooler.pk])
+        self.assertEqual(self.suggest('intel'), [])
+
+    def test_image_is_the_thumbnail_once_generated(self):
+        name = save_test_image('products/cooler.jpg')
+        Product.objects.filter(pk=self.cooler.pk).update(image=name)
+        index = AutocompleteIndex()
+        self.assertEqual(index.suggest('tower')[0]['image'], default_storage.url(name))
+
+        generate_derivatives(default_storage, name)
+        self.assertEqual(
+            index.suggest('tower')[0]['image'], default_storage.url(derivative_name(name, 'thumbnail', 'jpeg'))
+        )
+
+
+class WithPricingTests(TestCase):
+    """with_pricing() resolves deal pricing in the product query itself"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Graphics Cards')
+        cls.gpu = make_product(category, 'RTX 4070', price=Decimal('30000.00'))
+        cls.psu = make_product(category, '750W PSU', price=Decimal('4500.00'), old_price=Decimal('5000.00'))
+        cls.fan = make_product(category, '120mm Fan', price=Decimal('300.00'))
+        make_deal([cls.gpu], '10.00')
+        make_deal([cls.gpu], '20.00')
+        ended = make_deal([cls.gpu, cls.fan], '50.00')
+        Deal.objects.filter(pk=ended.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+
+    def test_best_live_deal_in_one_query(self):
+        with self.assertNumQueries(1):
+            products = {p.pk: p for p in Product.objects.with_pricing()}
+            gpu, psu, fan = products[self.gpu.pk], products[self.psu.pk], products[self.fan.pk]
+            self.assertTrue(gpu.has_active_deal)
+            self.assertEqual(gpu.final_price, 24000.0)
+            self.assertEqual((gpu.original_price, gpu.savings_percentage), (30000.0, 20))
+            self.assertFalse(psu.has_active_deal)
+            self.assertEqual((psu.final_price, psu.original_price, psu.savings_percentage), (4500.0, 5000.0, 10))
+            self.assertFalse(fan.has_active_deal)
+            self.assertEqual((fan.final_price, fan.original_price), (300.0, None))
+
+    def test_matches_unannotated_products(self):
+        for annotated in Product.objects.with_pricing():
+            plain = Product.objects.get(pk=annotated.pk)
+            self.assertEqual(annotated.final_price, plain.final_price, annotated.name)
+            self.assertEqual(annotated.active_deal, plain.active_deal, annotated.name)
+
+
+class DealPriceTableTests(TestCase):
+    """The process-local deal price table answers from memory until a deal changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Monitors')
+        cls.monitor = make_product(category, '27in IPS Monitor', price=Decimal('12000.00'))
+        cls.arm = make_product(category, 'Monitor Arm', price=Decimal('1500.00'))
+        cls.deal = make_deal([cls.monitor], '25.00', days_left=2)
+
+    def setUp(self):
+        deal_prices.invalidate()
+
+    def test_lookups_need_no_queries_once_built(self):
+        self.assertEqual(deal_prices.get(self.monitor.pk).final_price, Decimal('9000.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(deal_prices.get(self.monitor.pk).deal_id, self.deal.pk)
+            self.assertIsNone(deal_prices.get(self.arm.pk))
+            self.assertEqual(deal_prices.get_deal(self.deal.pk), self.deal)
+            self.assertEqual(deal_prices.next_change(), self.deal.end_date)
+
+    def test_deal_changes_rebuild_the_table(self):
+        deal_prices.get(self.monitor.pk)
+        self.deal.discount_percentage = Decimal('50.00')
+        self.deal.save()
+        self.assertEqual(deal_prices.get(self.monitor.pk).final_price, Decimal('6000.00'))
+
+        self.deal.products.add(self.arm)
+        self.assertEqual(deal_prices.get(self.arm.pk).final_price, Decimal('750.00'))
+
+        self.deal.delete()
+        self.assertIsNone(deal_prices.get(self.monitor.pk))
+
+    def test_scheduled_deal_start_bounds_the_table(self):
+        now = timezone.now()
+        upcoming = Deal.objects.create(
+            title='Weekend sale', discount_percentage=Decimal('30.00'), status='scheduled',
+            start_date=now + timedelta(hours=1), end_date=now + timedelta(days=1),
+        )
+        upcoming.products.add(self.arm)
+        self.assertIsNone(deal_prices.get(self.arm.pk))
+        self.assertEqual(deal_prices.next_change(), upcoming.start_date)
+
+
+class SearchTests(TestCase):
+    """Ranked product search through the FTS5 index and the LIKE fallback"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.storage = Category.objects.create(name='Storage')
+        cls.ssd = make_product(cls.storage, 'Samsung 990 Pro SSD', sku='MZ-V9P1T0', description='PCIe 4.0 NVMe drive')
+        cls.case = make_product(
+            Category.objects.create(name='Cases'), 'Lian Li O11 Dynamic', description='Mounts for SSD and HDD drives'
+        )
+        cls.hdd = make_product(cls.storage, 'Seagate Barracuda 2TB', description='7200 rpm desktop drive')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_name_hits_rank_above_description_hits(self):
+        backend = SQLiteFTSSearchBackend()
+        self.assertEqual(backend.search('ssd'), [self.ssd.pk, self.case.pk])
+        self.assertEqual(backend.search('sams'), [self.ssd.pk])
+        self.assertEqual(backend.search('mz v9p1t0'), [self.ssd.pk])
+        self.assertEqual(backend.search('nvme drive'), [self.ssd.pk])
+        self.assertEqual(backend.search('  '), [])
+
+    def test_index_follows_product_and_category_changes(self):
+        backend = SQLiteFTSSearchBackend()
+        self.hdd.name = 'Seagate IronWolf 4TB'
+        self.hdd.save()
+        self.assertEqual(backend.search('barracuda'), [])
+        self.assertEqual(backend.search('ironwolf'), [self.hdd.pk])
+
+        self.storage.name = 'Drives and Storage'
+        self.storage.save()
+        self.assertEqual(set(backend.search('storage')), {self.ssd.pk, self.hdd.pk})
+
+        self.hdd.delete()
+        self.assertEqual(backend.search('seagate'), [])
+
+    def test_like_fallback_puts_name_matches_first(self):
+        self.assertEqual(LikeSearchBackend().search('ssd'), [self.ssd.pk, self.case.pk])
+
+    def test_search_rank_orders_the_queryset(self):
+        ranked = search_products(Product.objects.all(), 'drive').order_by('search_rank')
+        self.assertEqual([p.search_rank for p in ranked], [0, 1, 2])
+        self.assertFalse(search_products(Product.objects.all(), 'keyboard').exists())
+
+    def test_product_list_flags_a_capped_search(self):
+        url = reverse('products:list')
+        response = self.client.get(url, {'search': 'drive'})
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertFalse(response.context['search_capped'])
+
+        with mock.patch('products.views.MAX_RESULTS', 2):
+            response = self.client.get(url, {'search': 'ssd'})
+        self.assertEqual([p.pk for p in response.context['products']], [self.ssd.pk, self.case.pk])
+        self.assertTrue(response.context['search_capped'])
+
+
+class FacetTests(TestCase):
+    """Sidebar facet counts from one grouped query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cpus = Category.objects.create(name='Processors')
+        cls.rams = Category.objects.create(name='Memory')
+        make_product(cls.cpus, 'Ryzen 5', price=9000, stock=3, on_sale=True)
+        make_product(cls.cpus, 'Ryzen 9', price=30000, stock=0)
+        make_product(cls.rams, '8GB DDR4', price=900, stock=10)
+        make_product(cls.rams, '32GB DDR5', price=6000, stock=2, on_sale=True)
+        make_product(cls.rams, 'Old Stock', price=500, is_active=False)
+
+    def setUp(self):
+        cache.clear()
+
+    def bucket_counts(self, facets):
+        return [bucket['count'] for bucket in facets['price_buckets']]
+
+    def test_catalog_counts(self):
+        facets = catalog_facets()
+        self.assertEqual(facets['categories'], {self.cpus.pk: 2, self.rams.pk: 2})
+        self.assertEqual((facets['total'], facets['in_stock'], facets['on_sale']), (4, 3, 2))
+        self.assertEqual(self.bucket_counts(facets), [1, 0, 2, 0, 1, 0])
+
+    def test_selected_categories_limit_the_other_counts(self):
+        facets = catalog_facets([self.cpus.pk])
+        # Category counts stay catalog wide, so each shows what it would add
+        self.assertEqual(facets['categories'], {self.cpus.pk: 2, self.rams.pk: 2})
+        self.assertEqual((facets['total'], facets['in_stock'], facets['on_sale']), (2, 1, 1))
+        self.assertEqual(self.bucket_counts(facets), [0, 0, 1, 0, 1, 0])
+
+    def test_cached_until_a_product_changes(self):
+        catalog_facets()
+        # Only the check for deals that ended without a status flip
+        with self.assertNumQueries(1):
+            catalog_facets()
+        make_product(self.rams, '16GB DDR5', price=4000, stock=1)
+        self.assertEqual(catalog_facets()['categories'][self.rams.pk], 3)
+
+    def test_filtered_queryset(self):
+        in_stock = Product.objects.filter(is_active=True, stock__gt=0).with_current_pricing()
+        facets = compute_facets(in_stock)
+        self.assertEqual(facets['categories'], {self.cpus.pk: 1, self.rams.pk: 2})
+        self.assertEqual(facets['total'], 3)
+
+
+class PageCacheTests(TestCase):
+    """Catalog pages are rendered once and shared by every visitor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Keyboards')
+        cls.keyboard = make_product(cls.category, 'TKL Keyboard', price=2500)
+        cls.ana = User.objects.create_user('ana@example.com', 'secret', first_name='Ana', last_name='Santos')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_visit_is_a_hit_for_everyone(self):
+        url = reverse('products:list')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertIn('public', first['Cache-Control'])
+
+        self.client.force_login(self.ana)
+        second = self.client.get(url, {'utm_source': 'newsletter'})
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+
+    def test_catalog_change_expires_the_page(self):
+        url = reverse('products:detail', args=[self.keyboard.slug])
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+
+        self.keyboard.price = 2200
+        self.keyboard.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, '₱2200.00')
+
+    def test_posts_are_never_cached(self):
+        response = self.client.post(reverse('products:list'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_query_normalization(self):
+        query = QueryDict('sort=price_low&category=2&category=1&search=+&utm_medium=email&fbclid=x')
+        self.assertEqual(normalize_query(query), 'category=1&category=2&sort=price_low')
+
+
+class ReviewPayloadTests(TestCase):
+    """Product API reviews come in cached pages, newest first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Webcams')
+        cls.webcam = make_product(category, '1080p Webcam', price=1900)
+        users = [
+            User.objects.create_user(f'buyer{n}@example.com', None, first_name='Buyer', last_name=str(n))
+            for n in range(REVIEWS_PAGE_SIZE + 2)
+        ]
+        cls.reviews = [
+            ProductReview.objects.create(product=cls.webcam, user=user, rating=5 if n % 3 else 2)
+            for n, user in enumerate(users)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_api_pages_reviews(self):
+        data = self.client.get(reverse('products:product_detail_api', args=[self.webcam.pk])).json()
+        self.assertEqual(len(data['reviews']), REVIEWS_PAGE_SIZE)
+        self.assertEqual(data['reviews_count'], REVIEWS_PAGE_SIZE + 2)
+        self.assertEqual(data['rating_histogram'], {'5': 8, '4': 0, '3': 0, '2': 4, '1': 0})
+
+        url = reverse('products:product_reviews_api', args=[self.webcam.pk])
+        rest = self.client.get(url, {'cursor': data['reviews_next_cursor']}).json()
+        self.assertIsNone(rest['next_cursor'])
+        ids = [review['id'] for review in data['reviews'] + rest['reviews']]
+        self.assertEqual(ids, [review.pk for review in reversed(self.reviews)])
+
+    def test_pages_are_cached_until_a_review_changes(self):
+        first = review_page(self.webcam.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(review_page(self.webcam.pk), first)
+
+        self.reviews[-1].comment = 'Great picture'
+        self.reviews[-1].save()
+        self.assertEqual(review_page(self.webcam.pk)['reviews'][0]['comment'], 'Great picture')
+
+
+class ImageDerivativeTests(TemporaryMediaMixin, TestCase):
+    """Resized WebP and JPEG copies of catalog images"""
+
+    # Complete derivative sets are remembered per file name for the life of
+    # the process, so every test uses its own file names
+
+    def test_generate_writes_every_size_and_format(self):
+        name = save_test_image('products/derivatives-sizes.png', size=(1000, 500))
+        self.assertEqual(generate_derivatives(default_storage, name), 6)
+        self.assertEqual(
+            derivative_name(name, 'card', 'webp'), 'derivatives/products/derivatives-sizes.png.card.webp'
+        )
+        for size, width in DERIVATIVE_SIZES.items():
+            for fmt in ('webp', 'jpeg'):
+                with default_storage.open(derivative_name(name, size, fmt)) as derivative:
+                    # Never scaled up past the original
+                    self.assertEqual(Image.open(derivative).size[0], min(width, 1000), (size, fmt))
+
+        self.assertEqual(generate_derivatives(default_storage, name), 0)
+        self.assertEqual(generate_derivatives(default_storage, name, force=True), 6)
+
+    def test_field_file_urls_fall_back_to_the_original(self):
+        name = save_test_image('products/derivatives-urls.jpg')
+        image = Product(image=name).image
+        self.assertEqual(image.thumbnail_url, image.url)
+        self.assertEqual(image.srcset, '')
+
+        generate_derivatives(default_storage, name)
+        self.assertEqual(image.card_url, default_storage.url(derivative_name(name, 'card', 'jpeg')))
+        self.assertEqual(image.srcset.count('.webp '), len(DERIVATIVE_SIZES))
+        self.assertIn(' 160w', image.jpeg_srcset)
+
+    def test_management_command_covers_product_images(self):
+        category = Category.objects.create(name='Mousepads')
+        name = save_test_image('products/derivatives-command.jpg')
+        make_product(category, 'XL Mousepad', image=name)
+
+        output = StringIO()
+        call_command('generate_image_derivatives', stdout=output, stderr=StringIO())
+        self.assertIn('Generated derivatives for 1 image(s), 0 failed', output.getvalue())
+        self.assertTrue(default_storage.exists(derivative_name(name, 'zoom', 'webp')))
+
+
+class GalleryTests(TestCase):
+    """Primary image resolution from the stored path or a gallery prefetch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Laptops')
+        cls.laptops = [
+            make_product(category, f'Laptop {n}', image=f'products/laptop-{n}.jpg') for n in range(3)
+        ]
+        for laptop in cls.laptops:
+            for order in range(2):
+                ProductImage.objects.create(
+                    product=laptop, image=f'products/gallery/{laptop.slug}-{order}.jpg', order=order
+                )
+
+    def stored_path(self, product):
+        return Product.objects.get(pk=product.pk).primary_image_path
+
+    def test_primary_image_path_follows_the_gallery(self):
+        laptop = self.laptops[0]
+        self.assertEqual(self.stored_path(laptop), 'products/laptop-0.jpg')
+
+        first, second = laptop.images.order_by('order')
+        first.is_primary = True
+        first.save()
+        self.assertEqual(self.stored_path(laptop), first.image.name)
+
+        second.is_primary = True
+        second.save()
+        self.assertEqual(self.stored_path(laptop), second.image.name)
+        self.assertEqual(laptop.images.filter(is_primary=True).count(), 1)
+
+        second.delete()
+        self.assertEqual(self.stored_path(laptop), 'products/laptop-0.jpg')
+
+    def test_stored_path_needs_no_queries(self):
+        primary = self.laptops[1].images.first()
+        primary.is_primary = True
+        primary.save()
+        laptop = Product.objects.get(pk=self.laptops[1].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(laptop.get_primary_image(), primary.image.url)
+
+    def test_with_gallery_loads_every_gallery_in_one_query(self):
+        with self.assertNumQueries(2):
+            products = list(Product.objects.filter(category__name='Laptops').with_gallery())
+            images = {product.pk: product.get_all_images() for product in products}
+        for laptop in self.laptops:
+            urls = [image['url'] for image in images[laptop.pk]]
+            self.assertEqual(urls[0], laptop.image.url)
+            self.assertEqual(len(urls), 3)
+
+
+class BoughtTogetherTests(TestCase):
+    """Co-purchase neighbours counted from order items"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Peripherals')
+        cls.mouse, cls.pad, cls.keyboard, cls.cable = (
+            make_product(category, name) for name in ('Mouse', 'Mouse Pad', 'Keyboard', 'USB Cable')
+        )
+        user = User.objects.create_user('buyer@example.com', None, first_name='Juan', last_name='Dela Cruz')
+        baskets = [
+            ('delivered', [cls.mouse, cls.pad]),
+            ('pending', [cls.mouse, cls.pad, cls.keyboard]),
+            ('shipped', [cls.mouse, cls.keyboard]),
+            ('cancelled', [cls.pad, cls.keyboard, cls.cable]),
+        ]
+        for status, products in baskets:
+            order = Order.objects.create(
+                user=user, status=status, full_name='Juan Dela Cruz', email=user.email, phone='09170000000',
+                address='1 Rizal St', city='Malolos', state='Bulacan', zip_code='3000', subtotal=0, total=0,
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+    def test_neighbours_ranked_by_cosine_similarity(self):
+        self.assertEqual(build_bought_together(), 6)
+        self.assertEqual(list(recommended_for(self.mouse)), [self.pad, self.keyboard])
+        self.assertEqual(list(recommended_for(self.pad)), [self.mouse, self.keyboard])
+        # Cancelled orders count for nothing
+        self.assertEqual(list(recommended_for(self.cable)), [])
+
+        scores = dict(self.pad.recommendations.values_list('recommended_id', 'score'))
+        self.assertAlmostEqual(scores[self.mouse.pk], 2 / 6 ** 0.5)
+        self.assertAlmostEqual(scores[self.keyboard.pk], 0.5)
+
+    def test_top_k_and_rebuild(self):
+        build_bought_together(top_k=1)
+        self.assertEqual(list(recommended_for(self.keyboard)), [self.mouse])
+        build_bought_together()
+        self.assertEqual(list(recommended_for(self.keyboard)), [self.mouse, self.pad])
+
+    def test_related_products_and_cart_suggestions(self):
+        build_bought_together()
+        build_similar()
+        related = related_products_for(self.keyboard)
+        self.assertEqual(related[:2], [self.mouse, self.pad])
+        self.assertNotIn(self.keyboard, related)
+        self.assertEqual(list(recommended_for_many([self.mouse.pk, self.pad.pk])), [self.keyboard])
+
+
+class ApplyDealTests(TestCase):
+    """Deal.apply_to_products writes the discount with one UPDATE"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Speakers')
+        cls.soundbar = make_product(category, 'Soundbar', price=Decimal('2500.55'))
+        cls.speakers = make_product(category, 'Desk Speakers', price=Decimal('1000.00'))
+        cls.deal = make_deal([cls.soundbar, cls.speakers], '15.00')
+
+    def prices(self):
+        return dict(Product.objects.values_list('id', 'price'))
+
+    def test_dry_run_writes_nothing(self):
+        preview = self.deal.apply_to_products(dry_run=True)
+        self.assertEqual(
+            [(p.name, p.new_price) for p in preview],
+            [('Desk Speakers', Decimal('850.00')), ('Soundbar', Decimal('2125.47'))],
+        )
+        self.assertEqual(self.prices(), {self.soundbar.pk: Decimal('2500.55'), self.speakers.pk: Decimal('1000.00')})
+
+    def test_apply_updates_every_product_and_signals_once(self):
+        sent = []
+
+        def receiver(sender, deal, product_ids, **kwargs):
+            sent.append(sorted(product_ids))
+
+        deal_applied.connect(receiver)
+        self.addCleanup(deal_applied.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.deal.apply_to_products(), 2)
+
+        self.assertEqual(sent, [sorted([self.soundbar.pk, self.speakers.pk])])
+        soundbar = Product.objects.get(pk=self.soundbar.pk)
+        self.assertEqual((soundbar.price, soundbar.old_price, soundbar.on_sale), (Decimal('2125.47'), Decimal('2500.55'), True))
+
+    def test_fixed_amount_deal_changes_nothing(self):
+        self.deal.discount_percentage = None
+        self.deal.discount_amount = Decimal('100.00')
+        self.assertFalse(self.deal.apply_to_products(dry_run=True).exists())
+        self.assertEqual(self.deal.apply_to_products(), 0)
+        self.assertEqual(self.prices()[self.speakers.pk], Decimal('1000.00'))
+
+
+class DealSchedulerTests(TestCase):
+    """Deal statuses flip when their dates pass, not when a page is viewed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Chairs')
+        cls.chair = make_product(cls.category, 'Gaming Chair', price=Decimal('8000.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def make_deal(self, start, end, status='scheduled'):
+        deal = Deal.objects.create(
+            title='Chair sale', discount_percentage=Decimal('10.00'), status=status, start_date=start, end_date=end
+        )
+        deal.products.add(self.chair)
+        return deal
+
+    def move(self, deal, **dates):
+        # A queryset update, as when the dates simply pass
+        Deal.objects.filter(pk=deal.pk).update(**dates)
+
+    def status(self, deal):
+        return Deal.objects.get(pk=deal.pk).status
+
+    def test_sync_fixes_only_overdue_deals(self):
+        now = timezone.now()
+        starting = self.make_deal(now + timedelta(hours=1), now + timedelta(days=1))
+        ending = self.make_deal(now - timedelta(days=1), now + timedelta(days=1), status='active')
+        running = self.make_deal(now - timedelta(days=1), now + timedelta(days=1), status='active')
+        draft = self.make_deal(now - timedelta(days=1), now - timedelta(hours=1), status='draft')
+        self.move(starting, start_date=now - timedelta(minutes=1))
+        self.move(ending, end_date=now - timedelta(minutes=1))
+
+        changed = sync_deal_statuses()
+        self.assertEqual(sorted(deal.pk for deal in changed), sorted([starting.pk, ending.pk]))
+        self.assertEqual(
+            [self.status(deal) for deal in (starting, ending, running, draft)], ['active', 'expired', 'active', 'draft']
+        )
+        self.assertEqual(sync_deal_statuses(), [])
+
+    def test_scheduler_waits_for_the_next_boundary(self):
+        now = timezone.now()
+        deal = self.make_deal(now + timedelta(seconds=30), now + timedelta(hours=2))
+        scheduler = DealScheduler()
+        self.assertEqual(scheduler.tick(now), [])
+        self.assertEqual(scheduler.next_boundary(), deal.start_date)
+        self.assertEqual(scheduler.seconds_until_next(now), POLL_INTERVAL)
+        self.assertEqual(scheduler.seconds_until_next(deal.start_date - timedelta(seconds=2)), 2)
+
+        # Nothing is due yet, so no queries
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.tick(now + timedelta(seconds=10)), [])
+
+        self.move(deal, start_date=now - timedelta(seconds=1))
+        changed = scheduler.tick(now + timedelta(seconds=31))
+        self.assertEqual([changed_deal.pk for changed_deal in changed], [deal.pk])
+        self.assertEqual(self.status(deal), 'active')
+
+    def test_saving_a_deal_reloads_the_scheduler(self):
+        now = timezone.now()
+        scheduler = DealScheduler()
+        scheduler.tick(now)
+        self.assertIsNone(scheduler.next_boundary())
+
+        deal = self.make_deal(now + timedelta(minutes=5), now + timedelta(hours=1))
+        scheduler.tick(now)
+        self.assertEqual(scheduler.next_boundary(), deal.start_date)
+
+
+class DealsPageTests(TestCase):
+    """The deals page reads each deal's products from one cached map"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Motherboards')
+        cls.b650 = make_product(category, 'B650 Board', price=Decimal('9000.00'))
+        cls.x670 = make_product(category, 'X670 Board', price=Decimal('18000.00'))
+        cls.b760 = make_product(category, 'B760 Board', price=Decimal('8000.00'), old_price=Decimal('9000.00'), on_sale=True)
+        cls.hidden = make_product(category, 'Hidden Board', price=Decimal('5000.00'), is_active=False)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.small = make_deal([cls.b650, cls.x670, cls.hidden], '10.00')
+            cls.big = make_deal([cls.x670], '30.00')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_products_per_deal_are_cached(self):
+        # Inactive products are left out; the biggest current discount comes first
+        expected = {self.small.pk: [self.x670.pk, self.b650.pk], self.big.pk: [self.x670.pk]}
+        self.assertEqual(deal_product_ids(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(deal_product_ids(), expected)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.big.products.add(self.b650)
+        # Both at 30% now, so by name
+        self.assertEqual(deal_product_ids()[self.big.pk], [self.b650.pk, self.x670.pk])
+
+    def test_deals_page(self):
+        response = self.client.get(reverse('products:deals'), {'sort': 'discount'})
+        deals = {deal.pk: [product.pk for product in deal.deal_products] for deal in response.context['active_deals']}
+        self.assertEqual(deals, {self.small.pk: [self.x670.pk, self.b650.pk], self.big.pk: [self.x670.pk]})
+        # Deal products and old_price markdowns, biggest saving first: 30%, 11%, 10%
+        self.assertEqual(
+            [product.pk for product in response.context['deal_products']], [self.x670.pk, self.b760.pk, self.b650.pk]
+        )
+
+    def test_stored_discount_matches_python_rounding(self):
+        # Whole-number prices are integers in SQLite; 400 / 3200 is 12.5%
+        board = make_product(self.b650.category, 'Z790 Board', price=2800, old_price=3200)
+        self.assertEqual(Product.objects.get(pk=board.pk).discount_pct, 13)
+        Product.objects.filter(pk=board.pk).refresh_pricing()
+        self.assertEqual(Product.objects.get(pk=board.pk).discount_pct, 13)
+
+
+CATALOG_CSV = """sku,name,category,description,price,old_price,stock,is_active,is_featured,is_new,on_sale,image
+PSU-650,650W Bronze PSU,Power Supplies,80 Plus Bronze,2800,3200,12,true,false,true,true,psu.jpg
+PSU-850,850W Gold PSU,Power Supplies,80 Plus Gold,5200,,4,,yes,,,
+,Nameless Row,Power Supplies,,100,,,,,,,
+UPS-1K,1000VA UPS,Backup Power,Line interactive,4500,,0,false,,,,
+"""
+
+
+class CatalogImportTests(TemporaryMediaMixin, TestCase):
+    """Batched upserts by SKU and a streamed export"""
+
+    def import_csv(self, text, **options):
+        return import_catalog(StringIO(text), 'csv', **options)
+
+    def test_import_creates_products_and_categories(self):
+        stats = self.import_csv(CATALOG_CSV, batch_size=2)
+        self.assertEqual(
+            stats, {'rows': 3, 'created': 3, 'updated': 0, 'skipped': 1, 'categories': 2, 'images': 0}
+        )
+        psu = Product.objects.get(sku='PSU-650')
+        self.assertEqual((psu.slug, psu.category.name, psu.price), ('650w-bronze-psu', 'Power Supplies', Decimal('2800')))
+        self.assertEqual((psu.effective_price, psu.discount_pct), (Decimal('2800.00'), 13))
+        self.assertTrue(psu.on_sale and psu.is_new and not psu.is_featured)
+        self.assertFalse(Product.objects.get(sku='UPS-1K').is_active)
+        # The search index is rebuilt once at the end
+        self.assertIn(psu.pk, SQLiteFTSSearchBackend().search('bronze'))
+
+    def test_reimport_updates_by_sku_and_keeps_the_slug(self):
+        self.import_csv(CATALOG_CSV)
+        slug = Product.objects.get(sku='PSU-850').slug
+        stats = self.import_csv(
+            'sku,name,category,price,stock\n'
+            'PSU-850,850W Gold PSU v2,Power Supplies,4999,9\n'
+            'PSU-850,850W Gold PSU v3,Power Supplies,4899,7\n'
+        )
+        self.assertEqual((stats['created'], stats['updated']), (0, 1))
+        psu = Product.objects.get(sku='PSU-850')
+        # The last row wins when a SKU repeats
+        self.assertEqual((psu.name, psu.price, psu.stock, psu.slug), ('850W Gold PSU v3', Decimal('4899'), 7, slug))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_bad_row_keeps_earlier_batches(self):
+        text = 'sku,name,price\nA-1,First,100\nB-2,Second,abc\n'
+        with self.assertRaisesMessage(CatalogImportError, 'SKU B-2'):
+            self.import_csv(text, batch_size=1)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['A-1'])
+
+    def test_images_are_copied_from_the_image_dir(self):
+        image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_dir, ignore_errors=True)
+        Image.new('RGB', (300, 300), 'black').save(f'{image_dir}/psu.jpg')
+
+        stats = self.import_csv(CATALOG_CSV, image_dir=image_dir)
+        self.assertEqual(stats['images'], 1)
+        psu = Product.objects.get(sku='PSU-650')
+        self.assertTrue(default_storage.exists(psu.image.name))
+        self.assertEqual(psu.primary_image_path, psu.image.name)
+        self.assertTrue(psu.image.has_derivatives)
+
+    def test_export_round_trips(self):
+        self.import_csv(CATALOG_CSV)
+        before = list(Product.objects.order_by('sku').values_list('sku', 'name', 'category__name', 'price', 'is_active'))
+        for fmt in ('csv', 'jsonl'):
+            exported = ''.join(export_catalog(fmt))
+            rows = list(read_rows(StringIO(exported), fmt))
+            self.assertEqual([row['sku'] for row in rows], ['PSU-650', 'PSU-850', 'UPS-1K'], fmt)
+
+            Product.objects.all().delete()
+            import_catalog(StringIO(exported), fmt)
+            after = Product.objects.order_by('sku').values_list('sku', 'name', 'category__name', 'price', 'is_active')
+            self.assertEqual(list(after), before, fmt)
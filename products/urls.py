@@ -11,6 +11,8 @@ urlpatterns = [
     path('product/<slug:slug>/', views.product_detail_view, name='detail'),
     path('category/<slug:slug>/', views.category_view, name='category'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/products/', views.product_list_api, name='product_list_api'),
     path('api/search-suggestions/', views.search_suggestions, name='search_suggestions'),
     path('api/product/<int:product_id>/', views.product_detail_api, name='product_detail_api'),
+    path('api/product/<int:product_id>/reviews/', views.product_reviews_api, name='product_reviews_api'),
 ]
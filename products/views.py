@@ -3,21 +3,35 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.core.paginator import Paginator
 from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from .models import Product, Category, Slide, Deal
+from .autocomplete import autocomplete_index
+from .conditional import catalog_etag, product_etag, product_last_modified
+from .facets import catalog_facets, compute_facets
+from .page_cache import cache_shared_page
+from .pagination import KEYSET_ORDERINGS, InvalidCursor, paginate_keyset
+from .pricing import deal_product_ids
+from .recommendations import related_products_for
+from .reviews import review_page
+from .search import MAX_RESULTS, get_search_backend, rank_by_hits
 from dashboard.models import SlideshowImage
-from orders.models import Order, OrderItem, DeliveryFee
+from orders.delivery import delivery_fee_index
+from orders.models import Order, OrderItem
 import re
 
 
+@condition(etag_func=catalog_etag)
+@cache_shared_page
 def home_view(request):
     """Homepage with all products and carousel - accessible to everyone"""
     # Get main slideshow images and static banners
     main_slides = SlideshowImage.objects.filter(is_active=True, slide_type='main').order_by('order')
     banner_slides = SlideshowImage.objects.filter(is_active=True, slide_type='banner').order_by('order')[:2]
     
-    all_products = Product.objects.filter(is_active=True)
+    all_products = Product.objects.filter(is_active=True).select_related('category').with_pricing()
     categories = Category.objects.filter(is_active=True)[:6]
     context = {
         'main_slides': main_slides,
@@ -28,31 +42,31 @@ def home_view(request):
     return render(request, 'products/home.html', context)
 
 
+@condition(etag_func=catalog_etag)
+@cache_shared_page
 def deals_view(request):
     """Deals page with featured deals and discounted products - accessible to everyone"""
     # Get main slideshow images only (no banners)
     main_slides = SlideshowImage.objects.filter(is_active=True, slide_type='main').order_by('order')
     
-    # Get active deals
+    # Get active deals and their products (product ids per deal are cached)
     now = timezone.now()
-    active_deals = Deal.objects.filter(
-        status='active',
-        start_date__lte=now,
-        end_date__gte=now
-    ).select_related().prefetch_related('products')
-    
-    # Get all products from active deals
-    deal_product_ids = []
+    active_deals = list(Deal.objects.active())
+    products_by_deal = deal_product_ids()
+    deal_product_set = {product_id for product_ids in products_by_deal.values() for product_id in product_ids}
+    products = Product.objects.filter(pk__in=deal_product_set).select_related('category').with_pricing(now).in_bulk()
     for deal in active_deals:
-        deal_product_ids.extend(deal.products.values_list('id', flat=True))
+        deal.deal_products = [
+            products[product_id] for product_id in products_by_deal.get(deal.pk, ()) if product_id in products
+        ]
     
     # Get products on sale or in active deals
-    deal_products = Product.objects.filter(
-        Q(is_active=True) & (Q(on_sale=True) | Q(id__in=deal_product_ids))
-    ).distinct()
+    deal_products = Product.objects.with_current_pricing(now).filter(
+        Q(is_active=True) & (Q(on_sale=True) | Q(current_discount_pct__gt=0))
+    ).select_related('category').with_pricing(now)
     
     # Get featured deals (products)
-    featured_deals = Product.objects.filter(is_active=True, is_featured=True)[:8]
+    featured_deals = Product.objects.filter(is_active=True, is_featured=True).with_pricing(now)[:8]
     
     # Get categories for filtering
     categories = Category.objects.filter(is_active=True)
@@ -65,11 +79,11 @@ def deals_view(request):
     # Sort options
     sort_by = request.GET.get('sort', 'newest')
     if sort_by == 'price_low':
-        deal_products = deal_products.order_by('price')
+        deal_products = deal_products.order_by('current_price')
     elif sort_by == 'price_high':
-        deal_products = deal_products.order_by('-price')
+        deal_products = deal_products.order_by('-current_price')
     elif sort_by == 'discount':
-        deal_products = deal_products.order_by('-discount_percentage')
+        deal_products = deal_products.order_by('-current_discount_pct', '-created_at')
     else:
         deal_products = deal_products.order_by('-created_at')
     
@@ -267,30 +281,8 @@ def parse_and_respond(message, user):
     
     # SHIPPING QUERY - Calculate shipping fees
     elif any(keyword in message for keyword in ['shipping', 'delivery', 'ship', 'deliver', 'paano', 'magkano', 'fee', 'cost', 'tagal']):
-        # Extract city and state from message
-        delivery_fees = DeliveryFee.objects.filter(is_available=True)
-        matched_location = None
-        best_match_score = 0
-        
-        # Try to match city and state combinations
-        for fee in delivery_fees:
-            score = 0
-            city_lower = fee.city.lower()
-            state_lower = fee.state.lower()
-            
-            # Check if both city and state are in message (best match)
-            if city_lower in message and state_lower in message:
-                score = 3
-            # Check if city is in message
-            elif city_lower in message:
-                score = 2
-            # Check if state is in message
-            elif state_lower in message:
-                score = 1
-            
-            if score > best_match_score:
-                best_match_score = score
-                matched_location = fee
+        # Find the city (or alias) and province mentioned in the message
+        matched_location = delivery_fee_index.find(message)
         
         if matched_location:
             return {
@@ -308,8 +300,8 @@ def parse_and_respond(message, user):
             }
         else:
             # Show general shipping info
-            sample_fees = delivery_fees[:5]
-            if sample_fees.exists():
+            sample_fees = delivery_fee_index.all()[:5]
+            if sample_fees:
                 fees_list = '\n'.join([f"• **{fee.city}, {fee.state}:** ₱{fee.fee_amount:,.2f} ({fee.estimated_days})" for fee in sample_fees])
                 return {
                     'response': f'🚚 **Our Shipping Rates:**\n\n{fees_list}\n\n'
@@ -404,25 +396,21 @@ def parse_and_respond(message, user):
         }
 
 
-def product_list_view(request):
-    """Display all products with filtering and pagination - accessible to everyone"""
-    products = Product.objects.filter(is_active=True)
-    categories = Category.objects.filter(is_active=True)
+def _filter_product_list(request):
+    """Apply the product list filters and resolve the keyset ordering.
     
-    # Filter by category (support multiple categories)
-    category_filter = request.GET.getlist('category')
-    selected_categories = []
-    if category_filter:
-        products = products.filter(category__id__in=category_filter)
-        selected_categories = list(map(int, category_filter))
+    Shared by product_list_view and product_list_api so both pages of the
+    listing see the same products in the same order.
+    """
+    products = Product.objects.filter(is_active=True).with_current_pricing()
     
     # Price range filter
     price_min = request.GET.get('price_min')
     price_max = request.GET.get('price_max')
     if price_min:
-        products = products.filter(price__gte=float(price_min))
+        products = products.filter(current_price__gte=float(price_min))
     if price_max:
-        products = products.filter(price__lte=float(price_max))
+        products = products.filter(current_price__lte=float(price_max))
     
     # In stock filter
     in_stock = request.GET.get('in_stock')
@@ -436,54 +424,132 @@ def product_list_view(request):
     
     # Search functionality
     search_query = request.GET.get('search') or request.GET.get('q')
+    search_capped = False
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+        hits = get_search_backend().search(search_query, limit=MAX_RESULTS)
+        # Only the best MAX_RESULTS matches are listed; the page says so
+        search_capped = len(hits) >= MAX_RESULTS
+        products = rank_by_hits(products, hits)
+    
+    # Facet counts use every filter except the category one
+    facet_products = products
+    is_filtered = bool(price_min or price_max or in_stock == '1' or on_sale == '1' or search_query)
     
-    # Sorting
+    # Filter by category (support multiple categories)
+    category_filter = request.GET.getlist('category')
+    selected_categories = []
+    if category_filter:
+        products = products.filter(category__id__in=category_filter)
+        selected_categories = list(map(int, category_filter))
+    
+    products = products.select_related('category').with_pricing()
+    
+    # Sorting - the default while searching is most relevant first
     sort_by = request.GET.get('sort', 'default')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name_asc':
-        products = products.order_by('name')
-    elif sort_by == 'name_desc':
-        products = products.order_by('-name')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:  # default
-        products = products.order_by('-is_featured', '-created_at')
-    
-    # No pagination - show all filtered products
-    total_products = products.count()
+    if sort_by not in KEYSET_ORDERINGS or sort_by == 'relevance':
+        sort_by = 'default'
+    ordering = KEYSET_ORDERINGS['relevance' if sort_by == 'default' and search_query else sort_by]
     
-    context = {
+    return {
         'products': products,
-        'all_products': products,  # For JavaScript filtering
-        'categories': categories,
+        'facet_products': facet_products if is_filtered else None,
+        'ordering': ordering,
         'search_query': search_query,
+        'search_capped': search_capped,
+        'max_search_results': MAX_RESULTS,
         'sort_by': sort_by,
-        'total_products': total_products,
         'selected_categories': selected_categories,
         'price_min': price_min or '',
         'price_max': price_max or '',
         'in_stock': in_stock,
         'on_sale': on_sale,
     }
+
+
+@condition(etag_func=catalog_etag)
+@cache_shared_page
+def product_list_view(request):
+    """Display all products with filtering and pagination - accessible to everyone"""
+    listing = _filter_product_list(request)
+    products = listing.pop('products')
+    facet_products = listing.pop('facet_products')
+    
+    # First page only; the rest is loaded from product_list_api on scroll
+    total_products = products.count()
+    first_page, next_cursor = paginate_keyset(products, listing.pop('ordering'))
+    
+    # Sidebar counts - cached for the plain catalog, one grouped query otherwise
+    if facet_products is None:
+        facets = catalog_facets(listing['selected_categories'])
+    else:
+        facets = compute_facets(facet_products, listing['selected_categories'])
+    categories = list(Category.objects.filter(is_active=True))
+    for category in categories:
+        category.product_count = facets['categories'].get(category.id, 0)
+    
+    context = {
+        'products': first_page,
+        'next_cursor': next_cursor,
+        'categories': categories,
+        'facets': facets,
+        'total_products': total_products,
+        **listing,
+    }
     return render(request, 'products/product_list.html', context)
 
 
+def product_list_api(request):
+    """JSON product listing with cursor pagination - accessible to everyone
+    
+    Accepts the same filters and sort options as product_list_view plus a
+    ``cursor`` from the previous page. Each page returns product data, the
+    rendered product cards and the cursor for the next page (null at the end).
+    """
+    listing = _filter_product_list(request)
+    try:
+        products, next_cursor = paginate_keyset(
+            listing['products'], listing['ordering'], cursor=request.GET.get('cursor')
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'products': [
+            {
+                'id': product.id,
+                'name': product.name,
+                'slug': product.slug,
+                'category': product.category.name,
+                'image': product.image.url if product.image else None,
+                'price': float(product.price),
+                'final_price': product.final_price,
+                'original_price': product.original_price,
+                'savings_percentage': product.savings_percentage,
+                'has_active_deal': product.has_active_deal,
+                'stock': product.stock,
+                'rating': float(product.rating),
+                'reviews_count': product.reviews_count,
+            }
+            for product in products
+        ],
+        'html': render_to_string('products/_product_card.html', {'products': products}, request=request),
+        'next_cursor': next_cursor,
+    })
+
+
+@condition(etag_func=catalog_etag)
+@cache_shared_page
 def product_detail_view(request, slug):
     """Display single product details - accessible to everyone"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    product = get_object_or_404(Product.objects.with_pricing(), slug=slug, is_active=True)
+    
+    # Frequently bought together, then similar products; same category as a last resort
+    related_products = related_products_for(product)
+    if not related_products:
+        related_products = Product.objects.filter(
+            category=product.category,
+            is_active=True
+        ).exclude(id=product.id).with_pricing()[:4]
     
     context = {
         'product': product,
@@ -492,10 +558,11 @@ def product_detail_view(request, slug):
     return render(request, 'products/product_detail.html', context)
 
 
+@condition(etag_func=catalog_etag)
 def category_view(request, slug):
     """Display products by category - accessible to everyone"""
     category = get_object_or_404(Category, slug=slug, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True)
+    products = Product.objects.filter(category=category, is_active=True).with_pricing()
     
     # Pagination
     paginator = Paginator(products, 12)
@@ -516,46 +583,26 @@ def search_suggestions(request):
     if len(query) < 1:
         return JsonResponse([], safe=False)
     
-    # Search products by name
-    products = Product.objects.filter(
-        Q(name__icontains=query) | Q(description__icontains=query),
-        is_active=True
-    ).values('name')[:10]
-    
-    # Extract unique product names
-    suggestions = [product['name'] for product in products]
+    # Prefix lookup in the in-memory index - no database query per keystroke.
+    # Each suggestion carries id, slug, url, image and prices for the dropdown.
+    suggestions = autocomplete_index.suggest(query, limit=10)
     
     return JsonResponse(suggestions, safe=False)
 
 
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail_api(request, product_id):
     """API endpoint for product details (for modal) - accessible to everyone"""
     try:
-        product = get_object_or_404(Product, id=product_id, is_active=True)
+        product = get_object_or_404(
+            Product.objects.select_related('category').with_pricing().with_gallery(), id=product_id, is_active=True
+        )
         
-        # Get reviews for this product
-        reviews = []
-        for review in product.reviews.all().order_by('-created_at'):
-            reviews.append({
-                'id': review.id,
-                'user_name': review.user.get_full_name(),
-                'rating': review.rating,
-                'comment': review.comment,
-                'created_at': review.created_at.strftime('%B %d, %Y'),
-            })
+        # First page of reviews; the rest comes from product_reviews_api
+        reviews = review_page(product.id)
         
-        # Get all product images
-        images = []
-        if product.image:
-            images.append({
-                'url': product.image.url,
-                'is_primary': True
-            })
-        for img in product.images.all():
-            images.append({
-                'url': img.image.url,
-                'is_primary': img.is_primary
-            })
+        # Get all product images (prefetched by with_gallery)
+        images = product.get_all_images()
         
         # Get deal information
         active_deal = product.active_deal
@@ -574,7 +621,9 @@ def product_detail_api(request, product_id):
             'created_at': product.created_at.isoformat(),
             'rating': float(product.rating),
             'reviews_count': product.reviews_count,
-            'reviews': reviews,
+            'reviews': reviews['reviews'],
+            'reviews_next_cursor': reviews['next_cursor'],
+            'rating_histogram': product.rating_histogram,
             # Deal information
             'has_active_deal': product.has_active_deal,
             'final_price': float(product.final_price) if product.final_price else float(product.price),
@@ -590,3 +639,13 @@ def product_detail_api(request, product_id):
         print("Error in product_detail_api:")
         print(traceback.format_exc())
         return JsonResponse({'error': str(e)}, status=500)
+
+
+def product_reviews_api(request, product_id):
+    """Cursor-paginated reviews for a product - accessible to everyone"""
+    get_object_or_404(Product.objects.only('id'), id=product_id, is_active=True)
+    try:
+        page = review_page(product_id, cursor=request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse(page)
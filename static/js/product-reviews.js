@@ -0,0 +1,52 @@
+// Reviews list in the product modal (home and product list pages)
+
+// Render one review into the modal list
+function appendReview(reviewsList, review) {
+    const reviewItem = document.createElement('div');
+    reviewItem.className = 'review-item';
+
+    const reviewStars = [];
+    for (let i = 1; i <= 5; i++) {
+        if (i <= review.rating) {
+            reviewStars.push('<i class="fas fa-star"></i>');
+        } else {
+            reviewStars.push('<i class="far fa-star"></i>');
+        }
+    }
+
+    reviewItem.innerHTML = `
+        <div class="review-header">
+            <span class="review-user">${review.user_name}</span>
+            <span class="review-date">${review.created_at}</span>
+        </div>
+        <div class="review-rating">
+            ${reviewStars.join('')}
+        </div>
+        ${review.comment ? `<div class="review-comment">${review.comment}</div>` : ''}
+    `;
+    reviewsList.appendChild(reviewItem);
+}
+
+// Fetch the next page of reviews from the reviews endpoint
+function addLoadMoreReviews(reviewsList, productId, cursor) {
+    const button = document.createElement('button');
+    button.className = 'btn btn-outline btn-sm load-more-reviews';
+    button.textContent = 'Show more reviews';
+    button.addEventListener('click', function() {
+        button.disabled = true;
+        fetch(`/api/product/${productId}/reviews/?cursor=${encodeURIComponent(cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                button.remove();
+                data.reviews.forEach(review => appendReview(reviewsList, review));
+                if (data.next_cursor) {
+                    addLoadMoreReviews(reviewsList, productId, data.next_cursor);
+                }
+            })
+            .catch(error => {
+                console.error('Error loading reviews:', error);
+                button.disabled = false;
+            });
+    });
+    reviewsList.appendChild(button);
+}